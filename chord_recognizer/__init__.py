@@ -1 +1,4 @@
-from .main import recognize_chords
+from .jit import configure_cache, warmup
+from .main import SequenceIndex, recognize_chords, recognize_chords_batch
+from .session import RecognitionSession
+from .timeline import ChordTimeline
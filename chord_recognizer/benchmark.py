@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+
+from .decode import decode_chords, coarse_to_fine_dp, downbeat_and_score_weight, prefix_sum
+from .feature import extract_chord_features
+from .main import load_sequence, recognize_chords
+from .util import Sequence
+from .util.midiToolkit import MidiFile
+
+
+def frame_labels(chords: pd.DataFrame, n_frame: int) -> np.ndarray:
+    """
+    将 decode_chords() 的结果展开为每一拍的和弦名，未被覆盖的拍记为 N
+
+    :param chords: decode_chords() 返回的 DataFrame，时间单位为 1拍
+    :param n_frame: 总拍数
+    :return: shape 为 [n_frame] 的和弦名数组
+    """
+    labels = np.full(n_frame, "N", dtype=object)
+    for start, end, name in zip(chords['start'], chords['end'], chords['name']):
+        labels[start: end + 1] = name
+    return labels
+
+
+def _best_time(func, repeat: int) -> float:
+    best = np.inf
+    for _ in range(repeat):
+        tic = perf_counter()
+        func()
+        best = min(best, perf_counter() - tic)
+    return best
+
+
+def verify_precision(
+        files: Iterable[Union[str, MidiFile, Sequence]],
+        precisions: Iterable[str] = ("float32", "int16"),
+        note_precision: float = 0.25,
+        repeat: int = 5) -> pd.DataFrame:
+    """
+    对比低精度的打分与动态规划（见 decode_chords 的 precision 参数）与默认的 float64 实现
+
+    * 每首曲目只提取一次特征，计时只包含 decode_chords，取 repeat 次中的最短时间
+    * 计时前会先运行一次，排除 numba 编译的时间
+
+    :param files: 文件路径，或者已经实例化的 MidiFile, Sequence 类
+    :param precisions: 需要对比的精度
+    :param note_precision: 见 recognize_chords
+    :param repeat: 计时的重复次数
+    :return: 每首曲目、每种精度一行，包含与 float64 结果不同的拍所占的比例 diff_rate、
+        解码耗时 seconds、每秒解码的拍数 beats_per_sec 以及相对 float64 的加速比 speedup
+    """
+    rows = []
+    for i, file in enumerate(files):
+        s = load_sequence(file)
+        chroma, bass = extract_chord_features(s.track, note_precision)
+        n_frame = len(chroma)
+
+        def run(precision):
+            return decode_chords(chroma, bass, s.timeSignature, precision=precision)
+
+        reference = frame_labels(run("float64"), n_frame)
+        reference_time = _best_time(lambda: run("float64"), repeat)
+        rows.append([i, "float64", n_frame, 0., reference_time, n_frame / reference_time, 1.])
+        for precision in precisions:
+            labels = frame_labels(run(precision), n_frame)
+            seconds = _best_time(lambda: run(precision), repeat)
+            rows.append([
+                i, precision, n_frame, float(np.mean(labels != reference)),
+                seconds, n_frame / seconds, reference_time / seconds
+            ])
+    return pd.DataFrame(
+        rows, columns=['file', 'precision', 'n_beat', 'diff_rate', 'seconds', 'beats_per_sec', 'speedup'])
+
+
+def verify_coarse_to_fine(
+        files: Iterable[Union[str, MidiFile, Sequence]],
+        levels: Iterable[str] = ("bar", "half_bar"),
+        refine_radius: int = 2,
+        note_precision: float = 0.25,
+        tile: int = 1,
+        repeat: int = 5) -> pd.DataFrame:
+    """
+    对比由粗到细的解码（见 decode_chords 的 coarse 参数）与逐拍的完整解码
+
+    * 每首曲目只提取一次特征，计时只包含 decode_chords，取 repeat 次中的最短时间
+    * tile > 1 时将特征首尾重复 tile 次，用于模拟长曲目，拍号沿用原曲目（最后一个拍号延续到结尾）
+
+    :param files: 文件路径，或者已经实例化的 MidiFile, Sequence 类
+    :param levels: 需要对比的粗解码粒度，见 decode.coarse_grid
+    :param refine_radius: 见 decode_chords
+    :param note_precision: 见 recognize_chords
+    :param tile: 特征重复的次数
+    :param repeat: 计时的重复次数
+    :return: 每首曲目、每种粒度一行，包含与完整解码结果不同的拍所占的比例 diff_rate、和弦变化位置的召回率 boundary_recall、
+        打分的区间数占完整解码的比例 span_ratio、解码耗时 seconds、每秒解码的拍数 beats_per_sec 以及加速比 speedup
+    """
+    rows = []
+    for i, file in enumerate(files):
+        s = load_sequence(file)
+        chroma, bass = extract_chord_features(s.track, note_precision)
+        chroma, bass = np.tile(chroma, (tile, 1)), np.tile(bass, (tile, 1))
+        n_frame = len(chroma)
+        downbeat, weight = downbeat_and_score_weight(n_frame, s.timeSignature)
+        prefix_chroma, prefix_bass = prefix_sum(chroma), prefix_sum(bass)
+
+        def run(level):
+            return decode_chords(chroma, bass, s.timeSignature, coarse=level, refine_radius=refine_radius)
+
+        reference = run(None)
+        reference_labels = frame_labels(reference, n_frame)
+        reference_bounds = set(reference['start'].tolist()[1:])
+        _, _, n_span = coarse_to_fine_dp(prefix_chroma, prefix_bass, downbeat, weight, level="bar", radius=n_frame)
+        reference_time = _best_time(lambda: run(None), repeat)
+        rows.append([i, "beat", n_frame, 0., 1., 1., reference_time, n_frame / reference_time, 1.])
+        for level in levels:
+            chords = run(level)
+            bounds = set(chords['start'].tolist()[1:])
+            _, _, n_scored = coarse_to_fine_dp(
+                prefix_chroma, prefix_bass, downbeat, weight, level=level, radius=refine_radius)
+            seconds = _best_time(lambda: run(level), repeat)
+            rows.append([
+                i, level, n_frame, float(np.mean(frame_labels(chords, n_frame) != reference_labels)),
+                len(bounds & reference_bounds) / max(len(reference_bounds), 1), n_scored / max(n_span, 1),
+                seconds, n_frame / seconds, reference_time / seconds
+            ])
+    return pd.DataFrame(rows, columns=[
+        'file', 'level', 'n_beat', 'diff_rate', 'boundary_recall', 'span_ratio', 'seconds', 'beats_per_sec', 'speedup'])
+
+
+def stress_threads(
+        files: Iterable[Union[str, MidiFile, Sequence]],
+        thread_counts: Iterable[int] = (1, 2, 4, 8),
+        repeat: int = 4,
+        **kwargs) -> pd.DataFrame:
+    """
+    多线程压力测试：多个线程同时对同一批曲目调用 recognize_chords，检查结果与单线程时相同，并统计吞吐量
+
+    * 每个线程数下共提交 len(files) * repeat 个任务，同一首曲目会被多个线程同时识别
+    * 计时前先单线程运行一次，排除 numba 编译的时间，该次运行的结果作为检查一致性的参考
+    * speedup 相对 1个线程的吞吐量计算，thread_counts 中不包含 1 时也会额外计时一次 1个线程作为基准（不输出该行）
+    * 只有 numba kernel 释放 GIL，加速比的上限由解析与构建 DataFrame 等持有 GIL 的部分所占的比例决定
+
+    :param files: 文件路径，或者已经实例化的 MidiFile, Sequence 类
+    :param thread_counts: 需要测试的线程数
+    :param repeat: 每首曲目重复的次数
+    :param kwargs: 传递给 recognize_chords 的参数
+    :return: 每种线程数一行，包含结果是否全部与单线程一致 consistent、耗时 seconds、每秒识别的曲目数 files_per_sec、
+        相对 1个线程的加速比 speedup 以及并行效率 efficiency = speedup / n_threads
+    """
+    files = list(files)
+    thread_counts = list(thread_counts)
+    reference = [recognize_chords(file, **kwargs) for file in files]
+    jobs = list(range(len(files))) * repeat
+
+    def run(n_threads):
+        tic = perf_counter()
+        with ThreadPoolExecutor(n_threads) as executor:
+            results = list(executor.map(lambda k: recognize_chords(files[k], **kwargs), jobs))
+        seconds = perf_counter() - tic
+        return all(result.equals(reference[k]) for k, result in zip(jobs, results)), seconds
+
+    measured = {1: run(1)}
+    rows = []
+    for n_threads in thread_counts:
+        if n_threads not in measured:
+            measured[n_threads] = run(n_threads)
+        consistent, seconds = measured[n_threads]
+        files_per_sec = len(jobs) / seconds
+        speedup = measured[1][1] / seconds
+        rows.append([n_threads, consistent, seconds, files_per_sec, speedup, speedup / n_threads])
+    return pd.DataFrame(
+        rows, columns=['n_threads', 'consistent', 'seconds', 'files_per_sec', 'speedup', 'efficiency'])
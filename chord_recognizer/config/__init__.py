@@ -1,3 +1,7 @@
+import hashlib
+import types
+from typing import Optional
+
 import numpy as np
 from .gen_config import gen_chord_config
 import os
@@ -5,14 +9,38 @@ import os
 _CUR_DIR = os.path.split(__file__)[0]
 _CHORD_CONFIG_PATH = os.path.join(_CUR_DIR, "chord_config.npz")
 _GEN_CONFIG_CODE_PATH = os.path.join(_CUR_DIR, "gen_config.py")
-with open(_GEN_CONFIG_CODE_PATH, encoding="UTF-8") as f:
-    _CODE_HASH = hash(f.read())
+with open(_GEN_CONFIG_CODE_PATH, "rb") as f:
+    # hash() 对字符串的结果随 PYTHONHASHSEED 变化，使用与进程无关的摘要
+    _CODE_HASH = hashlib.sha256(f.read()).hexdigest()
+
+
+def _load_cached_config() -> Optional[dict]:
+    try:
+        with np.load(_CHORD_CONFIG_PATH) as cached:
+            if str(cached['hash']) == _CODE_HASH:
+                return {key: cached[key] for key in cached.files if key != 'hash'}
+    except (OSError, KeyError, ValueError):
+        pass
+    return None
+
 
-if not (os.path.isfile(_CHORD_CONFIG_PATH) and np.load(_CHORD_CONFIG_PATH)['hash'] == _CODE_HASH):
+CHORD_CONFIG = _load_cached_config()
+if CHORD_CONFIG is None:
     CHORD_CONFIG = gen_chord_config()
-    np.savez(_CHORD_CONFIG_PATH, hash=_CODE_HASH, **CHORD_CONFIG)
-else:
-    CHORD_CONFIG = {**np.load(_CHORD_CONFIG_PATH)}
+    # 先写临时文件再替换，同时导入的进程不会读到写了一半的文件；只读安装时跳过写入，只在内存中生成配置
+    _tmp_path = f"{_CHORD_CONFIG_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(_tmp_path, "wb") as f:
+            np.savez(f, hash=_CODE_HASH, **CHORD_CONFIG)
+        os.replace(_tmp_path, _CHORD_CONFIG_PATH)
+    except OSError:
+        if os.path.isfile(_tmp_path):
+            os.remove(_tmp_path)
 
-CHORD_CONFIG['pitch'] = [chroma.nonzero()[0].tolist() for chroma in CHORD_CONFIG['chroma']]
+CHORD_CONFIG['pitch'] = tuple(tuple(chroma.nonzero()[0].tolist()) for chroma in CHORD_CONFIG['chroma'])
+# 配置在所有线程间共享，设为只读
+for _value in CHORD_CONFIG.values():
+    if isinstance(_value, np.ndarray):
+        _value.flags.writeable = False
+CHORD_CONFIG = types.MappingProxyType(CHORD_CONFIG)
 __all__ = ["CHORD_CONFIG"]
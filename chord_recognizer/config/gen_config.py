@@ -1,5 +1,13 @@
 import numpy as np
 
+# 和弦每包含一个音，以及和弦为转位时，score bias 减去的数值
+NOTE_BIAS = 0.1
+INVERSION_BIAS = 0.05
+
+
+def gen_score_bias(chromas_sum, inverse, note_bias=NOTE_BIAS, inversion_bias=INVERSION_BIAS):
+    return (-note_bias * chromas_sum - inversion_bias * inverse).astype(np.float32)
+
 
 def gen_chord_config():
     QUALITIES = {
@@ -76,4 +84,4 @@ def gen_chord_config():
     inverse = np.array(inverse)
     return {'name': chord_name, 'bass': basses,
             'chroma': chromas, 'chroma_weight': chroma_weight,
-            'score_bias': (-0.1 * chromas_sum - 0.05 * inverse).astype(np.float32)}
+            'score_bias': gen_score_bias(chromas_sum, inverse)}
@@ -0,0 +1,339 @@
+import json
+import os
+import shutil
+import socket
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .config import CHORD_CONFIG
+from .main import recognize_chords_batch
+from .timeline import ChordTimeline
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# 数据集中每个和弦片段的列，时间单位为 1拍，end 为闭区间；chord 为 CHORD_CONFIG 中的和弦序号，-1 表示 N；
+# bass 为低音的音级，N 为 -1；pitches 为和弦所包含音级的 12位掩码，第 k 位表示音级 k
+segment_dtype = np.dtype([
+    ('file_id', np.int32),
+    ('start', np.int64),
+    ('end', np.int64),
+    ('chord', np.int16),
+    ('bass', np.int8),
+    ('pitches', np.uint16)
+])
+SCHEMA_VERSION = 1
+_MANIFEST = "manifest.json"
+
+# 每个和弦序号对应的 bass 与 pitches，与 CHORD_CONFIG['name'] 对齐，末尾追加 N 的一项，因此 chord 为 -1 时可以直接索引
+chord_bass = np.append(np.argmax(CHORD_CONFIG['bass'], axis=1), -1).astype(np.int8)
+chord_pitches = np.append(
+    [sum(1 << (p % 12) for p in pitch) for pitch in CHORD_CONFIG['pitch']], 0).astype(np.uint16)
+
+
+def _tmp_path(path: str) -> str:
+    # 临时文件名包含主机名、进程与线程，多个节点写入同一共享目录时不会互相覆盖
+    return f"{path}.{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+def _write_json(path: str, value, replace: bool = True) -> bool:
+    """
+    先写临时文件再替换，中断时 manifest 总是指向完整写入的分片
+
+    :param replace: 为 False 时只在 path 不存在时写入（硬链接，原子地创建），用于多个节点同时创建同一文件
+    :return: 是否写入
+    """
+    tmp = _tmp_path(path)
+    with open(tmp, "w", encoding="UTF-8") as f:
+        json.dump(value, f, ensure_ascii=False, indent=1)
+    if replace:
+        os.replace(tmp, path)
+        return True
+    try:
+        os.link(tmp, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp)
+
+
+def _load_shard(path: str, shard_format: str, shard: dict, columns: Iterable[str]) -> Dict[str, np.ndarray]:
+    if shard_format == "parquet":
+        assert pq is not None, "pyarrow is required for the parquet format!"
+        table = pq.read_table(os.path.join(path, shard['name']), columns=list(columns))
+        return {name: table.column(name).to_numpy() for name in columns}
+    return {name: np.load(os.path.join(path, shard['name'], name + ".npy"), mmap_mode='r') for name in columns}
+
+
+def _remove_shard(path: str, shard: dict):
+    shard_path = os.path.join(path, shard['name'])
+    if os.path.isdir(shard_path):
+        shutil.rmtree(shard_path)
+    elif os.path.isfile(shard_path):
+        os.remove(shard_path)
+
+
+class SegmentWriter:
+    """
+    将一批曲目的和弦片段流式地写入按列存储、只追加的数据集，内存开销只与分片大小有关
+
+    * 数据集为一个目录，包含 manifest.json（schema、分片列表与文件名）以及若干分片
+    * 安装了 pyarrow 时每个分片为一个 parquet 文件，否则为一个目录，其中每列一个 .npy 文件
+    * 再次打开已有的数据集时在末尾继续追加，file_id 与分片编号接着已有的数值
+    * 一首曲目只有在其所有片段都写入分片之后才会记入 manifest 的 files；中断时已写入分片、但尚未记入 files 的片段
+      被 SegmentReader 忽略，并在再次打开时清除
+    """
+
+    def __init__(self, path: str, shard_rows: int = 1 << 20, shard_format: Optional[str] = None):
+        """
+        :param path: 数据集的目录，不存在时自动创建
+        :param shard_rows: 每个分片的最大行数
+        :param shard_format: 分片的格式，"parquet" 或者 "npy"，为空时有 pyarrow 则使用 parquet；追加时必须与已有的数据集相同
+        """
+        assert shard_rows > 0, "shard_rows should be positive!"
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        manifest_path = os.path.join(path, _MANIFEST)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, encoding="UTF-8") as f:
+                self._manifest = json.load(f)
+            assert self._manifest['version'] == SCHEMA_VERSION, "the dataset has an incompatible schema version!"
+            assert shard_format is None or shard_format == self._manifest['format'], \
+                f"the dataset at {path} is stored as {self._manifest['format']}!"
+        else:
+            shard_format = ("npy" if pq is None else "parquet") if shard_format is None else shard_format
+            self._manifest = {
+                'version': SCHEMA_VERSION,
+                'format': shard_format,
+                'columns': [[name, segment_dtype[name].str] for name in segment_dtype.names],
+                'chord_names': CHORD_CONFIG['name'].tolist(),
+                'files': [],
+                'shards': [],
+                'next_shard': 0
+            }
+        self.format = self._manifest['format']
+        assert self.format in {"parquet", "npy"}, f"format: {self.format} is not supported!"
+        assert self.format == "npy" or pq is not None, "pyarrow is required for the parquet format!"
+        self._manifest.setdefault('next_shard', len(self._manifest['shards']))
+        self._buffer = np.empty(shard_rows, dtype=segment_dtype)
+        self._n_buffer = 0
+        # 片段已经写入缓冲区或者分片、但还没有记入 manifest 的曲目
+        self._pending_files = []
+        self._recover()
+
+    @property
+    def n_file(self) -> int:
+        return len(self._manifest['files']) + len(self._pending_files)
+
+    def _recover(self):
+        # 上次写入中断时，末尾的分片中可能有不属于 files 中任何曲目的片段：保留其中已完成曲目的片段写为一个新的分片，
+        # 以 manifest 的替换作为唯一的提交点，之后再删除旧的分片
+        n_file = len(self._manifest['files'])
+        shards = self._manifest['shards']
+        stale = [shard for shard in shards if shard['file_id_max'] >= n_file]
+        if not stale:
+            return
+        kept = []
+        for shard in stale:
+            if shard['file_id_min'] < n_file:
+                data = _load_shard(self.path, self.format, shard, segment_dtype.names)
+                mask = np.asarray(data['file_id']) < n_file
+                part = np.empty(int(mask.sum()), dtype=segment_dtype)
+                for name in segment_dtype.names:
+                    part[name] = np.asarray(data[name])[mask]
+                kept.append(part)
+        self._manifest['shards'] = [shard for shard in shards if shard['file_id_max'] < n_file]
+        if kept:
+            self._write_shard(np.concatenate(kept))
+        _write_json(os.path.join(self.path, _MANIFEST), self._manifest)
+        for shard in stale:
+            _remove_shard(self.path, shard)
+
+    def _write_shard(self, rows: np.ndarray):
+        # 分片名只增不减，不会覆盖 manifest 中仍然引用的分片
+        shard = f"shard-{self._manifest['next_shard']:05d}"
+        self._manifest['next_shard'] += 1
+        if self.format == "parquet":
+            shard += ".parquet"
+            pq.write_table(pa.table({name: np.ascontiguousarray(rows[name]) for name in segment_dtype.names}),
+                           os.path.join(self.path, shard))
+        else:
+            os.makedirs(os.path.join(self.path, shard), exist_ok=True)
+            for name in segment_dtype.names:
+                np.save(os.path.join(self.path, shard, name + ".npy"), rows[name])
+        self._manifest['shards'].append({
+            'name': shard, 'rows': int(len(rows)),
+            'file_id_min': int(rows['file_id'][0]), 'file_id_max': int(rows['file_id'][-1])
+        })
+
+    def write(self, chords: Union[ChordTimeline, pd.DataFrame], name: Optional[str] = None) -> int:
+        """
+        追加一首曲目的和弦片段，缓冲区写满时输出一个分片
+
+        :param chords: recognize_chords 的输出，ChordTimeline 或者 DataFrame
+        :param name: 可选，曲目的名称，例如文件路径，保存在 manifest 中
+        :return: 该曲目的 file_id，按写入的顺序从 0 开始编号
+        """
+        if isinstance(chords, pd.DataFrame):
+            chords = ChordTimeline.from_frame(chords)
+        file_id = self.n_file
+        starts, ends, chord = chords.starts, chords.ends, chords.chords
+        done = 0
+        while done < len(chord):
+            n = min(len(chord) - done, len(self._buffer) - self._n_buffer)
+            rows = self._buffer[self._n_buffer: self._n_buffer + n]
+            part = chord[done: done + n]
+            rows['file_id'] = file_id
+            rows['start'] = starts[done: done + n]
+            rows['end'] = ends[done: done + n]
+            rows['chord'] = part
+            rows['bass'] = chord_bass[part]
+            rows['pitches'] = chord_pitches[part]
+            self._n_buffer += n
+            done += n
+            if self._n_buffer == len(self._buffer):
+                self.flush()
+        self._pending_files.append(name)
+        return file_id
+
+    def flush(self):
+        """
+        将缓冲区中的片段写为一个新的分片，并将所有片段均已写入分片的曲目记入 manifest
+        """
+        if self._n_buffer > 0:
+            self._write_shard(self._buffer[:self._n_buffer])
+            self._n_buffer = 0
+        self._manifest['files'].extend(self._pending_files)
+        self._pending_files = []
+        _write_json(os.path.join(self.path, _MANIFEST), self._manifest)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class SegmentReader:
+    """
+    读取 SegmentWriter 写入的数据集，只加载需要的列，npy 分片以内存映射的方式打开，按 file_id 跳过无关的分片
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: 数据集的目录
+        """
+        with open(os.path.join(path, _MANIFEST), encoding="UTF-8") as f:
+            self._manifest = json.load(f)
+        assert self._manifest['version'] == SCHEMA_VERSION, "the dataset has an incompatible schema version!"
+        self.path = path
+        self.format = self._manifest['format']
+        self.schema = np.dtype([(name, dtype) for name, dtype in self._manifest['columns']])
+        self.chord_names = np.array(self._manifest['chord_names'])
+        self.files: List[Optional[str]] = self._manifest['files']
+
+    @property
+    def n_rows(self) -> int:
+        n_file = len(self.files)
+        return sum(shard['rows'] if shard['file_id_max'] < n_file else
+                   int(np.count_nonzero(self._load(shard, ['file_id'])['file_id'] < n_file))
+                   for shard in self._manifest['shards'])
+
+    def _load(self, shard: dict, columns: Iterable[str]) -> Dict[str, np.ndarray]:
+        return _load_shard(self.path, self.format, shard, columns)
+
+    def iter_shards(self, columns: Optional[Iterable[str]] = None,
+                    file_ids: Optional[Iterable[int]] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        逐个分片读取，每次只有一个分片的数据在内存中
+
+        :param columns: 需要读取的列，为空时读取所有列
+        :param file_ids: 可选，只读取这些曲目的片段
+        :return: 每个分片的 {列名: 数组}，没有指定 file_ids 时 npy 格式为只读的内存映射
+        """
+        columns = list(self.schema.names if columns is None else columns)
+        for name in columns:
+            assert name in self.schema.names, f"column: {name} is not in the dataset!"
+        n_file = len(self.files)
+        wanted = None if file_ids is None else np.unique(np.asarray(list(file_ids), dtype=np.int64))
+        for shard in self._manifest['shards']:
+            if wanted is not None:
+                # file_id 按写入顺序递增，分片中没有需要的曲目时直接跳过
+                k = np.searchsorted(wanted, shard['file_id_min'])
+                if k == len(wanted) or wanted[k] > shard['file_id_max']:
+                    continue
+            elif shard['file_id_max'] < n_file:
+                yield self._load(shard, columns)
+                continue
+            if shard['file_id_min'] >= n_file:
+                continue
+            # 写入中断时末尾的分片中可能有尚未记入 files 的曲目，见 SegmentWriter
+            data = self._load(shard, {*columns, 'file_id'})
+            mask = np.asarray(data['file_id']) < n_file
+            if wanted is not None:
+                mask &= np.isin(data['file_id'], wanted)
+            yield {name: np.asarray(data[name])[mask] for name in columns}
+
+    def read(self, columns: Optional[Iterable[str]] = None,
+             file_ids: Optional[Iterable[int]] = None) -> Dict[str, np.ndarray]:
+        """
+        读取并拼接所有分片，参数见 iter_shards
+        """
+        columns = list(self.schema.names if columns is None else columns)
+        parts = list(self.iter_shards(columns, file_ids))
+        return {name: np.concatenate([part[name] for part in parts]) if parts
+                else np.zeros(0, dtype=self.schema[name]) for name in columns}
+
+    def to_frame(self, columns: Optional[Iterable[str]] = None,
+                 file_ids: Optional[Iterable[int]] = None, with_names: bool = False) -> pd.DataFrame:
+        """
+        :param with_names: 是否由 chord 列额外生成和弦名 name 列
+        """
+        columns = list(self.schema.names if columns is None else columns)
+        data = self.read([*columns, *(['chord'] if with_names and 'chord' not in columns else [])], file_ids)
+        df = pd.DataFrame({name: data[name] for name in columns})
+        if with_names:
+            df['name'] = self.chord_names[data['chord']]
+        return df
+
+    def timeline(self, file_id: int) -> ChordTimeline:
+        """
+        :return: 某一首曲目的和弦片段
+        """
+        data = self.read(['start', 'end', 'chord'], [file_id])
+        return ChordTimeline.from_arrays(data['start'], data['end'], data['chord'])
+
+
+def write_corpus(files: Iterable, path: str, n_threads: Optional[int] = None, shard_rows: int = 1 << 20,
+                 shard_format: Optional[str] = None, **kwargs) -> SegmentReader:
+    """
+    识别一批曲目并流式写入数据集，按 n_threads * 4 首一批提交，内存中最多只保留一批的识别结果
+
+    :param files: recognize_chords 支持的输入，文件路径会作为曲目名称保存
+    :param path: 数据集的目录，见 SegmentWriter
+    :param n_threads: 线程数，见 main.recognize_chords_batch
+    :param shard_rows: 见 SegmentWriter
+    :param shard_format: 见 SegmentWriter
+    :param kwargs: 传递给 recognize_chords 的参数，识别结果总是以 ChordTimeline 写入，因此忽略其中的 as_timeline
+    """
+    kwargs.pop("as_timeline", None)
+    files = iter(files)
+    batch_size = (n_threads or os.cpu_count() or 1) * 4
+    with SegmentWriter(path, shard_rows, shard_format) as writer:
+        while True:
+            batch = [file for _, file in zip(range(batch_size), files)]
+            if not batch:
+                break
+            for file, timeline in zip(batch, recognize_chords_batch(batch, n_threads, **kwargs, as_timeline=True)):
+                writer.write(timeline, file if isinstance(file, str) else None)
+    return SegmentReader(path)
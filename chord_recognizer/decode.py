@@ -1,121 +1,1076 @@
-from typing import List
+from dataclasses import dataclass
+from itertools import product
+from typing import List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from numpy.lib.stride_tricks import sliding_window_view
-from .score import chord_score
+from .score import circular_quality_score, circular_combine, circular_score_bias, circular_bias, \
+    circular_chroma_sign, circular_quality_index, circular_bass_offset, N_ROOT, N_QUALITY_CLASS, \
+    chord_score_f32, chord_score_i16, score_bias_f32, FIXED_FEATURE_SCALE, FIXED_SCORE_SCALE
+from .config.gen_config import NOTE_BIAS, INVERSION_BIAS
 from .config import CHORD_CONFIG
-from numba import njit
-from .util import TimeSignature
+from numba import njit, prange
+from .util import TimeSignature, TempoMap
+from .timeline import ChordTimeline
 
 MAX_PREV = 8
+# 区间的最佳和弦得分低于 SCORE_FLOOR 时记为 N，得分取 SCORE_FLOOR
+SCORE_FLOOR = 0.2
+# 和弦区间每多包含一拍的额外得分
+SPAN_BONUS = 0.7
+# 和弦起点的额外得分：3 拍子的非强拍，4 拍子的第 1 拍，4 拍子的第 3 拍
+BEAT_WEIGHTS = (0.35, 0.2, 0.15)
+# score_dp_confidence 中概率的默认温度，与 score bias 中每个组成音的惩罚 NOTE_BIAS 同一量级，
+# 得分相差一个组成音惩罚的两条路径，概率相差约 e 倍
+CONFIDENCE_TEMPERATURE = 0.1
+# prefix_sum 的定点比例，每拍特征量化为 1 / PREFIX_SCALE 的整数倍，远小于 float32 区间特征的精度
+PREFIX_SCALE = 2. ** 40
+# score_dp_i16 中使用的定点常数，分别对应 score_dp 中的 SCORE_FLOOR 与 SPAN_BONUS
+_FIXED_SCORE_FLOOR = round(SCORE_FLOOR * FIXED_SCORE_SCALE)
+_FIXED_SPAN_BONUS = round(SPAN_BONUS * FIXED_SCORE_SCALE)
 
+segment_type = np.dtype([
+    ('start', np.uint32),
+    ('end', np.uint32),
+    ('chord', np.int32)
+])
 
-def downbeat_and_score_weight(n_frame: int, time_signatures: List[TimeSignature]):
+
+@dataclass(frozen=True)
+class DecodeParams:
+    """
+    解码时使用的常数，默认值即 decode_chords 一直以来使用的数值，见 sweep_decode
+
+    * score_floor, span_bonus：见 SCORE_FLOOR, SPAN_BONUS
+    * beat_weights：见 BEAT_WEIGHTS
+    * note_bias, inversion_bias：和弦的 score bias 为 -note_bias * 组成音个数 - inversion_bias * 是否转位，见 gen_chord_config
+    """
+    score_floor: float = SCORE_FLOOR
+    span_bonus: float = SPAN_BONUS
+    beat_weights: Tuple[float, float, float] = BEAT_WEIGHTS
+    note_bias: float = NOTE_BIAS
+    inversion_bias: float = INVERSION_BIAS
+
+    def bias(self) -> np.ndarray:
+        """
+        :return: shape 为 [N_QUALITY_CLASS] 的 score bias，见 score.circular_bias
+        """
+        if self.note_bias == NOTE_BIAS and self.inversion_bias == INVERSION_BIAS:
+            return circular_score_bias
+        return circular_bias(self.note_bias, self.inversion_bias)
+
+
+_DEFAULT_PARAMS = DecodeParams()
+
+
+def downbeat_and_score_weight(
+        n_frame: int, time_signatures: List[TimeSignature], offset: int = 0,
+        beat_weights: Tuple[float, float, float] = BEAT_WEIGHTS):
+    """
+    根据拍号计算每一拍是否为 downbeat，以及每一拍作为和弦起点时的额外得分
+
+    :param n_frame: 需要计算的拍数
+    :param time_signatures: 拍号序列，可以为空，时间单位为 1拍，不会被修改
+    :param offset: 第一个 frame 对应的绝对拍数，用于只计算某个时间窗口时保持 downbeat 对齐
+    :param beat_weights: 见 BEAT_WEIGHTS
+    :return: downbeat 与 weight，shape 均为 [n_frame]
+    """
+    triple_weight, duple_weight, duple_middle_weight = beat_weights
     if len(time_signatures) == 0:  # 默认44拍
-        time_signatures.append(TimeSignature(0, 4, 4))
-    elif time_signatures[0].time != 0:
-        time_signatures[0].time = 0
+        time_signatures = [TimeSignature(0, 4, 4)]
 
-    ends = [*(int(s.time) for s in time_signatures[1:]), n_frame]
+    # 第一个拍号总是从 0 开始
+    starts = [0, *(int(s.time) for s in time_signatures[1:])]
+    ends = [*starts[1:], offset + n_frame]
 
     weight = np.zeros(n_frame, dtype=np.float32)
     downbeat = np.zeros(n_frame, dtype=bool)
-    for time_signature, end in zip(time_signatures, ends):
-        start = int(time_signature.time)
+    for time_signature, start, end in zip(time_signatures, starts, ends):
         beats = time_signature.beats
-        relative_index = np.arange(end - start, dtype=np.uint32)
+        # 拍号区间与窗口的交集
+        lo = max(start, offset)
+        hi = max(min(end, offset + n_frame), lo)
+        relative_index = np.arange(lo - start, hi - start, dtype=np.uint32)
+        cur_weight = weight[lo - offset: hi - offset]
+        cur_downbeat = downbeat[lo - offset: hi - offset]
         if beats % 3 == 0:  # 3 拍子
             index = relative_index % 3 == 0
-            weight[start: end][~index] = 0.35
-            downbeat[start: end][index] = True
+            cur_weight[~index] = triple_weight
+            cur_downbeat[index] = True
         elif beats & (beats - 1) == 0:  # 2^n，处理为4 拍子
-            weight[start: end][relative_index % 2 == 0] = 0.2
-            weight[start: end][relative_index % 4 == 2] = 0.15
-            downbeat[start: end][relative_index % 4 == 0] = True
+            cur_weight[relative_index % 2 == 0] = duple_weight
+            cur_weight[relative_index % 4 == 2] = duple_middle_weight
+            cur_downbeat[relative_index % 4 == 0] = True
         else:
             raise AssertionError(f"time signature: {time_signature} is invalid!")
 
     return downbeat, weight
 
 
-@njit(cache=True)
-def score_dp(cum_chroma, cum_bass, downbeat, weight):
+def bar_to_beat(bar: int, time_signatures: List[TimeSignature]) -> int:
+    """
+    将小节序号转换为该小节第一拍的拍数，小节的划分与 downbeat_and_score_weight 中的 downbeat 保持一致
+
+    :param bar: 小节序号，从 0 开始
+    :param time_signatures: 拍号序列，可以为空，时间单位为 1拍
+    :return: 该小节第一拍的拍数
+    """
+    if len(time_signatures) == 0:  # 默认44拍
+        time_signatures = [TimeSignature(0, 4, 4)]
+    bar_start = 0
+    for i, time_signature in enumerate(time_signatures):
+        start = 0 if i == 0 else int(time_signature.time)
+        bar_len = 3 if time_signature.beats % 3 == 0 else 4
+        if i + 1 == len(time_signatures):
+            return start + (bar - bar_start) * bar_len
+        # 拍号变化前的最后一个不完整的小节也计为一个小节
+        n_bar = -(-(int(time_signatures[i + 1].time) - start) // bar_len)
+        if bar < bar_start + n_bar:
+            return start + (bar - bar_start) * bar_len
+        bar_start += n_bar
+
+
+def fixed_features(beat_feature: np.ndarray) -> np.ndarray:
+    """
+    :return: 量化为 1 / PREFIX_SCALE 的整数倍的特征，int64
+    """
+    assert len(beat_feature) == 0 or np.abs(beat_feature).max() * (len(beat_feature) + 1) < 2 ** 62 / PREFIX_SCALE, \
+        "beat_feature is too large for the fixed-point prefix sum!"
+    return np.rint(beat_feature * PREFIX_SCALE).astype(np.int64)
+
+
+def prefix_sum(beat_feature: np.ndarray) -> np.ndarray:
+    """
+    定点的前缀和，区间的和没有舍入误差，只与区间内的特征有关，与之前的拍以及累加的顺序无关，
+    因此分块解码与增量识别（session.RecognitionSession）只需要重新计算局部的区间，即可与一次性计算逐位相同
+
+    :param beat_feature: shape 为 [n_frame, n_dim]
+    :return: shape 为 [n_frame + 1, n_dim] 的 int64 前缀和，区间 [a, b] 的和为 (prefix[b + 1] - prefix[a]) / PREFIX_SCALE，
+        由 _span_features 转换为 float32
+    """
+    prefix = np.zeros((len(beat_feature) + 1, beat_feature.shape[1]), dtype=np.int64)
+    np.cumsum(fixed_features(beat_feature), axis=0, out=prefix[1:])
+    return prefix
+
+
+@njit(cache=True, nogil=True)
+def _span_features(prefix_chroma, prefix_bass, i, j):
+    # 区间的和小于 2^53，转换为 float64 以及乘以 2 的幂均没有误差，只在转换为 float32 时舍入一次
+    span_chroma = ((prefix_chroma[i + 1] - prefix_chroma[i - j]) * (1 / PREFIX_SCALE)).astype(np.float32)
+    span_bass = ((prefix_bass[i + 1] - prefix_bass[i - j]) * (1 / PREFIX_SCALE)).astype(np.float32)
+    return span_chroma, span_bass
+
+
+@njit(cache=True, nogil=True)
+def _finish_span_score(logits, weight, i, j, score_floor, span_bonus):
+    best_choice = logits.argmax()
+    score = logits[best_choice]
+    if score < score_floor:
+        score = score_floor
+        best_choice = -1
+    score += j * span_bonus + weight[i - j]
+    return score, best_choice
+
+
+@njit(cache=True, nogil=True)
+def _span_score(prefix_chroma, prefix_bass, weight, i, j, score_floor, span_bonus, bias):
+    """
+    以第 i 拍结尾、长度为 j + 1 拍的和弦区间的得分与最佳和弦，与之前的累计得分无关
+    """
+    span_chroma, span_bass = _span_features(prefix_chroma, prefix_bass, i, j)
+    logits = circular_combine(circular_quality_score(span_chroma), span_bass, bias)
+    return _finish_span_score(logits, weight, i, j, score_floor, span_bonus)
+
+
+@njit(cache=True, nogil=True)
+def _piece_dp(prefix_chroma, prefix_bass, downbeat, weight, max_prev, max_downbeats, final_choices, start_pos,
+              score_floor, span_bonus, bias):
+    """
+    score_dp 的实现，区间特征由前缀和在 kernel 内即时求得，结果写入 final_choices 与 start_pos
+    """
+    cum_scores = np.full(prefix_chroma.shape[0] - 1, -np.inf)
+    _resume_dp(prefix_chroma, prefix_bass, downbeat, weight, max_prev, max_downbeats,
+               final_choices, start_pos, cum_scores, 0, True, score_floor, span_bonus, bias)
+
+
+@njit(cache=True, nogil=True)
+def _resume_dp(prefix_chroma, prefix_bass, downbeat, weight, max_prev, max_downbeats,
+               final_choices, start_pos, cum_scores, first, at_origin, score_floor, span_bonus, bias):
+    """
+    从第 first 个 frame 开始继续动态规划，之前的 frame 的累计得分已经写入 cum_scores，用于分块解码时延续状态
+
+    :param at_origin: 第 0 个 frame 是否为曲目的第一拍，否则 first 需要不小于 max_prev
+    :param score_floor, span_bonus, bias: 见 DecodeParams
+    """
+    n_frame = prefix_chroma.shape[0] - 1
+    for i in range(first, n_frame):
+        n_downbeat = 0
+        for j in range(max_prev):
+            if i - j < 0:
+                break
+            score, best_choice = _span_score(
+                prefix_chroma, prefix_bass, weight, i, j, score_floor, span_bonus, bias)
+            pre_score = 0 if i - j == 0 and at_origin else cum_scores[i - j - 1]
+            cur_score = pre_score + score
+            # 如果累计得分更高
+            if cum_scores[i] < cur_score:
+                cum_scores[i] = cur_score
+                final_choices[i] = best_choice
+                start_pos[i] = i - j - 1
+            if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+
+
+@njit(cache=True, nogil=True)
+def score_dp(prefix_chroma, prefix_bass, downbeat, weight, max_prev=MAX_PREV, max_downbeats=1,
+             score_floor=SCORE_FLOOR, span_bonus=SPAN_BONUS, bias=None):
     """
     使用动态规划解析出最佳对和弦排列
+
+    :param prefix_chroma: shape 为 [n_frame + 1, 12]，pitch 特征的前缀和，由 prefix_sum() 得到
+    :param prefix_bass: shape 为 [n_frame + 1, 12]，bass 特征的前缀和，由 prefix_sum() 得到
+    :param downbeat: shape 为 [n_frame]
+    :param weight: shape 为 [n_frame]
+    :param max_prev: 一个和弦区间最多包含的拍数
+    :param max_downbeats: 一个和弦区间内（起点除外）最多包含的 downbeat 数，默认只允许跨越一个小节线
+    :param score_floor: 见 SCORE_FLOOR
+    :param span_bonus: 见 SPAN_BONUS
+    :param bias: shape 为 [N_QUALITY_CLASS] 的 score bias，见 DecodeParams.bias()，为空时使用默认值
+    :return: 每一拍作为区间终点时的最佳和弦 final_choices，以及区间起点的前一拍 start_pos
     """
-    n_frame = cum_chroma.shape[1]
+    if bias is None:
+        bias = circular_score_bias
+    n_frame = prefix_chroma.shape[0] - 1
+    final_choices = np.zeros(n_frame, dtype=np.int32)
+    start_pos = np.zeros(n_frame, dtype=np.int32)
+    _piece_dp(prefix_chroma, prefix_bass, downbeat, weight, max_prev, max_downbeats, final_choices, start_pos,
+              score_floor, span_bonus, bias)
+    return final_choices, start_pos
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def score_dp_parallel(prefix_chroma, prefix_bass, downbeat, weight, max_prev=MAX_PREV, max_downbeats=1,
+                      score_floor=SCORE_FLOOR, span_bonus=SPAN_BONUS, bias=None):
+    """
+    单首曲目的多核版本的 score_dp，结果与 score_dp 完全相同
+
+    * 区间的打分与之前的累计得分无关，且占据了几乎全部的耗时，因此先按 frame 并行地计算所有候选区间的得分与最佳和弦，
+      再顺序地进行只包含加法与比较的动态规划，运算顺序与 score_dp 相同
+    * 额外的内存开销为 n_frame * max_prev 个得分
+
+    :return: 见 score_dp
+    """
+    if bias is None:
+        bias = circular_score_bias
+    n_frame = prefix_chroma.shape[0] - 1
+    span_scores = np.empty((n_frame, max_prev))
+    span_choices = np.empty((n_frame, max_prev), dtype=np.int32)
+    n_span = np.zeros(n_frame, dtype=np.int32)
+    for i in prange(n_frame):
+        n_downbeat = 0
+        for j in range(max_prev):
+            if i - j < 0:
+                break
+            span_scores[i, j], span_choices[i, j] = _span_score(
+                prefix_chroma, prefix_bass, weight, i, j, score_floor, span_bonus, bias)
+            n_span[i] = j + 1
+            if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+
+    final_choices = np.zeros(n_frame, dtype=np.int32)
+    start_pos = np.zeros(n_frame, dtype=np.int32)
     cum_scores = np.full(n_frame, -np.inf)
+    for i in range(n_frame):
+        for j in range(n_span[i]):
+            pre_score = 0 if i - j == 0 else cum_scores[i - j - 1]
+            cur_score = pre_score + span_scores[i, j]
+            if cum_scores[i] < cur_score:
+                cum_scores[i] = cur_score
+                final_choices[i] = span_choices[i, j]
+                start_pos[i] = i - j - 1
+    return final_choices, start_pos
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def score_dp_batch(prefix_chroma, prefix_bass, offsets, downbeat, weight, max_prev=MAX_PREV, max_downbeats=1,
+                   score_floor=SCORE_FLOOR, span_bonus=SPAN_BONUS, bias=None):
+    """
+    在一次编译调用中，对多首曲目并行地进行动态规划
+
+    :param prefix_chroma: shape 为 [total_frame + 1, 12]，所有曲目的 pitch 特征按顺序拼接后的前缀和
+    :param prefix_bass: shape 为 [total_frame + 1, 12]，所有曲目的 bass 特征按顺序拼接后的前缀和
+    :param offsets: shape 为 [n_piece + 1]，第 p 首曲目占据 [offsets[p], offsets[p + 1]) 的 frame
+    :param downbeat: shape 为 [total_frame]，拼接后的 downbeat
+    :param weight: shape 为 [total_frame]，拼接后的 score weight
+    :param max_prev: 见 score_dp
+    :param max_downbeats: 见 score_dp
+    :return: 拼接后的 final_choices 与 start_pos，start_pos 为曲目内的相对位置
+    """
+    if bias is None:
+        bias = circular_score_bias
+    n_total = prefix_chroma.shape[0] - 1
+    final_choices = np.zeros(n_total, dtype=np.int32)
+    start_pos = np.zeros(n_total, dtype=np.int32)
+    for p in prange(len(offsets) - 1):
+        s, e = offsets[p], offsets[p + 1]
+        _piece_dp(prefix_chroma[s: e + 1], prefix_bass[s: e + 1], downbeat[s: e], weight[s: e],
+                  max_prev, max_downbeats, final_choices[s: e], start_pos[s: e], score_floor, span_bonus, bias)
+    return final_choices, start_pos
+
+
+@njit(cache=True, nogil=True)
+def _log_sum_exp(values, n):
+    m = values[:n].max()
+    if m == -np.inf:
+        return m
+    total = 0.
+    for k in range(n):
+        total += np.exp(values[k] - m)
+    return m + np.log(total)
+
+
+@njit(cache=True, nogil=True)
+def score_dp_confidence(prefix_chroma, prefix_bass, downbeat, weight, max_prev=MAX_PREV, max_downbeats=1,
+                        score_floor=SCORE_FLOOR, span_bonus=SPAN_BONUS, bias=None,
+                        temperature=CONFIDENCE_TEMPERATURE):
+    """
+    在同一次编译调用中完成 score_dp 的动态规划，以及在同一个区间网格上的前向后向计算，用于估计每个和弦的置信度
+
+    * 每个候选区间只打分一次，同时记录最佳与次佳和弦（包括得分为 score_floor 的 N）的得分差 margin，
+      以及对所有和弦求和的 log 势能 log_sum_exp((logits + j * span_bonus + weight) / temperature)
+    * 动态规划的运算顺序与 score_dp 相同，final_choices 与 start_pos 与 score_dp 完全相同
+    * 路径的概率正比于 exp(路径得分 / temperature)，alpha 与 beta 为前缀与后缀所有路径概率之和的对数
+
+    :param temperature: 概率的温度，越大越平滑，见 CONFIDENCE_TEMPERATURE
+    :return: final_choices, start_pos 见 score_dp；以第 i 拍结尾的最佳区间的 margin 与 log 势能 potential，shape 均为 [n_frame]；
+        alpha 与 beta，shape 均为 [n_frame + 1]，alpha[k] 与 beta[k] 分别对应结束于第 k - 1 拍的所有前缀与之后的所有后缀，
+        alpha[n_frame] 为所有路径的对数配分函数
+    """
+    if bias is None:
+        bias = circular_score_bias
+    n_frame = prefix_chroma.shape[0] - 1
+    span_scores = np.empty((n_frame, max_prev))
+    span_choices = np.empty((n_frame, max_prev), dtype=np.int32)
+    span_margin = np.empty((n_frame, max_prev))
+    span_log_sum = np.empty((n_frame, max_prev))
+    n_span = np.zeros(n_frame, dtype=np.int32)
+    for i in range(n_frame):
+        n_downbeat = 0
+        for j in range(max_prev):
+            if i - j < 0:
+                break
+            span_chroma, span_bass = _span_features(prefix_chroma, prefix_bass, i, j)
+            logits = circular_combine(circular_quality_score(span_chroma), span_bass, bias)
+            score, best_choice = _finish_span_score(logits, weight, i, j, score_floor, span_bonus)
+            best = score_floor if best_choice == -1 else logits[best_choice]
+            second = -np.inf if best_choice == -1 else score_floor
+            total = np.exp((score_floor - best) / temperature)
+            for c in range(len(logits)):
+                total += np.exp((logits[c] - best) / temperature)
+                if c != best_choice and logits[c] > second:
+                    second = logits[c]
+            span_scores[i, j] = score
+            span_choices[i, j] = best_choice
+            span_margin[i, j] = best - second
+            span_log_sum[i, j] = (best + (j * span_bonus + weight[i - j])) / temperature + np.log(total)
+            n_span[i] = j + 1
+            if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+
+    final_choices = np.zeros(n_frame, dtype=np.int32)
     start_pos = np.zeros(n_frame, dtype=np.int32)
+    margin = np.zeros(n_frame)
+    potential = np.zeros(n_frame)
+    cum_scores = np.full(n_frame, -np.inf)
+    alpha = np.zeros(n_frame + 1)
+    values = np.empty(max_prev)
+    for i in range(n_frame):
+        for j in range(n_span[i]):
+            pre_score = 0 if i - j == 0 else cum_scores[i - j - 1]
+            cur_score = pre_score + span_scores[i, j]
+            if cum_scores[i] < cur_score:
+                cum_scores[i] = cur_score
+                final_choices[i] = span_choices[i, j]
+                start_pos[i] = i - j - 1
+                margin[i] = span_margin[i, j]
+                potential[i] = span_scores[i, j] / temperature
+            values[j] = alpha[i - j] + span_log_sum[i, j]
+        alpha[i + 1] = _log_sum_exp(values, n_span[i])
+
+    # beta[k]：从第 k 拍开始直到曲目结尾的所有后缀
+    beta = np.full(n_frame + 1, -np.inf)
+    beta[n_frame] = 0.
+    for k in range(n_frame - 1, -1, -1):
+        n = 0
+        for i in range(k, min(k + max_prev, n_frame)):
+            if i - k < n_span[i]:
+                values[n] = span_log_sum[i, i - k] + beta[i + 1]
+                n += 1
+        beta[k] = _log_sum_exp(values, n)
+    return final_choices, start_pos, margin, potential, alpha, beta
+
+
+@njit(cache=True, nogil=True)
+def score_dp_masked(prefix_chroma, prefix_bass, downbeat, weight, allowed, max_prev, max_downbeats,
+                    score_floor, span_bonus, bias, span_scores, span_choices, scored):
+    """
+    只允许和弦区间在 allowed 为 True 的拍结束的 score_dp，allowed 全为 True 时结果与 score_dp 相同
+
+    * 区间 (i, j) 只有在第 i 拍与第 i - j - 1 拍（或曲目开头）均允许结束时才会打分，跳过的区间不产生任何开销
+    * 打分结果缓存在 span_scores, span_choices 中，scored 标记已经打分的区间，多次调用时复用
+
+    :param allowed: shape 为 [n_frame]，每一拍是否允许作为和弦区间的终点
+    :param span_scores, span_choices, scored: shape 均为 [n_frame, max_prev] 的缓存
+    :return: final_choices, start_pos 见 score_dp，以及最后一拍是否可达
+    """
+    n_frame = prefix_chroma.shape[0] - 1
     final_choices = np.zeros(n_frame, dtype=np.int32)
+    start_pos = np.zeros(n_frame, dtype=np.int32)
+    cum_scores = np.full(n_frame, -np.inf)
     for i in range(n_frame):
-        for j in range(MAX_PREV):
+        if not allowed[i]:
+            continue
+        n_downbeat = 0
+        for j in range(max_prev):
             if i - j < 0:
                 break
-            logits = chord_score(cum_chroma[j, i], cum_bass[j, i])
+            if i - j == 0 or allowed[i - j - 1]:
+                if not scored[i, j]:
+                    span_scores[i, j], span_choices[i, j] = _span_score(
+                        prefix_chroma, prefix_bass, weight, i, j, score_floor, span_bonus, bias)
+                    scored[i, j] = True
+                pre_score = 0 if i - j == 0 else cum_scores[i - j - 1]
+                cur_score = pre_score + span_scores[i, j]
+                if cum_scores[i] < cur_score:
+                    cum_scores[i] = cur_score
+                    final_choices[i] = span_choices[i, j]
+                    start_pos[i] = i - j - 1
+            if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+    return final_choices, start_pos, n_frame == 0 or cum_scores[n_frame - 1] > -np.inf
+
+
+def coarse_grid(downbeat: np.ndarray, level: str = "bar") -> np.ndarray:
+    """
+    粗粒度解码时允许和弦区间结束的位置：每个小节（或半小节）的最后一拍，以及曲目的最后一拍
+
+    :param downbeat: 见 downbeat_and_score_weight
+    :param level: "bar" 或者 "half_bar"，半小节只对偶数拍的小节生效
+    :return: shape 为 [n_frame] 的 bool 数组
+    """
+    assert level in {"bar", "half_bar"}, f"level: {level} is not supported!"
+    n_frame = len(downbeat)
+    allowed = np.zeros(n_frame, dtype=bool)
+    if n_frame == 0:
+        return allowed
+    bar_starts = np.flatnonzero(downbeat)
+    allowed[bar_starts[bar_starts > 0] - 1] = True
+    allowed[-1] = True
+    if level == "half_bar":
+        bounds = np.concatenate([[0], bar_starts[bar_starts > 0], [n_frame]])
+        length = np.diff(bounds)
+        even = (length % 2 == 0) & (length > 2)
+        allowed[bounds[:-1][even] + length[even] // 2 - 1] = True
+    return allowed
+
+
+def coarse_to_fine_dp(prefix_chroma, prefix_bass, downbeat, weight, max_prev=MAX_PREV, max_downbeats=1,
+                      score_floor=SCORE_FLOOR, span_bonus=SPAN_BONUS, bias=None, level: str = "bar",
+                      radius: int = 2):
+    """
+    由粗到细的解码：先只在小节线（或半小节线）处切分和弦，再只在检测到的和弦变化附近逐拍细化
+
+    * 粗解码只对端点均在小节线上的区间打分，打分次数约为 score_dp 的 1 / 小节拍数^2
+    * 细化时允许和弦区间在小节线，以及粗解码的每个和弦变化前后 radius 拍内的任意一拍结束，粗解码中已打分的区间直接复用
+    * 与 score_dp 的差异只来自远离粗解码中和弦变化的小节内部的变化，见 benchmark.verify_coarse_to_fine
+    * 小节的拍数超过 max_prev 等原因导致无法到达最后一拍时，退化为逐拍的解码，结果与 score_dp 相同
+
+    :param level: 粗解码的粒度，见 coarse_grid
+    :param radius: 细化的范围，单位为 1拍
+    :return: final_choices, start_pos 见 score_dp，以及打分的区间数
+    """
+    if bias is None:
+        bias = circular_score_bias
+    n_frame = prefix_chroma.shape[0] - 1
+    span_scores = np.empty((n_frame, max_prev))
+    span_choices = np.empty((n_frame, max_prev), dtype=np.int32)
+    scored = np.zeros((n_frame, max_prev), dtype=bool)
+    allowed = coarse_grid(downbeat, level)
+    final_choices, start_pos, reachable = score_dp_masked(
+        prefix_chroma, prefix_bass, downbeat, weight, allowed, max_prev, max_downbeats,
+        score_floor, span_bonus, bias, span_scores, span_choices, scored)
+    if reachable:
+        starts, _, _ = backtrack_segments(final_choices, start_pos)
+        # 每个和弦变化（第 b 拍开始新的和弦）前后 radius 拍内的每一拍都允许结束
+        change = np.zeros(n_frame + 1, dtype=np.int64)
+        changes = starts[1:].astype(np.int64) - 1
+        np.add.at(change, np.maximum(changes - radius, 0), 1)
+        np.add.at(change, np.minimum(changes + radius + 1, n_frame), -1)
+        allowed |= np.cumsum(change[:-1]) > 0
+    else:
+        allowed[:] = True
+    final_choices, start_pos, reachable = score_dp_masked(
+        prefix_chroma, prefix_bass, downbeat, weight, allowed, max_prev, max_downbeats,
+        score_floor, span_bonus, bias, span_scores, span_choices, scored)
+    if not reachable:
+        allowed[:] = True
+        final_choices, start_pos, _ = score_dp_masked(
+            prefix_chroma, prefix_bass, downbeat, weight, allowed, max_prev, max_downbeats,
+            score_floor, span_bonus, bias, span_scores, span_choices, scored)
+    return final_choices, start_pos, int(scored.sum())
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def precompute_spans(prefix_chroma, prefix_bass, downbeat, max_prev=MAX_PREV, max_downbeats=1):
+    """
+    预先计算所有候选区间中与解码常数无关的部分，供 sweep_dp 对多组常数复用
+
+    * 额外的内存开销为 n_frame * max_prev * 12 * (性质数量 + 1) 个数值
+
+    :return: 每个区间的 circular_quality_score 结果 span_quality，shape 为 [n_frame, max_prev, 12, 性质数量]，
+        区间的 bass 特征 span_bass，shape 为 [n_frame, max_prev, 12]，以及以第 i 拍结尾的候选区间数 n_span
+    """
+    n_frame = prefix_chroma.shape[0] - 1
+    span_quality = np.empty((n_frame, max_prev, N_ROOT, circular_chroma_sign.shape[0]))
+    span_bass = np.empty((n_frame, max_prev, 12), dtype=np.float32)
+    n_span = np.zeros(n_frame, dtype=np.int32)
+    for i in prange(n_frame):
+        n_downbeat = 0
+        for j in range(max_prev):
+            if i - j < 0:
+                break
+            span_chroma, cur_bass = _span_features(prefix_chroma, prefix_bass, i, j)
+            span_quality[i, j] = circular_quality_score(span_chroma)
+            span_bass[i, j] = cur_bass
+            n_span[i] = j + 1
+            if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+    return span_quality, span_bass, n_span
+
+
+@njit(cache=True, nogil=True, parallel=True)
+def sweep_dp(span_quality, span_bass, n_span, weights, score_floors, span_bonuses, biases):
+    """
+    在一次编译调用中，用多组解码常数对同一首曲目并行地进行动态规划，每一组的结果与 score_dp 相同
+
+    :param span_quality, span_bass, n_span: precompute_spans 的返回值
+    :param weights: shape 为 [n_set, n_frame]，每一组 beat_weights 对应的 score weight
+    :param score_floors: shape 为 [n_set]
+    :param span_bonuses: shape 为 [n_set]
+    :param biases: shape 为 [n_set, N_QUALITY_CLASS]
+    :return: final_choices 与 start_pos，shape 均为 [n_set, n_frame]
+    """
+    n_set, n_frame = weights.shape
+    final_choices = np.zeros((n_set, n_frame), dtype=np.int32)
+    start_pos = np.zeros((n_set, n_frame), dtype=np.int32)
+    for p in prange(n_set):
+        cum_scores = np.full(n_frame, -np.inf)
+        for i in range(n_frame):
+            for j in range(n_span[i]):
+                # 与 circular_combine 后取 argmax 相同，但不分配 logits
+                quality_score, bass, bias = span_quality[i, j], span_bass[i, j], biases[p]
+                score = -np.inf
+                best_choice = 0
+                for r in range(N_ROOT):
+                    for k in range(N_QUALITY_CLASS):
+                        logit = quality_score[r, circular_quality_index[k]] + (
+                                0.5 * bass[(r + circular_bass_offset[k]) % 12] + bias[k])
+                        if logit > score:
+                            score = logit
+                            best_choice = r * N_QUALITY_CLASS + k
+                if score < score_floors[p]:
+                    score = score_floors[p]
+                    best_choice = -1
+                score += j * span_bonuses[p] + weights[p, i - j]
+                pre_score = 0 if i - j == 0 else cum_scores[i - j - 1]
+                cur_score = pre_score + score
+                if cum_scores[i] < cur_score:
+                    cum_scores[i] = cur_score
+                    final_choices[p, i] = best_choice
+                    start_pos[p, i] = i - j - 1
+    return final_choices, start_pos
+
+
+@njit(cache=True, nogil=True)
+def score_dp_f32(prefix_feature, downbeat, weight, max_prev=MAX_PREV, max_downbeats=1):
+    """
+    float32 版本的 score_dp，打分与累计得分均使用 float32
+
+    :param prefix_feature: shape 为 [n_frame + 1, 24]，前 12 维为 chroma，后 12 维为 bass 的前缀和
+    :return: 见 score_dp
+    """
+    n_frame = prefix_feature.shape[0] - 1
+    final_choices = np.zeros(n_frame, dtype=np.int32)
+    start_pos = np.zeros(n_frame, dtype=np.int32)
+    cum_scores = np.full(n_frame, -np.inf, dtype=np.float32)
+    logits = np.empty(score_bias_f32.shape[0], dtype=np.float32)
+    span = np.empty(24, dtype=np.float32)
+    floor = np.float32(SCORE_FLOOR)
+    for i in range(n_frame):
+        n_downbeat = 0
+        for j in range(max_prev):
+            if i - j < 0:
+                break
+            for k in range(24):
+                span[k] = prefix_feature[i + 1, k] - prefix_feature[i - j, k]
+            chord_score_f32(span, logits)
             best_choice = logits.argmax()
             score = logits[best_choice]
-            if score < 0.2:
-                score = 0.2
+            if score < floor:
+                score = floor
                 best_choice = -1
-            score += j * 0.7 + weight[i - j]
-            pre_score = 0 if i - j == 0 else cum_scores[i - j - 1]
+            score += np.float32(j * SPAN_BONUS) + weight[i - j]
+            pre_score = np.float32(0) if i - j == 0 else cum_scores[i - j - 1]
             cur_score = pre_score + score
-            # 如果累计得分更高
             if cum_scores[i] < cur_score:
                 cum_scores[i] = cur_score
                 final_choices[i] = best_choice
                 start_pos[i] = i - j - 1
             if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+    return final_choices, start_pos
+
+
+@njit(cache=True, nogil=True)
+def score_dp_i16(prefix_feature, downbeat, weight, max_prev=MAX_PREV, max_downbeats=1):
+    """
+    定点版本的 score_dp，所有得分均为浮点得分乘以 FIXED_SCORE_SCALE 后的整数
+
+    :param prefix_feature: shape 为 [n_frame + 1, 24]，int64，由 int16 的量化特征求得的前缀和
+    :param weight: shape 为 [n_frame]，int64，乘以 FIXED_SCORE_SCALE 后的 score weight
+    :return: 见 score_dp
+    """
+    n_frame = prefix_feature.shape[0] - 1
+    final_choices = np.zeros(n_frame, dtype=np.int32)
+    start_pos = np.zeros(n_frame, dtype=np.int32)
+    cum_scores = np.full(n_frame, np.iinfo(np.int64).min, dtype=np.int64)
+    logits = np.empty(score_bias_f32.shape[0], dtype=np.int32)
+    span = np.empty(24, dtype=np.int32)
+    for i in range(n_frame):
+        n_downbeat = 0
+        for j in range(max_prev):
+            if i - j < 0:
                 break
+            for k in range(24):
+                span[k] = prefix_feature[i + 1, k] - prefix_feature[i - j, k]
+            chord_score_i16(span, logits)
+            best_choice = logits.argmax()
+            score = np.int64(logits[best_choice])
+            if score < _FIXED_SCORE_FLOOR:
+                score = _FIXED_SCORE_FLOOR
+                best_choice = -1
+            score += j * _FIXED_SPAN_BONUS + weight[i - j]
+            pre_score = 0 if i - j == 0 else cum_scores[i - j - 1]
+            cur_score = pre_score + score
+            if cum_scores[i] < cur_score:
+                cum_scores[i] = cur_score
+                final_choices[i] = best_choice
+                start_pos[i] = i - j - 1
+            if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
     return final_choices, start_pos
 
 
+def _reduced_precision_dp(beat_chroma, beat_bass, downbeat, weight, max_prev, max_downbeats, precision):
+    beat_feature = np.concatenate([beat_chroma, beat_bass], axis=1)
+    if precision == "float32":
+        prefix_feature = np.zeros((len(beat_feature) + 1, 24))
+        np.cumsum(beat_feature, axis=0, out=prefix_feature[1:])
+        return score_dp_f32(prefix_feature, downbeat, weight, max_prev, max_downbeats)
+    assert max_prev * FIXED_FEATURE_SCALE < 2 ** 15, f"max_prev: {max_prev} is too large for int16 features!"
+    beat_feature = np.rint(beat_feature * FIXED_FEATURE_SCALE).astype(np.int16)
+    prefix_feature = np.zeros((len(beat_feature) + 1, 24), dtype=np.int64)
+    np.cumsum(beat_feature, axis=0, out=prefix_feature[1:])
+    weight = np.rint(weight.astype(np.float64) * FIXED_SCORE_SCALE).astype(np.int64)
+    return score_dp_i16(prefix_feature, downbeat, weight, max_prev, max_downbeats)
+
+
+@njit(cache=True, nogil=True)
+def backtrack_segments(final_choices, start_pos):
+    """
+    根据 dp 结果回溯，得到按时间顺序排列的和弦片段，并合并相邻的相同和弦
+
+    :return: 每个片段的 start, end, chord，chord 为 -1 时表示 N
+    """
+    n_frame = len(final_choices)
+    starts = np.empty(n_frame, dtype=np.uint32)
+    ends = np.empty(n_frame, dtype=np.uint32)
+    chords = np.empty(n_frame, dtype=np.int32)
+    n_seg = 0
+    end = n_frame - 1
+    while end >= 0:
+        start = start_pos[end] + 1
+        choice = final_choices[end]
+        if n_seg > 0 and chords[n_seg - 1] == choice:
+            starts[n_seg - 1] = start
+        else:
+            starts[n_seg] = start
+            ends[n_seg] = end
+            chords[n_seg] = choice
+            n_seg += 1
+        end = start - 1
+    return starts[:n_seg][::-1], ends[:n_seg][::-1], chords[:n_seg][::-1]
+
+
+def decode_chords_batch(
+        features: List[Tuple[np.ndarray, np.ndarray]],
+        time_signatures: List[List[TimeSignature]],
+        max_prev: int = MAX_PREV,
+        max_downbeats: int = 1,
+        params: Optional[DecodeParams] = None) -> List[np.ndarray]:
+    """
+    批量解析多首曲目的和弦，所有曲目的动态规划在一次 numba 调用中并行完成
+
+    :param features: 每首曲目的 (beat_chroma, beat_bass)，由 feature.extract_chord_features() 得到
+    :param time_signatures: 每首曲目的拍号序列，可以为空
+    :param max_prev: 见 score_dp
+    :param max_downbeats: 见 score_dp
+    :param params: 见 decode_chords
+    :return: 每首曲目的和弦片段，dtype 为 segment_type，chord 为 CHORD_CONFIG['name'] 的下标，-1 表示 N
+    """
+    params = _DEFAULT_PARAMS if params is None else params
+    assert len(features) == len(time_signatures), "features and time_signatures should have the same length!"
+    lengths = np.array([len(bass) for _, bass in features], dtype=np.int64)
+    offsets = np.zeros(len(features) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    prefix_chroma = prefix_sum(np.concatenate([chroma for chroma, _ in features]))
+    prefix_bass = prefix_sum(np.concatenate([bass for _, bass in features]))
+    downbeat, weight = map(np.concatenate, zip(*(
+        downbeat_and_score_weight(int(n_frame), ts, beat_weights=params.beat_weights)
+        for n_frame, ts in zip(lengths, time_signatures)
+    )))
+    final_choices, start_pos = score_dp_batch(
+        prefix_chroma, prefix_bass, offsets, downbeat, weight, max_prev, max_downbeats,
+        params.score_floor, params.span_bonus, params.bias())
+
+    result = []
+    for s, e in zip(offsets[:-1], offsets[1:]):
+        starts, ends, chords = backtrack_segments(final_choices[s: e], start_pos[s: e])
+        segments = np.empty(len(chords), dtype=segment_type)
+        segments['start'] = starts
+        segments['end'] = ends
+        segments['chord'] = chords
+        result.append(segments)
+    return result
+
+
+def param_grid(**axes) -> List[DecodeParams]:
+    """
+    生成参数网格，未给出的常数取默认值
+
+    >>> param_grid(score_floor=[0.1, 0.2, 0.3], span_bonus=[0.6, 0.7])  # 6 组参数
+
+    :param axes: DecodeParams 的字段名与候选值的列表
+    :return: 所有组合对应的 DecodeParams
+    """
+    names = list(axes)
+    return [DecodeParams(**dict(zip(names, values))) for values in product(*(axes[name] for name in names))]
+
+
+def sweep_decode(
+        beat_chroma: np.ndarray, beat_bass: np.ndarray,
+        time_signatures: List[TimeSignature],
+        param_sets: List[DecodeParams],
+        offset: int = 0,
+        max_prev: int = MAX_PREV,
+        max_downbeats: int = 1) -> List[pd.DataFrame]:
+    """
+    用多组解码常数解析同一首曲目的和弦，每一组的结果与 decode_chords(..., params=params) 相同
+
+    * 区间的特征与 chroma 得分只在 precompute_spans 中计算一次，每组常数只需要加上 bass 得分与 bias 并重新进行动态规划
+    * 所有参数组在 sweep_dp 的一次编译调用中并行完成
+
+    :param beat_chroma: 见 decode_chords
+    :param beat_bass: 见 decode_chords
+    :param time_signatures: 拍号序列，可以为空
+    :param param_sets: 需要尝试的解码常数，见 param_grid
+    :param offset: 见 decode_chords
+    :param max_prev: 见 score_dp
+    :param max_downbeats: 见 score_dp
+    :return: 与 param_sets 一一对应的和弦 DataFrame，格式与 decode_chords 相同
+    """
+    assert max_prev > 0 and max_downbeats > 0, "max_prev and max_downbeats should be positive!"
+    n_frame = len(beat_bass)
+    downbeat, _ = downbeat_and_score_weight(n_frame, time_signatures, offset)
+    span_quality, span_bass, n_span = precompute_spans(
+        prefix_sum(beat_chroma), prefix_sum(beat_bass), downbeat, max_prev, max_downbeats)
+
+    weights = np.empty((len(param_sets), n_frame), dtype=np.float32)
+    for p, params in enumerate(param_sets):
+        weights[p] = downbeat_and_score_weight(n_frame, time_signatures, offset, params.beat_weights)[1]
+    score_floors = np.array([params.score_floor for params in param_sets], dtype=np.float64)
+    span_bonuses = np.array([params.span_bonus for params in param_sets], dtype=np.float64)
+    biases = np.array([params.bias() for params in param_sets], dtype=np.float64).reshape(len(param_sets), -1)
+    final_choices, start_pos = sweep_dp(span_quality, span_bass, n_span, weights, score_floors, span_bonuses, biases)
+
+    result = []
+    for p in range(len(param_sets)):
+        starts, ends, chords = backtrack_segments(final_choices[p], start_pos[p])
+        segments = np.empty(len(chords), dtype=segment_type)
+        segments['start'] = starts
+        segments['end'] = ends
+        segments['chord'] = chords
+        result.append(segments_to_frame(segments, offset=offset))
+    return result
+
+
 def decode_chords(
         beat_chroma: np.ndarray, beat_bass: np.ndarray,
-        time_signatures: List[TimeSignature]) -> pd.DataFrame:
+        time_signatures: List[TimeSignature],
+        tempo_map: Optional[TempoMap] = None,
+        offset: int = 0,
+        max_prev: int = MAX_PREV,
+        max_downbeats: int = 1,
+        precision: str = "float64",
+        parallel: bool = False,
+        params: Optional[DecodeParams] = None,
+        as_timeline: bool = False,
+        with_confidence: bool = False,
+        temperature: float = CONFIDENCE_TEMPERATURE,
+        coarse: Optional[str] = None,
+        refine_radius: int = 2) -> Union[pd.DataFrame, ChordTimeline]:
     """
     对提取得到的 pitch 与 bass 的数值，进行打分，并使用动态规划解析出最佳对和弦排列
 
-    **sliding window requires np.__version__ >= 1.20**
+    * 区间特征由前缀和在 kernel 内即时求得，内存开销与 max_prev 无关
+    * 默认情况下和弦区间最多跨越一个小节线，需要识别更长的和弦时，同时增大 max_prev 与 max_downbeats
 
     :param beat_chroma: shape 为 [n_frame, 12]，每一拍的 pitch 特征，由 feature.extrac_chord_feature() 得到
     :param beat_bass: shape 为 [n_frame, 12]，每一拍的 bass 特征，由 feature.extrac_chord_feature() 得到
     :param time_signatures: 拍号序列，可以为空
-    :return: 以 pd.DataFrame 的类型，返回解析出的和弦，时间单位为 1拍
+    :param tempo_map: 可选，给定时额外输出以秒为单位的 start_sec 与 end_sec 两列，end_sec 为该和弦最后一拍结束的时间
+    :param offset: 特征第一拍对应的绝对拍数，只解析某个时间窗口时使用，输出的时间会加上该偏移
+    :param max_prev: 见 score_dp
+    :param max_downbeats: 见 score_dp
+    :param precision: 打分与动态规划使用的精度，"float64" 为默认实现，
+        "float32" 与 "int16" 使用转置后的模板与低精度的 kernel，结果可能与默认实现略有差异，见 benchmark.verify_precision()
+    :param parallel: 是否使用 score_dp_parallel 在多个核上解码，只支持 float64，结果与 score_dp 相同，适用于很长的曲目
+    :param params: 可选，解码使用的常数，为空时使用默认值，非默认值只支持 float64，见 DecodeParams
+    :param as_timeline: 是否返回 ChordTimeline，用于按时间点或区间批量查询和弦，见 timeline.ChordTimeline
+    :param with_confidence: 是否额外输出置信度，只支持 float64，见 score_dp_confidence，结果增加两列：
+        margin 为和弦内各个区间的最佳与次佳和弦得分差的最小值；
+        posterior 为解码出的这些区间与和弦同时出现在路径中的后验概率
+    :param temperature: 计算 posterior 时的温度，见 score_dp_confidence
+    :param coarse: 可选，"bar" 或者 "half_bar"，使用由粗到细的解码，只支持 float64，结果可能与默认实现略有差异，
+        见 coarse_to_fine_dp 与 benchmark.verify_coarse_to_fine()
+    :param refine_radius: 由粗到细解码时，在和弦变化前后逐拍细化的拍数
+    :return: 以 pd.DataFrame 的类型，返回解析出的和弦，时间单位为 1拍；as_timeline=True 时返回 timeline.ChordTimeline
     """
     n_frame = len(beat_bass)
-    # 每一beat的累计得分
-    beat_chroma_pad = np.pad(beat_chroma.astype(np.float32), ((MAX_PREV - 1, 0), (0, 0)))
-    beat_bass_pad = np.pad(beat_bass.astype(np.float32), ((MAX_PREV - 1, 0), (0, 0)))
-
-    cum_chroma = np.stack([
-        np.sum(  # sliding window requires np.__version__ >= 1.20
-            sliding_window_view(beat_chroma_pad[MAX_PREV - j:], j, axis=0),
-            axis=-1
-        ) for j in range(1, MAX_PREV + 1)
-    ])
-
-    cum_bass = np.stack([
-        np.sum(sliding_window_view(beat_bass_pad[MAX_PREV - j:], j, axis=0), axis=-1)
-        for j in range(1, MAX_PREV + 1)
-    ])
-
-    downbeat, weight = downbeat_and_score_weight(n_frame, time_signatures)
-    final_choices, start_pos = score_dp(cum_chroma, cum_bass, downbeat, weight)
+    params = _DEFAULT_PARAMS if params is None else params
+    assert max_prev > 0 and max_downbeats > 0, "max_prev and max_downbeats should be positive!"
+    assert precision in {"float64", "float32", "int16"}, f"precision: {precision} is not supported!"
+    assert not parallel or precision == "float64", "only float64 precision is supported in the parallel mode!"
+    assert precision == "float64" or params == _DEFAULT_PARAMS, \
+        "only float64 precision supports custom decode params!"
+    assert not with_confidence or (precision == "float64" and not parallel and not as_timeline), \
+        "with_confidence only supports the float64 precision and the DataFrame output!"
+    assert coarse is None or (precision == "float64" and not parallel and not with_confidence), \
+        "coarse-to-fine decoding only supports the float64 precision!"
+    downbeat, weight = downbeat_and_score_weight(n_frame, time_signatures, offset, params.beat_weights)
+    if with_confidence:
+        final_choices, start_pos, margin, potential, alpha, beta = score_dp_confidence(
+            prefix_sum(beat_chroma), prefix_sum(beat_bass), downbeat, weight, max_prev, max_downbeats,
+            params.score_floor, params.span_bonus, params.bias(), temperature)
+    elif coarse is not None:
+        final_choices, start_pos, _ = coarse_to_fine_dp(
+            prefix_sum(beat_chroma), prefix_sum(beat_bass), downbeat, weight, max_prev, max_downbeats,
+            params.score_floor, params.span_bonus, params.bias(), coarse, refine_radius)
+    elif parallel:
+        final_choices, start_pos = score_dp_parallel(
+            prefix_sum(beat_chroma), prefix_sum(beat_bass), downbeat, weight, max_prev, max_downbeats,
+            params.score_floor, params.span_bonus, params.bias())
+    elif precision == "float64":
+        final_choices, start_pos = score_dp(
+            prefix_sum(beat_chroma), prefix_sum(beat_bass), downbeat, weight, max_prev, max_downbeats,
+            params.score_floor, params.span_bonus, params.bias())
+    else:
+        final_choices, start_pos = _reduced_precision_dp(
+            beat_chroma, beat_bass, downbeat, weight, max_prev, max_downbeats, precision)
+    if as_timeline:
+        starts, ends, chords = backtrack_segments(final_choices, start_pos)
+        return ChordTimeline.from_arrays(
+            starts.astype(np.int64) + offset, ends.astype(np.int64) + offset, chords, tempo_map)
     result = []
     end = n_frame - 1
     chord_names = CHORD_CONFIG['name']
     chord_pitches = CHORD_CONFIG['pitch']
-    while end > 0:
+    while end >= 0:
         start = start_pos[end] + 1
         choice = final_choices[end]
         name = chord_names[choice]
         if len(result) > 0 and result[-1][2] == name:
             result[-1][0] = start
+            if with_confidence:
+                result[-1][4] = min(result[-1][4], margin[end])
+                result[-1][5] += potential[end]
         else:
-            pitch = chord_pitches[choice] if choice != -1 else []
+            pitch = list(chord_pitches[choice]) if choice != -1 else []
             result.append([start, end, name, pitch])
+            if with_confidence:
+                result[-1] += [margin[end], potential[end]]
         end = start - 1
 
-    return pd.DataFrame(result[::-1], columns=['start', 'end', 'name', 'pitch'])
+    if with_confidence:
+        for segment in result:
+            start, end = segment[0], segment[1]
+            segment[5] = np.exp(min(alpha[start] + segment[5] + beta[end + 1] - alpha[n_frame], 0.))
+        df = pd.DataFrame(result[::-1], columns=['start', 'end', 'name', 'pitch', 'margin', 'posterior'])
+    else:
+        df = pd.DataFrame(result[::-1], columns=['start', 'end', 'name', 'pitch'])
+    if offset:
+        df['start'] += offset
+        df['end'] += offset
+    if tempo_map is not None:
+        df['start_sec'] = tempo_map.beats_to_seconds(df['start'].to_numpy())
+        df['end_sec'] = tempo_map.beats_to_seconds(df['end'].to_numpy() + 1)
+    return df
+
+
+def segments_to_frame(segments: np.ndarray, tempo_map: Optional[TempoMap] = None, offset: int = 0) -> pd.DataFrame:
+    """
+    将 segment_type 的和弦片段转换为与 decode_chords 相同格式的 DataFrame
+
+    :param segments: dtype 为 segment_type
+    :param tempo_map: 见 decode_chords
+    :param offset: 见 decode_chords
+    """
+    return ChordTimeline.from_segments(segments, offset, tempo_map).to_frame()
+
+
+class ChunkedDecoder:
+    """
+    分块解码，按时间顺序逐块输入特征，内存开销与块的大小有关，与曲目的长度无关，结果与 decode_chords 完全相同
+
+    * 块与块之间延续最后 max_prev 拍的前缀和与累计得分，定点的前缀和没有舍入误差，区间特征与一次性计算时逐位相同
+    * 所有可能的后续路径的回溯在某一拍汇合后，该拍之前的和弦片段即已确定，随即输出并释放对应的回溯信息
+    * 相邻的相同和弦会被合并，因此最后一个已确定的片段会保留到下一个不同的和弦出现或 flush() 时才输出
+    """
+
+    def __init__(self, time_signatures: List[TimeSignature], offset: int = 0,
+                 max_prev: int = MAX_PREV, max_downbeats: int = 1, params: Optional[DecodeParams] = None):
+        """
+        :param time_signatures: 拍号序列，可以为空
+        :param offset: 第一块特征的第一拍对应的绝对拍数，见 decode_chords
+        :param max_prev: 见 score_dp
+        :param max_downbeats: 见 score_dp
+        :param params: 见 decode_chords
+        """
+        assert max_prev > 0 and max_downbeats > 0, "max_prev and max_downbeats should be positive!"
+        self.params = _DEFAULT_PARAMS if params is None else params
+        self._bias = self.params.bias()
+        self.time_signatures = time_signatures
+        self.offset = offset
+        self.max_prev = max_prev
+        self.max_downbeats = max_downbeats
+        self.n_frame = 0  # 已输入的拍数
+        self.committed = 0  # 第一个和弦尚未确定的拍
+        self._prefix_chroma = np.zeros((1, 12), dtype=np.int64)  # 最后 max_prev 拍以及之前一拍的前缀和，见 prefix_sum
+        self._prefix_bass = np.zeros((1, 12), dtype=np.int64)
+        self._cum_scores = np.zeros(0)
+        self._choices = np.zeros(0, dtype=np.int32)  # [committed, n_frame) 的回溯信息，start_pos 为绝对位置
+        self._start_pos = np.zeros(0, dtype=np.int64)
+        self._last = None  # 已确定但可能与后续片段合并的最后一个片段
+
+    @staticmethod
+    def _extend_prefix(carried: np.ndarray, beat_feature: np.ndarray) -> np.ndarray:
+        prefix = np.empty((len(carried) + len(beat_feature), carried.shape[1]), dtype=np.int64)
+        prefix[:len(carried) - 1] = carried[:-1]
+        np.cumsum(np.concatenate([carried[-1:], fixed_features(beat_feature)]), axis=0, out=prefix[len(carried) - 1:])
+        return prefix
+
+    def feed(self, beat_chroma: np.ndarray, beat_bass: np.ndarray) -> np.ndarray:
+        """
+        输入下一块特征
+
+        :param beat_chroma: shape 为 [n, 12]，见 decode_chords
+        :param beat_bass: shape 为 [n, 12]，见 decode_chords
+        :return: 新确定的和弦片段，dtype 为 segment_type，时间为相对第一块第一拍的拍数
+        """
+        n_carried = len(self._cum_scores)
+        base = self.n_frame - n_carried
+        prefix_chroma = self._extend_prefix(self._prefix_chroma, beat_chroma)
+        prefix_bass = self._extend_prefix(self._prefix_bass, beat_bass)
+        n_local = len(prefix_chroma) - 1
+        downbeat, weight = downbeat_and_score_weight(
+            n_local, self.time_signatures, self.offset + base, self.params.beat_weights)
+        final_choices = np.zeros(n_local, dtype=np.int32)
+        start_pos = np.zeros(n_local, dtype=np.int32)
+        cum_scores = np.full(n_local, -np.inf)
+        cum_scores[:n_carried] = self._cum_scores
+        _resume_dp(prefix_chroma, prefix_bass, downbeat, weight, self.max_prev, self.max_downbeats,
+                   final_choices, start_pos, cum_scores, n_carried, base == 0,
+                   self.params.score_floor, self.params.span_bonus, self._bias)
+
+        self.n_frame += len(beat_chroma)
+        self._choices = np.concatenate([self._choices, final_choices[n_carried:]])
+        self._start_pos = np.concatenate([self._start_pos, start_pos[n_carried:].astype(np.int64) + base])
+        n_keep = min(self.max_prev, self.n_frame)
+        self._prefix_chroma = prefix_chroma[n_local - n_keep:]
+        self._prefix_bass = prefix_bass[n_local - n_keep:]
+        self._cum_scores = cum_scores[n_local - n_keep:]
+
+        # 后续的和弦区间最多向前延伸 max_prev 拍，其前一个片段必然结束于最后 max_prev 拍之一（包括 -1，即曲目开头）
+        lowest_end = self.n_frame - self.max_prev
+        if lowest_end < self.committed:
+            return np.empty(0, dtype=segment_type)
+        common = None
+        for end in range(lowest_end, self.n_frame):
+            chain = set()
+            while end >= self.committed:
+                chain.add(end)
+                end = self._start_pos[end - self.committed]
+            common = chain if common is None else common & chain
+        if not common:
+            return np.empty(0, dtype=segment_type)
+        return self._commit(max(common), final=False)
+
+    def flush(self) -> np.ndarray:
+        """
+        所有特征输入完毕后调用，返回剩余的和弦片段
+        """
+        if self.n_frame == self.committed:
+            segments = [] if self._last is None else [self._last]
+            self._last = None
+            return np.array(segments, dtype=segment_type)
+        return self._commit(self.n_frame - 1, final=True)
+
+    def _commit(self, end: int, final: bool) -> np.ndarray:
+        """
+        回溯并输出以 end 结尾及其之前的所有和弦片段
+        """
+        segments = []
+        cursor = end
+        while cursor >= self.committed:
+            start = int(self._start_pos[cursor - self.committed]) + 1
+            segments.append((start, cursor, int(self._choices[cursor - self.committed])))
+            cursor = start - 1
+        segments.reverse()
+        n_drop = end + 1 - self.committed
+        self._choices = self._choices[n_drop:]
+        self._start_pos = self._start_pos[n_drop:]
+        self.committed = end + 1
+
+        merged = [] if self._last is None else [self._last]
+        for segment in segments:
+            if len(merged) > 0 and merged[-1][2] == segment[2]:
+                merged[-1] = (merged[-1][0], segment[1], segment[2])
+            else:
+                merged.append(segment)
+        self._last = None if final else merged.pop()
+        return np.array(merged, dtype=segment_type)
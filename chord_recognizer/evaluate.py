@@ -0,0 +1,241 @@
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .config import CHORD_CONFIG
+from .decode import DecodeParams, sweep_decode, MAX_PREV
+from .feature import extract_chord_features
+from .main import recognize_chords, load_sequence
+
+_ROOTS = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+_DEGREES = [0, 2, 4, 5, 7, 9, 11]  # 大调音阶中 1 ~ 7 级相对根音的半音数
+_CHORD_PATTERN = re.compile(r"^([A-G])([#b]*):([^/]+)(?:/([#b]*)(\d+))?$")
+# CHORD_CONFIG 中根音为 C 的原位和弦，quality -> chroma
+_QUALITY_CHROMA = {
+    name.split(":")[1]: chroma
+    for name, chroma in zip(CHORD_CONFIG['name'], CHORD_CONFIG['chroma'])
+    if name.startswith("C:") and "/" not in name
+}
+MAJ, MIN, OTHER, NO_CHORD = 0, 1, -1, 2
+METRICS = ['root', 'majmin', 'inversion', 'overlap', 'over_seg', 'under_seg', 'segmentation']
+# numba 的 tbb 线程池不能在 fork 之后继续使用，调用过 parallel kernel 的进程直接 fork 会在退出时卡死，
+# 因此进程池由 forkserver（不支持时为 spawn）启动
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+@lru_cache(maxsize=None)
+def parse_chord(name: str) -> Tuple[int, int, int, int]:
+    """
+    解析和弦名，格式与 CHORD_CONFIG['name'] 相同，例如 "C:maj", "Eb:min7/b7", "N"，根音可以使用任意的升降号
+
+    :param name: 和弦名
+    :return: 根音的音级、低音的音级、大小三和弦的类别（MAJ, MIN, OTHER, NO_CHORD）、和弦包含的音级的 12位掩码，
+        N 的根音与低音为 -1
+    """
+    if name == "N":
+        return -1, -1, NO_CHORD, 0
+    match = _CHORD_PATTERN.match(name)
+    assert match is not None and match.group(3) in _QUALITY_CHROMA, f"can not parse the chord: {name}!"
+    letter, accidentals, quality, bass_accidentals, degree = match.groups()
+    root = (_ROOTS[letter] + accidentals.count("#") - accidentals.count("b")) % 12
+    chroma = np.roll(_QUALITY_CHROMA[quality], root)
+    bass = root
+    if degree is not None:
+        degree = int(degree)
+        assert 1 <= degree <= 13, f"can not parse the chord: {name}!"
+        interval = _DEGREES[(degree - 1) % 7] + bass_accidentals.count("#") - bass_accidentals.count("b")
+        bass = (root + interval) % 12
+    if chroma[(root + 7) % 12] and chroma[(root + 4) % 12] and not chroma[(root + 3) % 12]:
+        majmin = MAJ
+    elif chroma[(root + 7) % 12] and chroma[(root + 3) % 12] and not chroma[(root + 4) % 12]:
+        majmin = MIN
+    else:
+        majmin = OTHER
+    mask = int(np.dot(chroma != 0, 1 << np.arange(12))) | (1 << bass)
+    return root, bass, majmin, mask
+
+
+def load_reference(file: str) -> pd.DataFrame:
+    """
+    读取参考标注，格式与 recognize_chords 的输出相同，至少包含 start, end, name 三列，end 为闭区间，时间单位为 1拍
+
+    :param file: csv 文件路径
+    """
+    return pd.read_csv(file, usecols=['start', 'end', 'name'])
+
+
+def frame_codes(chords: pd.DataFrame, n_frame: int, resolution: float = 1.) -> np.ndarray:
+    """
+    将和弦片段对齐到统一的帧网格上，每一帧取其中点所在的片段，片段 [start, end] 覆盖 [start, end + 1) 拍
+
+    :param chords: 包含 start, end, name 的 DataFrame，时间单位为 1拍
+    :param n_frame: 帧数
+    :param resolution: 帧的长度，单位为 1拍
+    :return: shape 为 [n_frame, 4] 的 int64 数组，每一列依次为 parse_chord 的结果，没有被覆盖的帧为 N
+    """
+    codes = np.array([parse_chord("N")] * n_frame, dtype=np.int64).reshape(n_frame, 4)
+    if len(chords) == 0:
+        return codes
+    order = np.argsort(chords['start'].to_numpy(), kind="stable")
+    starts = chords['start'].to_numpy(dtype=np.float64)[order]
+    ends = chords['end'].to_numpy(dtype=np.float64)[order] + 1
+    names, inverse = np.unique(chords['name'].to_numpy()[order].astype(str), return_inverse=True)
+    table = np.array([parse_chord(name) for name in names], dtype=np.int64).reshape(len(names), 4)
+
+    centers = (np.arange(n_frame) + 0.5) * resolution
+    index = np.searchsorted(starts, centers, side="right") - 1
+    covered = index >= 0
+    covered[covered] = centers[covered] < ends[index[covered]]
+    codes[covered] = table[inverse[index[covered]]]
+    return codes
+
+
+def _popcount(mask: np.ndarray) -> np.ndarray:
+    return ((mask[..., None] >> np.arange(12)) & 1).sum(axis=-1)
+
+
+def _segment_score(ref_id: np.ndarray, est_id: np.ndarray) -> float:
+    """
+    每个 ref 片段与 est 片段的最大重叠帧数之和占总帧数的比例，1 表示每个 ref 片段都完整地落在某一个 est 片段内
+    """
+    n_est = est_id[-1] + 1
+    pairs, overlap = np.unique(ref_id * n_est + est_id, return_counts=True)
+    best = np.zeros(ref_id[-1] + 1, dtype=np.int64)
+    np.maximum.at(best, pairs // n_est, overlap)
+    return best.sum() / len(ref_id)
+
+
+def evaluate(estimated: pd.DataFrame, reference: pd.DataFrame, resolution: float = 1.) -> Dict[str, float]:
+    """
+    在统一的帧网格上对比识别结果与参考标注
+
+    * root：根音相同的帧的比例，N 与 N 视为相同
+    * majmin：只统计参考标注为大三、小三和弦或者 N 的帧，根音与大小三和弦的类别都相同的比例
+    * inversion：与 majmin 统计相同的帧，额外要求低音相同
+    * overlap：每一帧和弦所包含音级的 Jaccard 相似度的平均值，两者都为 N 时为 1
+    * over_seg, under_seg：按和弦名变化划分片段后，ref（est）片段与 est（ref）片段最大重叠之和的比例，
+        over_seg 低说明识别结果切分过细，under_seg 低说明切分过粗；segmentation 为两者的最小值
+
+    :param estimated: recognize_chords 的输出，或者具有 start, end, name 三列的 DataFrame
+    :param reference: 参考标注，见 load_reference
+    :param resolution: 帧的长度，单位为 1拍
+    :return: 各项指标，以及帧数 n_frame 与 majmin 统计的帧数 n_majmin
+    """
+    end = max(
+        (float(df['end'].max()) + 1 for df in (estimated, reference) if len(df) > 0), default=0.)
+    n_frame = int(np.ceil(end / resolution))
+    if n_frame == 0:
+        return {'n_frame': 0, 'n_majmin': 0, **{metric: np.nan for metric in METRICS}}
+    est = frame_codes(estimated, n_frame, resolution)
+    ref = frame_codes(reference, n_frame, resolution)
+
+    root_eq = est[:, 0] == ref[:, 0]
+    majmin_eq = root_eq & (est[:, 2] == ref[:, 2])
+    inversion_eq = majmin_eq & (est[:, 1] == ref[:, 1])
+    majmin_mask = ref[:, 2] != OTHER
+    n_majmin = int(majmin_mask.sum())
+
+    union = _popcount(est[:, 3] | ref[:, 3])
+    jaccard = np.where(union > 0, _popcount(est[:, 3] & ref[:, 3]) / np.maximum(union, 1), 1.)
+
+    # 片段编号：和弦（根音、低音、掩码）发生变化时加一
+    est_id = np.concatenate([[0], np.cumsum(np.any(est[1:] != est[:-1], axis=1))])
+    ref_id = np.concatenate([[0], np.cumsum(np.any(ref[1:] != ref[:-1], axis=1))])
+    over_seg = _segment_score(ref_id, est_id)
+    under_seg = _segment_score(est_id, ref_id)
+    return {
+        'n_frame': n_frame,
+        'n_majmin': n_majmin,
+        'root': float(root_eq.mean()),
+        'majmin': float(majmin_eq[majmin_mask].mean()) if n_majmin else np.nan,
+        'inversion': float(inversion_eq[majmin_mask].mean()) if n_majmin else np.nan,
+        'overlap': float(jaccard.mean()),
+        'over_seg': float(over_seg),
+        'under_seg': float(under_seg),
+        'segmentation': float(min(over_seg, under_seg)),
+    }
+
+
+def _evaluate_file(file, reference, resolution: float, kwargs: dict) -> Dict[str, float]:
+    if isinstance(reference, str):
+        reference = load_reference(reference)
+    return evaluate(recognize_chords(file, **kwargs), reference, resolution)
+
+
+def evaluate_corpus(
+        files: Iterable, references: Iterable[Union[str, pd.DataFrame]], n_jobs: int = 1,
+        resolution: float = 1., **kwargs) -> pd.DataFrame:
+    """
+    对一批曲目运行 recognize_chords 并与参考标注对比，可以使用多个进程并行
+
+    :param files: recognize_chords 支持的输入，使用多进程时需要可以被 pickle，例如文件路径
+    :param references: 与 files 一一对应的参考标注，csv 文件路径或者 DataFrame
+    :param n_jobs: 进程数，为 1 时在当前进程中运行
+    :param resolution: 帧的长度，单位为 1拍
+    :param kwargs: 传递给 recognize_chords 的参数
+    :return: 每首曲目一行，列与 evaluate 的返回值相同，见 summarize
+    """
+    files, references = list(files), list(references)
+    assert len(files) == len(references), "files and references should have the same length!"
+    n = len(files)
+    if n_jobs == 1:
+        rows = list(map(_evaluate_file, files, references, [resolution] * n, [kwargs] * n))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=_MP_CONTEXT) as executor:
+            rows = list(executor.map(
+                _evaluate_file, files, references, [resolution] * n, [kwargs] * n,
+                chunksize=max(1, n // (n_jobs * 4))))
+    return pd.DataFrame(rows, columns=['n_frame', 'n_majmin', *METRICS])
+
+
+def evaluate_sweep(
+        file, reference: Union[str, pd.DataFrame], param_sets: List[DecodeParams], note_precision: float = 0.25,
+        resolution: float = 1., max_prev: int = MAX_PREV, max_downbeats: int = 1) -> pd.DataFrame:
+    """
+    用多组解码常数识别同一首曲目并逐组评估，特征只提取一次，解码见 decode.sweep_decode
+
+    :param file: recognize_chords 支持的输入
+    :param reference: 参考标注，csv 文件路径或者 DataFrame
+    :param param_sets: 解码常数，见 decode.param_grid
+    :param note_precision: 见 recognize_chords
+    :param resolution: 帧的长度，单位为 1拍
+    :param max_prev: 见 decode.score_dp
+    :param max_downbeats: 见 decode.score_dp
+    :return: 每组常数一行，包含 DecodeParams 的各个字段与 evaluate 的各项指标，可以按指标排序选出最佳参数
+    """
+    if isinstance(reference, str):
+        reference = load_reference(reference)
+    s = load_sequence(file)
+    chroma, bass = extract_chord_features(s.track, note_precision)
+    results = sweep_decode(chroma, bass, s.timeSignature, param_sets, max_prev=max_prev, max_downbeats=max_downbeats)
+    return pd.DataFrame([
+        {**asdict(params), **evaluate(estimated, reference, resolution)}
+        for params, estimated in zip(param_sets, results)
+    ])
+
+
+def summarize(results: pd.DataFrame, baseline: Optional[pd.DataFrame] = None) -> pd.Series:
+    """
+    将 evaluate_corpus 的结果按帧数加权平均，majmin 与 inversion 按 n_majmin 加权
+
+    :param results: evaluate_corpus 的返回值
+    :param baseline: 可选，另一次 evaluate_corpus 的结果，例如修改前的版本，给出时返回两者汇总指标的差
+    :return: 各项指标的汇总值
+    """
+    summary = {}
+    for metric in METRICS:
+        weight = results['n_majmin' if metric in ('majmin', 'inversion') else 'n_frame']
+        valid = results[metric].notna() & (weight > 0)
+        summary[metric] = float(np.average(results[metric][valid], weights=weight[valid])) \
+            if valid.any() else np.nan
+    summary = pd.Series(summary)
+    if baseline is not None:
+        return summary - summarize(baseline)
+    return summary
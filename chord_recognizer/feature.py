@@ -1,5 +1,6 @@
-from typing import List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple, Union
 import numpy as np
+from numba import njit
 
 from .util import Note, Track
 
@@ -9,6 +10,12 @@ note_type = np.dtype([
     ('end', np.uint32)
 ])
 
+note_time_type = np.dtype([
+    ('pitch', np.uint8),
+    ('start', np.float64),
+    ('end', np.float64)
+])
+
 
 def to_note_arr(notes: List[Note], precision: float) -> np.ndarray:
     return np.fromiter(
@@ -22,6 +29,70 @@ def to_note_arr(notes: List[Note], precision: float) -> np.ndarray:
     )
 
 
+def to_sorted_note_time_arr(notes: List[Note]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: 按照 start 升序排列的 note_time_type 数组，以及排序所用的下标
+    """
+    note_arr = np.fromiter(
+        ((n.pitch, n.start, n.start + n.duration) for n in notes),
+        dtype=note_time_type, count=len(notes)
+    )
+    order = np.argsort(note_arr['start'], kind='stable')
+    return note_arr[order], order
+
+
+def build_track_index(tracks: List[Track]) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    为每个 Track 构建按 start 排序的 note 数组，可以在多次调用 slice_tracks() 时复用
+
+    :return: 每个 Track 的 (note_arr, order, reach)，note_arr 与 order 见 to_sorted_note_time_arr()，
+        reach[i] 为前 i + 1 个 note 的 end 的最大值，单调不减
+    """
+    index = []
+    for track in tracks:
+        note_arr, order = to_sorted_note_time_arr(track.note)
+        index.append((note_arr, order, np.maximum.accumulate(note_arr['end'])))
+    return index
+
+
+def slice_tracks(
+        tracks: List[Track], start: float, end: float,
+        index: Optional[List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = None) -> List[Track]:
+    """
+    截取所有 Track 中与 [start, end) 重叠的 note，裁剪到该范围内，并将时间平移到以 start 为 0
+
+    * 使用按 start 排序的数组与 np.searchsorted 定位候选 note，只为范围内的 note 创建对象
+    * reach 之前的 note 都在 start 之前结束，因此从 reach 首次超过 start 的位置开始，不会漏掉跨越 start 的长音；
+      传入 index 时不需要遍历整个 Track，开销与 reach 超过 start 之后、end 之前开始的 note 数量成正比，
+      通常只比范围内的 note 略多
+
+    :param tracks: parse.sequence 中 Track 类的列表
+    :param start: 范围的起点，单位为1拍
+    :param end: 范围的终点（不包含），单位为1拍
+    :param index: 可选，由 build_track_index() 得到，多次查询同一组 Track 时传入以避免重复排序
+    :return: 新的 Track 列表，note 为裁剪后的副本，meta 等信息与原 Track 共享
+    """
+    if index is None:
+        index = build_track_index(tracks)
+    result = []
+    for track, (note_arr, order, reach) in zip(tracks, index):
+        lo = np.searchsorted(reach, start, side='right')
+        hi = np.searchsorted(note_arr['start'], end, side='left')
+        candidate = np.arange(lo, hi)
+        candidate = candidate[note_arr['end'][lo: hi] > start]
+        notes = []
+        for i in candidate:
+            note = track.note[order[i]]
+            note_start = max(note_arr['start'][i], start)
+            note_end = min(note_arr['end'][i], end)
+            notes.append(Note(note.pitch, note_start - start, note_end - note_start, note.attribute))
+        result.append(Track(
+            instrumentID=track.instrumentID, meta=track.meta, note=notes,
+            pitchBend=track.pitchBend, volume=track.volume
+        ))
+    return result
+
+
 def get_abs_pianoroll(note_arr: np.ndarray, end: Optional[int] = None):
     time_len = note_arr['end'][-1] if not end else end
     count = np.zeros((12, time_len), dtype=np.uint8)
@@ -54,50 +125,386 @@ def get_track_weight(abs_pianoroll: List, bass: List):
         nonempty_rate = len(b) / total_len
         bass_mean.append(b.mean() if nonempty_rate > 0.2 else 128)
 
+    return weight_from_stats(thickness_mean, bass_mean)
+
+
+def weight_from_stats(thickness_mean, bass_mean) -> np.ndarray:
+    """
+    根据每个 track 的平均厚度（同时发声的音级数）与平均低音，计算 track 的权重，最低的 track 权重为 1
+    """
     weight = 1 - np.exp(0.95 - np.array(thickness_mean))
     weight /= weight.max()
     weight[np.argmin(bass_mean)] = 1
     return weight
 
 
-def extract_chord_features(tracks: List[Track], note_precision: float = 0.25) -> Tuple[np.ndarray, np.ndarray]:
+def quantize_times(times: np.ndarray, note_precision: Union[None, float, Sequence[float]]) -> np.ndarray:
+    """
+    将时间对齐到最近的网格点上，支持任意精度以及多个网格的混合
+
+    :param times: 任意 shape 的数组，单位为1拍
+    :param note_precision: 网格的精度，单位为1拍，例如 1/3 对应三连音；
+        为多个精度时，对齐到所有网格的并集中最近的点，例如 (1/4, 1/6)；为 None 时不量化
+    """
+    if note_precision is None:
+        return times
+    precisions = np.atleast_1d(np.asarray(note_precision, dtype=np.float64))
+    assert np.all(precisions > 0), f"note_precision: {note_precision} is invalid!"
+    candidates = np.floor(times[..., None] / precisions + 0.5) * precisions
+    best = np.abs(candidates - times[..., None]).argmin(axis=-1)
+    return np.take_along_axis(candidates, best[..., None], axis=-1)[..., 0]
+
+
+def to_event_note_arr(notes: List[Note], note_precision: Union[None, float, Sequence[float]]) -> np.ndarray:
+    """
+    :return: 量化后的 note_time_type 数组，时间单位为1拍，不包含时长为 0 的 note
+    """
+    note_arr = np.fromiter(
+        ((n.pitch, n.start, n.start + n.duration) for n in notes),
+        dtype=note_time_type, count=len(notes)
+    )
+    note_arr['start'] = np.maximum(quantize_times(note_arr['start'], note_precision), 0)
+    note_arr['end'] = quantize_times(note_arr['end'], note_precision)
+    return note_arr[note_arr['end'] > note_arr['start']]
+
+
+@njit(cache=True, nogil=True)
+def _find_unpainted(next_pos, k):
+    root = k
+    while next_pos[root] != root:
+        root = next_pos[root]
+    while next_pos[k] != root:  # 路径压缩
+        next_pos[k], k = root, next_pos[k]
+    return root
+
+
+@njit(cache=True, nogil=True)
+def lowest_pitch(pitch, start_index, end_index, n_interval):
+    """
+    求每个基本区间内最低的发声音高，note 需要按照 pitch 升序排列。
+    按音高从低到高依次填充区间，已填充的区间用并查集跳过，总复杂度近似为 O(n_note + n_interval)
+
+    :return: shape 为 [n_interval]，没有 note 的区间为 128
+    """
+    lowest = np.full(n_interval, 128, dtype=np.uint8)
+    next_pos = np.arange(n_interval + 1)
+    for n in range(len(pitch)):
+        k = _find_unpainted(next_pos, start_index[n])
+        while k < end_index[n]:
+            lowest[k] = pitch[n]
+            next_pos[k] = k + 1
+            k = _find_unpainted(next_pos, k + 1)
+    return lowest
+
+
+def _elementary_intervals(note_arr: np.ndarray, n_beat: int):
+    """
+    以所有 note 的起止时间以及每一拍的边界划分基本区间，每个基本区间都落在某一拍之内
+
+    :return: 区间边界 times，每个 note 覆盖的区间下标范围 [start_index, end_index)
+    """
+    times = np.unique(np.concatenate([note_arr['start'], note_arr['end'], np.arange(n_beat + 1)]))
+    times = times[times <= n_beat]
+    start_index = np.searchsorted(times, note_arr['start'])
+    end_index = np.searchsorted(times, np.minimum(note_arr['end'], n_beat))
+    return times, start_index, end_index
+
+
+def _per_beat_sum(times: np.ndarray, values: np.ndarray, n_beat: int) -> np.ndarray:
+    """
+    :param values: shape 为 [n_interval, 12]，每个基本区间内每个音级是否发声
+    :return: shape 为 [n_beat, 12]，每一拍内每个音级的发声时长
+    """
+    beat = times[:-1].astype(np.int64)
+    duration = np.diff(times)
+    result = np.zeros((n_beat, 12))
+    for k in range(12):
+        result[:, k] = np.bincount(beat, weights=values[:, k] * duration, minlength=n_beat)
+    return result
+
+
+def _track_events(note_arr: np.ndarray, n_beat: int):
+    """
+    基于事件统计单个 track 的每拍 chroma、平均厚度与平均低音，与 get_abs_pianoroll, get_bass 以及 get_track_weight 等价
+    """
+    times, active, thickness_mean, bass_mean = _track_activity(note_arr, n_beat)
+    return _per_beat_sum(times, active, n_beat), thickness_mean, bass_mean
+
+
+def _track_activity(note_arr: np.ndarray, n_beat: int):
+    """
+    :return: 基本区间的边界 times，每个基本区间内每个音级是否发声 active，以及 track 的平均厚度与平均低音
+    """
+    times, start_index, end_index = _elementary_intervals(note_arr, n_beat)
+    n_interval = len(times) - 1
+    duration = np.diff(times)
+
+    diff = np.zeros((n_interval + 1, 12), dtype=np.int32)
+    pitch_names = note_arr['pitch'] % 12
+    np.add.at(diff, (start_index, pitch_names), 1)
+    np.add.at(diff, (end_index, pitch_names), -1)
+    active = np.cumsum(diff[:-1], axis=0) > 0
+
+    thickness = active.sum(axis=1)
+    sounding = thickness > 0
+    thickness_mean = (thickness * duration).sum() / duration[sounding].sum() if sounding.any() else 0
+
+    order = np.argsort(note_arr['pitch'], kind='stable')
+    lowest = lowest_pitch(note_arr['pitch'][order], start_index[order], end_index[order], n_interval)
+    nonempty = lowest < 128
+    nonempty_rate = duration[nonempty].sum() / n_beat
+    bass_mean = (lowest * duration)[nonempty].sum() / duration[nonempty].sum() if nonempty_rate > 0.2 else 128
+    return times, active, thickness_mean, bass_mean
+
+
+def _is_grid_precision(note_precision) -> bool:
+    # 只有默认精度 0.25 使用网格上的实现（与原实现逐位相同），其余精度（包括 1/3、1/6）均使用基于事件的实现
+    return isinstance(note_precision, (int, float)) and note_precision == 0.25
+
+
+def _clip_note_end(note_arr: np.ndarray, end) -> np.ndarray:
+    """
+    :return: 裁剪到 end 之前的 note，完全在 end 之后的 note 被丢弃，保证传入 lowest_pitch 的区间下标不越界
+    """
+    note_arr = note_arr[note_arr['start'] < end]
+    note_arr['end'] = np.minimum(note_arr['end'], end)
+    return note_arr
+
+
+def _chord_track_index(tracks: List[Track]) -> List[int]:
+    """
+    :return: 参与和弦识别的（非打击乐器）track 的下标
+    """
+    return [i for i, track in enumerate(tracks) if track.meta.get('is_drum', False) == 'False']
+
+
+@njit(cache=True, nogil=True)
+def _thickness_sums(pitch_names, start, end):
+    """
+    一次扫描求得每个音级发声区间的并集长度之和，以及所有 note 的并集长度，即 pianoroll 中厚度的总和与非空的帧数
+    """
+    covered = np.full(13, -1, dtype=np.int64)  # 每个音级以及所有音级已覆盖到的位置
+    total = np.zeros(13, dtype=np.int64)
+    for k in np.argsort(start, kind='mergesort'):
+        for c in (pitch_names[k], 12):
+            lo = max(start[k], covered[c])
+            if end[k] > lo:
+                total[c] += end[k] - lo
+                covered[c] = end[k]
+    return total[:12].sum(), total[12]
+
+
+def _grid_lowest(note_arr: np.ndarray, global_end: int, boundaries: np.ndarray):
+    """
+    :param boundaries: 额外的区间边界，例如每一拍的边界
+    :return: 基本区间的边界 times，以及每个基本区间内最低的发声音高
+    """
+    start = note_arr['start'].astype(np.int64)
+    end = np.minimum(note_arr['end'], global_end).astype(np.int64)
+    times = np.unique(np.concatenate([start, end, boundaries]))
+    times = times[(times >= 0) & (times <= global_end)]
+    order = np.argsort(note_arr['pitch'], kind='stable')
+    lowest = lowest_pitch(
+        note_arr['pitch'][order], np.searchsorted(times, start[order]), np.searchsorted(times, end[order]),
+        len(times) - 1)
+    return times, lowest
+
+
+def _grid_track_stats(note_arr: np.ndarray, global_end: int):
+    """
+    不展开 pianoroll，由网格上的 note 区间直接求得与 get_track_weight 完全相同的平均厚度与平均低音，内存开销只与 note 数量有关
+    """
+    start = note_arr['start'].astype(np.int64)
+    end = np.minimum(note_arr['end'], global_end).astype(np.int64)
+    thickness_sum, n_sounding = _thickness_sums((note_arr['pitch'] % 12).astype(np.int64), start, end)
+    thickness_mean = thickness_sum / n_sounding if n_sounding > 0 else 0
+
+    times, lowest = _grid_lowest(note_arr, global_end, np.array([0, global_end]))
+    duration = np.diff(times)
+    nonempty = lowest < 128
+    n_nonempty = duration[nonempty].sum()
+    bass_mean = (lowest.astype(np.int64) * duration)[nonempty].sum() / n_nonempty \
+        if n_nonempty / global_end > 0.2 else 128
+    return thickness_mean, bass_mean
+
+
+def _grid_bass_chroma(note_arr: np.ndarray, global_end: int, chord_window: int) -> np.ndarray:
+    """
+    由所有 track 的 note 求得每一拍的 bass 特征，与对 get_bass 的结果按窗口求和相同，不需要逐帧的数组
+
+    :return: shape 为 [global_end // chord_window, 12]
+    """
+    times, lowest = _grid_lowest(note_arr, global_end, np.arange(0, global_end + 1, chord_window))
+    nonempty = lowest < 128
+    beat = times[:-1][nonempty] // chord_window
+    duration = np.diff(times)[nonempty].astype(np.float64)
+    n_beat = global_end // chord_window
+    count = np.bincount(beat * 12 + lowest[nonempty] % 12, weights=duration, minlength=n_beat * 12)
+    return count.reshape(n_beat, 12) / chord_window
+
+
+def count_beats(tracks: List[Track], note_precision: Union[None, float, Sequence[float]] = 0.25) -> int:
+    """
+    :return: 不指定 n_beat 时，extract_chord_features 输出特征的拍数
+    """
+    index = _chord_track_index(tracks)
+    if _is_grid_precision(note_precision):
+        chord_window = int(1 / note_precision)
+        ends = [to_note_arr(tracks[i].note, note_precision)['end'] for i in index]
+        return max((int(end.max()) // chord_window + 1 for end in ends if len(end) > 0), default=0)
+    ends = [to_event_note_arr(tracks[i].note, note_precision)['end'] for i in index]
+    return int(max((end.max() for end in ends if len(end) > 0), default=0)) + 1
+
+
+def track_weights(
+        tracks: List[Track], note_precision: Union[None, float, Sequence[float]] = 0.25,
+        n_beat: Optional[int] = None
+) -> np.ndarray:
+    """
+    计算与 extract_chord_features 相同的 track 权重，不展开 pianoroll。
+    分块提取特征时，先对整首曲目计算权重，再传入每一块的 extract_chord_features，保证结果与一次性提取相同
+
+    :param tracks: parse.sequence 中 Track 类的列表
+    :param note_precision: 见 extract_chord_features
+    :param n_beat: 见 extract_chord_features
+    :return: shape 为 [len(tracks)]，打击乐器与空的 track 权重为 0
+    """
+    if n_beat is None:
+        n_beat = count_beats(tracks, note_precision)
+    result = np.zeros(len(tracks))
+    index = _chord_track_index(tracks)
+    if _is_grid_precision(note_precision):
+        global_end = n_beat * int(1 / note_precision)
+        note_arrs = [_clip_note_end(to_note_arr(tracks[i].note, note_precision), global_end) for i in index]
+        stats = [_grid_track_stats(note_arr, global_end) for note_arr in note_arrs if len(note_arr) > 0]
+    else:
+        note_arrs = [_clip_note_end(to_event_note_arr(tracks[i].note, note_precision), n_beat) for i in index]
+        stats = [_track_activity(note_arr, n_beat)[2:] for note_arr in note_arrs if len(note_arr) > 0]
+    index = [i for i, note_arr in zip(index, note_arrs) if len(note_arr) > 0]
+    if len(index) > 0:
+        result[index] = weight_from_stats(*zip(*stats))
+    return result
+
+
+def extract_chord_features_event(
+        tracks: List[Track], note_precision: Union[None, float, Sequence[float]] = None,
+        n_beat: Optional[int] = None, track_weight: Optional[np.ndarray] = None, min_track_weight: float = 0.
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    基于事件的 extract_chord_features，不需要将 note 展开到网格上，时间与内存开销只与 note 数量和拍数有关，与网格精度无关
+
+    * note 的起止时间先对齐到 note_precision 的网格（支持三连音等任意精度以及多个网格的混合），再按实际时长统计
+    * 当 note_precision 为 1/n 时，结果与 extract_chord_features_grid 相同
+
+    :param tracks: parse.sequence 中 Track 类的列表，不能是打击乐器
+    :param note_precision: 见 quantize_times
+    :param n_beat: 见 extract_chord_features
+    :param track_weight: 见 extract_chord_features
+    :param min_track_weight: 见 extract_chord_features
+    :return: 返回和弦的pitch特征，以及bass特征，shape均为 [batch, 12]，数值均在 0~1 之间
+    """
+    index = _chord_track_index(tracks)
+    tracks = [to_event_note_arr(tracks[i].note, note_precision) for i in index]
+    if n_beat is not None:
+        tracks = [_clip_note_end(track, n_beat) for track in tracks]
+    index = [i for i, track in zip(index, tracks) if len(track) > 0]
+    tracks = [track for track in tracks if len(track) > 0]
+    if n_beat is None:
+        n_beat = int(max((track['end'].max() for track in tracks), default=0)) + 1
+    if len(tracks) == 0:
+        return np.zeros((n_beat, 12)), np.zeros((n_beat, 12))
+
+    if track_weight is None:
+        activity = [_track_activity(track, n_beat) for track in tracks]
+        weight = weight_from_stats(*zip(*(a[2:] for a in activity)))
+    else:
+        activity = [None] * len(tracks)
+        weight = np.asarray(track_weight)[index]
+    chroma = np.zeros((n_beat, 12))
+    for track, a, w in zip(tracks, activity, weight):
+        if w < min_track_weight:
+            continue
+        times, active = _track_activity(track, n_beat)[:2] if a is None else a[:2]
+        np.maximum(chroma, _per_beat_sum(times, active, n_beat) * w, out=chroma)
+
+    all_notes = np.concatenate(tracks)
+    times, start_index, end_index = _elementary_intervals(all_notes, n_beat)
+    order = np.argsort(all_notes['pitch'], kind='stable')
+    lowest = lowest_pitch(all_notes['pitch'][order], start_index[order], end_index[order], len(times) - 1)
+    bass_chroma = np.eye(12)[lowest % 12]
+    bass_chroma[lowest == 128] = 0
+    bass_chroma = _per_beat_sum(times, bass_chroma, n_beat)
+    return chroma, bass_chroma
+
+
+def extract_chord_features(
+        tracks: List[Track], note_precision: Union[None, float, Sequence[float]] = 0.25,
+        n_beat: Optional[int] = None, track_weight: Optional[np.ndarray] = None, min_track_weight: float = 0.
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     综合所有Track的信息，提取统一的和弦数值特征
 
+    * track 的权重由 note 数组直接统计，不需要展开 pianoroll，权重低于 min_track_weight 的 track 不会分配任何逐帧的数组
+    * 低音由所有 track 的 note 共同决定，不受 min_track_weight 的影响
+
     :param tracks: parse.sequence 中 Track 类的列表，不能是打击乐器
     :param note_precision: 在提取特征时，对 note 的时间相关参数进行量化的精度，单位为1拍，
-        例如 note_precision=0.25, start = 1.5 会被量化为 6
+        例如 note_precision=0.25, start = 1.5 会被量化为 6；
+        默认的 0.25 使用 extract_chord_features_grid，其余精度（包括三连音 1/3、1/6，多个精度例如 (1/4, 1/6) 以及 None）
+        使用 extract_chord_features_event
+    :param n_beat: 可选，固定输出特征的拍数，超出 n_beat 的 note 会被裁剪，通常由 slice_tracks() 截取范围内的 note
+    :param track_weight: 可选，shape 为 [len(tracks)]，由 track_weights() 得到，为空时由 tracks 自身统计
+    :param min_track_weight: 权重（最大为 1）低于该值的 track 不参与 pitch 特征的计算，默认为 0，即使用所有 track
     :return: 返回和弦的pitch特征，以及bass特征，shape均为 [batch, 12]，数值均在 0~1 之间
     """
-    assert int(1 / note_precision) == 1 / note_precision
+    if not _is_grid_precision(note_precision):
+        return extract_chord_features_event(tracks, note_precision, n_beat, track_weight, min_track_weight)
+    return extract_chord_features_grid(tracks, note_precision, n_beat, track_weight, min_track_weight)
+
+
+def extract_chord_features_grid(
+        tracks: List[Track], note_precision: float = 0.25,
+        n_beat: Optional[int] = None, track_weight: Optional[np.ndarray] = None, min_track_weight: float = 0.
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    基于网格的 extract_chord_features，note 的起止时间量化为网格上的整数帧，每拍 1/note_precision 帧
+
+    :param note_precision: 1/note_precision 需要为整数
+    :return: 见 extract_chord_features
+    """
+    assert int(1 / note_precision) == 1 / note_precision, f"note_precision: {note_precision} is not 1/n!"
     chord_window = int(1 / note_precision)
 
-    tracks = [
-        to_note_arr(
-            sorted(track.note, key=lambda note: -note.pitch),
-            note_precision
-        ) for track in tracks if track.meta.get('is_drum', False) == 'False'
-    ]  # 数组按照 note.pitch 排序降序排列
-    ends = (track['end'].max() for track in tracks)
-    global_end = max(ends)
-    global_end += chord_window - global_end % chord_window
-
-    # 统计每个 track 的稠密度和 低音
-    abs_pianoroll = [get_abs_pianoroll(track, global_end) for track in tracks]
-    bass = [get_bass(track, global_end) for track in tracks]
-    weight = get_track_weight(abs_pianoroll, bass)
+    index = _chord_track_index(tracks)
+    tracks = [to_note_arr(tracks[i].note, note_precision) for i in index]
+    if n_beat is not None:
+        tracks = [_clip_note_end(track, n_beat * chord_window) for track in tracks]
+    index = [i for i, track in zip(index, tracks) if len(track) > 0]
+    tracks = [track for track in tracks if len(track) > 0]
+    if n_beat is not None:
+        global_end = n_beat * chord_window
+        if len(tracks) == 0:
+            return np.zeros((n_beat, 12)), np.zeros((n_beat, 12))
+    else:
+        ends = (track['end'].max() for track in tracks)
+        global_end = max(ends)
+        global_end += chord_window - global_end % chord_window
+
+    # 统计每个 track 的稠密度和 低音，与 get_track_weight 相同
+    if track_weight is None:
+        weight = weight_from_stats(*zip(*(_grid_track_stats(track, global_end) for track in tracks)))
+    else:
+        weight = np.asarray(track_weight)[index]
 
     # 按照窗口切分，并求和，加权取极值
-    window_shape = (len(tracks), -1, chord_window, 12)
-    # [track, time, window, pitch_name] -> [track, time, pitch_name]
-    chroma = np.stack(abs_pianoroll).reshape(window_shape).sum(axis=-2) * (weight / chord_window).reshape(-1, 1, 1)
-    # [track, time, pitch_name] -> [time, pitch_name]
-    chroma = chroma.max(axis=0)
-
-    bass = np.min(bass, axis=0)
-    bass_mask = bass == 128
-    bass_chroma = np.eye(12)[bass % 12]
-    bass_chroma[bass_mask] = 0
-    # [time, window, pitch_name] -> [time, pitch_name]
-    bass_chroma = bass_chroma.reshape(-1, chord_window, 12).sum(axis=-2) / chord_window
+    chroma = np.zeros((global_end // chord_window, 12))
+    for track, w in zip(tracks, weight):
+        if w < min_track_weight:
+            continue
+        # [time, window, pitch_name] -> [time, pitch_name]
+        window_sum = get_abs_pianoroll(track, global_end).reshape(-1, chord_window, 12).sum(axis=-2)
+        np.maximum(chroma, window_sum * (w / chord_window), out=chroma)
+
+    # 所有 track 中最低的音
+    bass_chroma = _grid_bass_chroma(np.concatenate(tracks), global_end, chord_window)
     return chroma, bass_chroma
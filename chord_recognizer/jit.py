@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+from time import perf_counter
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numba
+from numba.extending import is_jitted
+
+# numba kernel 的编译缓存与预热：
+# * 包内所有 kernel 均以 cache=True 编译（_iter_kernels 依赖这一约定，不读取 numba 的私有属性），默认缓存在源码旁的
+#   __pycache__ 中；只读安装时由环境变量 CHORD_RECOGNIZER_CACHE_DIR 或者 configure_cache() 指定可写的目录
+# * 本模块在包的 __init__ 中最先导入，且不在模块级别导入任何 kernel，保证环境变量在 kernel 被装饰之前生效
+# * 预先编译（例如构建容器镜像时）：python -m chord_recognizer.jit --cache-dir DIR，运行时将 CHORD_RECOGNIZER_CACHE_DIR
+#   设为同一目录，首次调用直接从缓存加载，不再编译
+CACHE_DIR_ENV = "CHORD_RECOGNIZER_CACHE_DIR"
+
+
+def _iter_kernels() -> Iterator[Tuple[str, Any]]:
+    """
+    :return: 已导入的 chord_recognizer 模块中定义的所有 kernel 的名称与 dispatcher
+    """
+    seen = set()
+    for module_name, module in list(sys.modules.items()):
+        if module is None or not module_name.startswith(__package__ + "."):
+            continue
+        for name, value in vars(module).items():
+            if is_jitted(value) and id(value) not in seen and value.py_func.__module__ == module_name:
+                seen.add(id(value))
+                yield f"{module_name}.{name}", value
+
+
+def configure_cache(cache_dir: Optional[str]):
+    """
+    指定 kernel 的缓存目录，之后导入的 kernel 与已经导入的 kernel 都会使用该目录
+
+    * 已经编译的特化版本仍然保留在内存中，只有之后新编译或者加载的版本使用新的目录
+
+    :param cache_dir: 可写的目录，不存在时自动创建；为 None 时恢复 numba 的默认位置
+    """
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ["NUMBA_CACHE_DIR"] = cache_dir  # 子进程（例如 evaluate_corpus 的进程池）同样生效
+    else:
+        os.environ.pop("NUMBA_CACHE_DIR", None)
+    numba.config.CACHE_DIR = cache_dir or ""
+    for _, kernel in _iter_kernels():
+        kernel.enable_caching()
+
+
+def warmup(parallel: bool = True) -> Dict[str, int]:
+    """
+    编译（或者从缓存加载）所有 kernel，之后第一次识别的耗时与稳定状态相同
+
+    :param parallel: 是否同时编译 parallel=True 的多核 kernel（score_dp_parallel, score_dp_batch, sweep_dp 等）
+    :return: 每个 kernel 已经编译的特化版本数
+    """
+    from .decode import decode_chords_batch, sweep_decode, param_grid
+    from .feature import extract_chord_features
+    from .main import recognize_chords
+    from .score import chord_score, chord_score_batch, chord_score_circular_batch
+    from .session import RecognitionSession
+    from .util import Note, Sequence, Track, TimeSignature, GlobalChange
+
+    # 两个声部、4/4 与 3/4 拍、包含休止与三连音的合成曲目
+    low = Track(meta={'name': "bass", 'is_drum': "False"},
+                note=[Note(36 + p, 4 * k, 4) for k, p in enumerate([0, 5, 7, 0, 9, 5, 7, 0])])
+    high = Track(meta={'name': "chords", 'is_drum': "False"},
+                 note=[Note(60 + p + q, 4 * k + 1 / 3, 2) for k, p in enumerate([0, 5, 7, 0, 9, 5, 7])
+                       for q in (0, 4, 7)])
+    drum = Track(meta={'name': "drum", 'is_drum': "True"}, note=[Note(36, k, 0.25) for k in range(32)])
+    s = Sequence(track=[low, high, drum], timeSignature=[TimeSignature(0, 4, 4), TimeSignature(24, 3, 4)],
+                 qpm=[GlobalChange(0, 120)])
+
+    recognize_chords(s.to_midi().to_bytes())
+    recognize_chords(s.to_msf_bytes())
+    recognize_chords(s, note_precision=1 / 3)
+    recognize_chords(s, with_seconds=True, start=2, end=20, as_timeline=True)
+    recognize_chords(s, chunk_bars=2)
+    recognize_chords(s, with_confidence=True)
+    recognize_chords(s, coarse="bar")
+    for precision in ("float32", "int16"):
+        recognize_chords(s, precision=precision)
+    session = RecognitionSession(s)
+    session.modify_note(0, 0, Note(38, 0, 4))
+    session.recognize()
+    features = chroma, bass = extract_chord_features(s.track)
+    chord_score(chroma[0], bass[0])
+    chord_score_batch(chroma, bass)
+    chord_score_circular_batch(chroma, bass)
+    if parallel:
+        recognize_chords(s, parallel=True)
+        decode_chords_batch([features, features], [s.timeSignature, s.timeSignature])
+        sweep_decode(*features, s.timeSignature, param_grid(score_floor=[0.2, 0.3]))
+    return {name: len(kernel.signatures) for name, kernel in _iter_kernels()}
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="compile all chord_recognizer kernels into a cache directory")
+    parser.add_argument("--cache-dir", default=os.environ.get(CACHE_DIR_ENV), help=f"default: ${CACHE_DIR_ENV}")
+    parser.add_argument("--no-parallel", action="store_true", help="skip the multi-core kernels")
+    args = parser.parse_args()
+    configure_cache(args.cache_dir)
+    tic = perf_counter()
+    compiled = warmup(parallel=not args.no_parallel)
+    print(f"compiled {sum(compiled.values())} specializations of {len(compiled)} kernels "
+          f"in {perf_counter() - tic:.1f}s into {numba.config.CACHE_DIR or 'the default numba cache'}")
+
+
+if os.environ.get(CACHE_DIR_ENV):
+    configure_cache(os.environ[CACHE_DIR_ENV])
+
+if __name__ == "__main__":
+    _main()
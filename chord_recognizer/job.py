@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .dataset import SegmentReader, SegmentWriter, _MANIFEST as _DATASET_MANIFEST, _tmp_path, _write_json
+from .main import recognize_chords
+from .timeline import ChordTimeline
+
+# 可断点续跑、可分片的批量识别任务，任务为共享文件系统上的一个目录：
+# * manifest.json：输入文件的路径、sha256 与 recognize_chords 的参数，创建后不再修改
+# * done/<sha256>.npy：每个文件识别完成后以原子替换的方式写入的和弦片段，存在即表示已完成
+# * failed/<sha256>.json：识别出错的文件与错误信息，续跑时默认跳过
+# 每个文件按 sha256 确定性地分配到 n_shards 个分片之一，各个节点只写入自己分片的文件，互不冲突；
+# 全部完成后由 combine() 按 manifest 的顺序合并为一个 dataset.SegmentWriter 的数据集
+JOB_VERSION = 1
+_MANIFEST = "manifest.json"
+_DONE = "done"
+_FAILED = "failed"
+result_dtype = np.dtype([('start', np.int64), ('end', np.int64), ('chord', np.int32)])
+
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def shard_of(digest: str, n_shards: int) -> int:
+    """
+    :return: 文件所属的分片，只由 sha256 决定，与文件的顺序、路径以及运行的节点无关
+    """
+    return int(digest[:16], 16) % n_shards
+
+
+def _atomic_save(path: str, value: np.ndarray):
+    tmp = _tmp_path(path)
+    with open(tmp, "wb") as f:
+        np.save(f, value)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class CorpusJob:
+    """
+    对一批 midi/msf 文件运行 recognize_chords 的任务，支持断点续跑与多节点分片
+
+    * 每个文件完成后立即写入检查点，任务中断后再次 run 只处理尚未完成的文件
+    * 相同内容的文件（sha256 相同）只识别一次，合并时共享同一份结果
+    * 识别前重新计算 sha256，与 manifest 不一致（文件在创建任务后被修改）时记为失败
+    """
+
+    def __init__(self, path: str):
+        """
+        打开已经由 create 创建的任务
+
+        :param path: 任务的目录
+        """
+        with open(os.path.join(path, _MANIFEST), encoding="UTF-8") as f:
+            self._manifest = json.load(f)
+        assert self._manifest['version'] == JOB_VERSION, "the job has an incompatible version!"
+        self.path = path
+        self.kwargs: dict = self._manifest['kwargs']
+        self.items: List[dict] = self._manifest['items']
+
+    @classmethod
+    def create(cls, path: str, files: Iterable[str], **kwargs) -> "CorpusJob":
+        """
+        读取所有文件计算 sha256 并写入 manifest；目录中已有相同的 manifest 时直接打开，已完成的结果保留
+
+        :param path: 任务的目录，不存在时自动创建
+        :param files: 文件路径，各个节点需要能以相同的路径访问
+        :param kwargs: 传递给 recognize_chords 的参数，需要可以被 json 序列化；as_timeline 与 with_seconds 由任务决定
+        """
+        assert not {'as_timeline', 'with_seconds'} & kwargs.keys(), \
+            "as_timeline and with_seconds are decided by the job!"
+        items = []
+        for file in files:
+            with open(file, "rb") as f:
+                data = f.read()
+            items.append({'path': file, 'digest': file_digest(data), 'size': len(data)})
+        manifest = {'version': JOB_VERSION, 'kwargs': kwargs, 'items': items}
+        manifest_path = os.path.join(path, _MANIFEST)
+        os.makedirs(path, exist_ok=True)
+        # 多个节点同时创建时只有一个写入成功，其余的与已有的 manifest 比较
+        if not _write_json(manifest_path, manifest, replace=False):
+            with open(manifest_path, encoding="UTF-8") as f:
+                if json.load(f) != json.loads(json.dumps(manifest)):
+                    raise ValueError(f"{path} already contains a different job!")
+        for sub in (_DONE, _FAILED):
+            os.makedirs(os.path.join(path, sub), exist_ok=True)
+        return cls(path)
+
+    def _done_path(self, digest: str) -> str:
+        return os.path.join(self.path, _DONE, digest + ".npy")
+
+    def _failed_path(self, digest: str) -> str:
+        return os.path.join(self.path, _FAILED, digest + ".json")
+
+    def shard_items(self, shard: int, n_shards: int) -> List[dict]:
+        """
+        :return: 属于第 shard 个分片的文件，相同 sha256 的文件只保留第一个
+        """
+        assert 0 <= shard < n_shards, f"shard: {shard} should be in [0, {n_shards})!"
+        seen = set()
+        items = []
+        for item in self.items:
+            if item['digest'] not in seen and shard_of(item['digest'], n_shards) == shard:
+                seen.add(item['digest'])
+                items.append(item)
+        return items
+
+    def status(self, n_shards: int = 1) -> pd.DataFrame:
+        """
+        :return: 每个文件一行，包含 path, digest, 所属的分片 shard, 是否已完成 done 与是否失败 failed
+        """
+        return pd.DataFrame([[
+            item['path'], item['digest'], shard_of(item['digest'], n_shards),
+            os.path.isfile(self._done_path(item['digest'])), os.path.isfile(self._failed_path(item['digest']))
+        ] for item in self.items], columns=['path', 'digest', 'shard', 'done', 'failed'])
+
+    def _run_item(self, item: dict) -> str:
+        digest = item['digest']
+        try:
+            with open(item['path'], "rb") as f:
+                data = f.read()
+            if file_digest(data) != digest:
+                raise ValueError(f"{item['path']} has changed since the job was created!")
+            timeline = recognize_chords(data, **self.kwargs, as_timeline=True)
+            result = np.empty(len(timeline), dtype=result_dtype)
+            result['start'], result['end'], result['chord'] = timeline.starts, timeline.ends, timeline.chords
+        except Exception as e:
+            _write_json(self._failed_path(digest), {
+                'path': item['path'], 'host': socket.gethostname(),
+                'error': repr(e), 'traceback': traceback.format_exc()
+            })
+            return "failed"
+        _atomic_save(self._done_path(digest), result)
+        if os.path.isfile(self._failed_path(digest)):
+            os.remove(self._failed_path(digest))
+        return "done"
+
+    def run(self, shard: int = 0, n_shards: int = 1, n_threads: Optional[int] = None,
+            retry_failed: bool = False) -> Dict[str, int]:
+        """
+        处理一个分片中尚未完成的文件，可以在多个节点上以不同的 shard 同时运行
+
+        :param shard: 分片的序号，从 0 开始
+        :param n_shards: 分片的总数，同一任务的所有节点需要相同
+        :param n_threads: 线程数，见 main.recognize_chords_batch
+        :param retry_failed: 是否重新处理之前失败的文件
+        :return: 本次完成 done、失败 failed 与因已完成而跳过 skipped 的文件数
+        """
+        pending = []
+        counts = {'done': 0, 'failed': 0, 'skipped': 0}
+        for item in self.shard_items(shard, n_shards):
+            if os.path.isfile(self._done_path(item['digest'])) or \
+                    (not retry_failed and os.path.isfile(self._failed_path(item['digest']))):
+                counts['skipped'] += 1
+            else:
+                pending.append(item)
+        if n_threads == 1:
+            results = list(map(self._run_item, pending))
+        else:
+            with ThreadPoolExecutor(n_threads) as executor:
+                results = list(executor.map(self._run_item, pending))
+        for result in results:
+            counts[result] += 1
+        return counts
+
+    def combine(self, path: str, shard_rows: int = 1 << 20, shard_format: Optional[str] = None,
+                allow_incomplete: bool = False) -> SegmentReader:
+        """
+        将所有已完成的文件按 manifest 的顺序写入一个新的数据集，数据集中的曲目名称为文件路径
+
+        * 失败与未完成的文件不写入数据集，因此数据集中没有片段的曲目一定是识别结果为空，而不是识别失败；
+          file_id 按写入的顺序编号，有文件被跳过时与 manifest 中的序号不同，可以由曲目名称对应
+        * 被跳过的文件可以由 status() 查询
+
+        :param path: 数据集的目录，见 dataset.SegmentWriter，不能是已有的数据集
+        :param shard_rows: 见 dataset.SegmentWriter
+        :param shard_format: 见 dataset.SegmentWriter
+        :param allow_incomplete: 是否允许存在尚未完成（既没有完成也没有失败）的文件，为 False 时存在这样的文件则报错
+        """
+        if os.path.isfile(os.path.join(path, _DATASET_MANIFEST)):
+            raise ValueError(f"{path} already contains a dataset!")
+        if not allow_incomplete:
+            unfinished = [item['path'] for item in self.items if not os.path.isfile(self._done_path(item['digest']))
+                          and not os.path.isfile(self._failed_path(item['digest']))]
+            if unfinished:
+                raise ValueError(f"{len(unfinished)} files are not finished yet, e.g. {unfinished[0]}!")
+        with SegmentWriter(path, shard_rows, shard_format) as writer:
+            for item in self.items:
+                done_path = self._done_path(item['digest'])
+                if os.path.isfile(done_path):
+                    result = np.load(done_path)
+                    writer.write(ChordTimeline.from_arrays(result['start'], result['end'], result['chord']),
+                                 item['path'])
+        return SegmentReader(path)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="resumable, sharded chord recognition over a corpus")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="build the manifest of a job")
+    create.add_argument("job")
+    create.add_argument("file_list", help="a text file with one input path per line")
+    create.add_argument("--kwargs", default="{}", help="recognize_chords arguments as a json object")
+    run = commands.add_parser("run", help="process the unfinished files of one shard")
+    run.add_argument("job")
+    run.add_argument("--shard", type=int, default=0)
+    run.add_argument("--n-shards", type=int, default=1)
+    run.add_argument("--n-threads", type=int, default=None)
+    run.add_argument("--retry-failed", action="store_true")
+    combine = commands.add_parser("combine", help="merge the results of all shards into a segment dataset")
+    combine.add_argument("job")
+    combine.add_argument("output")
+    combine.add_argument("--allow-incomplete", action="store_true")
+    args = parser.parse_args()
+    if args.command == "create":
+        with open(args.file_list, encoding="UTF-8") as f:
+            files = [line.strip() for line in f if line.strip()]
+        job = CorpusJob.create(args.job, files, **json.loads(args.kwargs))
+        print(f"{len(job.items)} files in {args.job}")
+    elif args.command == "run":
+        print(CorpusJob(args.job).run(args.shard, args.n_shards, args.n_threads, args.retry_failed))
+    else:
+        reader = CorpusJob(args.job).combine(args.output, allow_incomplete=args.allow_incomplete)
+        print(f"{reader.n_rows} segments of {len(reader.files)} files in {args.output}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,35 +1,197 @@
 import pandas as pd
-from .feature import extract_chord_features
-from .decode import decode_chords
-from .util.midiToolkit import MidiFile
-from .util import Sequence
-from typing import Union
-from os.path import splitext, isfile
+import numpy as np
+from .feature import extract_chord_features, slice_tracks, build_track_index, track_weights, count_beats
+from .decode import decode_chords, bar_to_beat, ChunkedDecoder, segments_to_frame
+from .util.midiToolkit import MidiFile, LOAD_CHORD
+from .util import Sequence, TempoMap
+from .timeline import ChordTimeline
+from typing import Optional, Union, Iterable, List, BinaryIO
+from concurrent.futures import ThreadPoolExecutor
+from os.path import isfile
+from math import ceil, floor
 
 
-def recognize_chords(file: Union[str, MidiFile, Sequence], note_precision: float = 0.25) -> pd.DataFrame:
+def load_sequence(
+        file: Union[str, bytes, bytearray, memoryview, BinaryIO, MidiFile, Sequence, "SequenceIndex"]) -> Sequence:
     """
-    给定 midi 文件的路径，返回识别的和弦的 DataFrame
+    将文件路径、字节、文件对象，或者已经实例化的 MidiFile, Sequence, SequenceIndex 类统一转换为 Sequence
 
-    :param file: 文件路径，或者已经实例化的 MidiFile, Sequence 类
-    :param note_precision: 在提取特征时，对 note 的时间相关参数进行量化的精度，单位为1拍，
-        例如 note_precision=0.25, start = 1.5 会被量化为 6
-    :return: 以 pd.DataFrame 的类型，返回解析出的和弦，时间单位为 1拍
+    * 文件格式由开头的字节判断（MThd 为 midi，否则为 msf），与扩展名无关
+    * bytes、memoryview 等 buffer 直接解析，不拷贝、不写临时文件
+    * 读取 midi 时只解析和弦识别需要的 note、速度与拍号，跳过 control change、pitch bend 等事件
     """
     if isinstance(file, str):
         assert isfile(file), f"{file} is not a file!"
-        ext = splitext(file)[-1][1:]
-        if ext == "msf":
-            s = Sequence.from_msf(file)
-        elif ext in {'mid', "MID"}:
-            s = Sequence.from_midi(file)
-        else:
-            raise AssertionError(f"Do not support {ext} file!")
+        with open(file, "rb") as f:
+            return Sequence.from_bytes(f.read(), load=LOAD_CHORD)
+    elif isinstance(file, (bytes, bytearray, memoryview)) or hasattr(file, "read"):
+        return Sequence.from_bytes(file, load=LOAD_CHORD)
     elif isinstance(file, MidiFile):
-        s = Sequence.from_midi(file)
+        return Sequence.from_midi(file)
     elif isinstance(file, Sequence):
-        s = file
+        return file
+    elif isinstance(file, SequenceIndex):
+        return file.sequence
     else:
         raise AssertionError(f"the file argument do not support type: {type(file)}!")
 
-    return decode_chords(*extract_chord_features(s.track, note_precision), time_signatures=s.timeSignature)
+
+class SequenceIndex:
+    """
+    一首曲目解析后的 Sequence，以及按范围识别时需要的整首曲目的统计量，多次识别同一首曲目的不同范围时复用
+
+    * 构建时解析文件，对每个 track 的 note 排序，并统计整首曲目的 track 权重与长度，开销与曲目的长度成正比
+    * 之后 recognize_chords(index, start=..., end=...) 只截取并处理范围内的 note，开销与范围的长度成正比
+    * 构建之后不能再修改 Sequence 中的 note
+    """
+
+    def __init__(self, file: Union[str, bytes, bytearray, memoryview, BinaryIO, MidiFile, Sequence],
+                 note_precision: float = 0.25):
+        """
+        :param file: 见 recognize_chords
+        :param note_precision: 见 recognize_chords，之后的识别需要使用相同的精度
+        """
+        self.sequence = load_sequence(file)
+        self.note_precision = note_precision
+        tracks = self.sequence.track
+        self.track_index = build_track_index(tracks)
+        self.n_beat = count_beats(tracks, note_precision)
+        self.track_weight = track_weights(tracks, note_precision, self.n_beat)
+        # 最后一个 note 结束的位置，单位为 1拍
+        self.end = max((float(reach[-1]) for _, _, reach in self.track_index if len(reach) > 0), default=0.)
+
+
+def recognize_chords(
+        file: Union[str, bytes, bytearray, memoryview, BinaryIO, MidiFile, Sequence, SequenceIndex],
+        note_precision: float = 0.25, with_seconds: bool = False,
+        start: Optional[float] = None, end: Optional[float] = None, unit: str = "beat",
+        chunk_bars: Optional[int] = None, min_track_weight: float = 0., **decode_kwargs
+) -> Union[pd.DataFrame, ChordTimeline]:
+    """
+    给定 midi 文件的路径，返回识别的和弦的 DataFrame
+
+    :param file: 文件路径，字节（bytes, memoryview 等），具有 read 方法的文件对象，或者已经实例化的 MidiFile, Sequence 类；
+        多次识别同一首曲目的不同范围时传入 SequenceIndex，之后每次的开销只与范围的长度有关
+    :param note_precision: 在提取特征时，对 note 的时间相关参数进行量化的精度，单位为1拍，
+        例如 note_precision=0.25, start = 1.5 会被量化为 6
+    :param with_seconds: 是否根据 Sequence.qpm 额外输出以秒为单位的 start_sec 与 end_sec 两列
+    :param start: 可选，只解析 [start, end) 范围内的和弦，为空时从头开始。
+        track 的权重由整首曲目统计，因此范围内每一拍的特征与识别整首曲目时完全相同；
+        但解码只看到范围内的特征，靠近范围边界的和弦可能与整首识别的结果不同
+    :param end: 可选，只解析 [start, end) 范围内的和弦，为空时直到最后一个 note 结束
+    :param unit: start 与 end 的单位，"beat" 表示拍，"bar" 表示小节（从 0 开始，按拍号划分）
+    :param chunk_bars: 可选，设置后按小节线将曲目切分为每块 chunk_bars 个小节，逐块提取特征并解码，
+        峰值内存由块的大小决定，与曲目的长度无关，结果与不分块时相同，见 decode.ChunkedDecoder；
+        with_confidence, coarse, parallel 等需要整首特征的解码参数只分块提取特征，见 _decode_chunked
+    :param min_track_weight: 权重低于该值的 track 不参与 pitch 特征的计算，见 feature.extract_chord_features
+    :param decode_kwargs: 其余参数传递给 decode.decode_chords()，例如 max_prev, max_downbeats, precision, params,
+        as_timeline（返回 ChordTimeline 而不是 DataFrame），with_confidence（额外输出 margin 与 posterior 两列）
+    :return: 以 pd.DataFrame 的类型，返回解析出的和弦，时间单位为 1拍；as_timeline=True 时返回 timeline.ChordTimeline
+    """
+    index = file if isinstance(file, SequenceIndex) else None
+    assert index is None or index.note_precision == note_precision, \
+        f"the SequenceIndex was built with note_precision={index.note_precision}!"
+    s = load_sequence(file)
+    tempo_map = TempoMap.from_qpm(s.qpm) if with_seconds else None
+    if start is None and end is None:
+        if chunk_bars is not None:
+            index = SequenceIndex(s, note_precision) if index is None else index
+            return _decode_chunked(
+                s.track, index, note_precision, index.n_beat, s.timeSignature, tempo_map, 0,
+                chunk_bars, min_track_weight, **decode_kwargs)
+        return decode_chords(
+            *extract_chord_features(s.track, note_precision, min_track_weight=min_track_weight),
+            time_signatures=s.timeSignature, tempo_map=tempo_map, **decode_kwargs)
+
+    assert unit in {"beat", "bar"}, f"unit: {unit} is not supported!"
+    if unit == "bar":
+        start = None if start is None else bar_to_beat(int(start), s.timeSignature)
+        end = None if end is None else bar_to_beat(int(ceil(end)), s.timeSignature)
+    index = SequenceIndex(s, note_precision) if index is None else index
+    start = 0 if start is None else int(floor(start))
+    end = int(ceil(max(index.end, start) if end is None else end))
+    assert 0 <= start < end, f"range [{start}, {end}) is invalid!"
+
+    n_beat = end - start
+    if chunk_bars is not None:
+        return _decode_chunked(
+            s.track, index, note_precision, n_beat, s.timeSignature, tempo_map, start,
+            chunk_bars, min_track_weight, **decode_kwargs)
+    return decode_chords(
+        *extract_chord_features(
+            slice_tracks(s.track, start, end, index.track_index), note_precision, n_beat, index.track_weight,
+            min_track_weight),
+        time_signatures=s.timeSignature, tempo_map=tempo_map, offset=start,
+        **decode_kwargs)
+
+
+# ChunkedDecoder 逐块解码时支持的 decode_chords 参数，其余参数需要整首曲目的特征
+_STREAMING_KWARGS = {"max_prev", "max_downbeats", "params", "as_timeline"}
+
+
+def _decode_chunked(
+        tracks, index: SequenceIndex, note_precision, n_beat: int, time_signatures, tempo_map: Optional[TempoMap],
+        offset: int, chunk_bars: int, min_track_weight: float = 0., **decode_kwargs
+) -> Union[pd.DataFrame, ChordTimeline]:
+    """
+    recognize_chords 的分块实现，track 的权重由整首曲目统计，保证每一块的特征与一次性提取时相同
+
+    * decode_kwargs 只包含 max_prev, max_downbeats, params, as_timeline 时，逐块送入 ChunkedDecoder 解码，
+      峰值内存由块的大小决定
+    * 包含其他参数（例如 with_confidence, temperature, coarse, refine_radius, parallel, precision）时，
+      仍然逐块提取特征，但拼接后由 decode_chords 一次性解码，结果与不分块时相同，解码的内存随曲目的长度增长
+
+    :param tracks: 整首曲目的 Track 列表
+    :param index: tracks 的 SequenceIndex，提供排序后的 note 与 track 的权重
+    :param n_beat: 从 offset 开始需要解码的总拍数
+    :param decode_kwargs: 传递给 decode.decode_chords 的参数；as_timeline=True 时，
+        每一块的片段转换为 ChordTimeline 的一块数据（转换时拷贝一次），各块之间拼接时不再拷贝
+    """
+    assert chunk_bars > 0, "chunk_bars should be positive!"
+
+    # 块的边界对齐到小节线
+    bounds = [0]
+    bar = chunk_bars
+    while bounds[-1] < n_beat:
+        bounds.append(min(max(bar_to_beat(bar, time_signatures) - offset, bounds[-1]), n_beat))
+        bar += chunk_bars
+    features = (
+        extract_chord_features(
+            slice_tracks(tracks, offset + lo, offset + hi, index.track_index), note_precision, hi - lo,
+            index.track_weight, min_track_weight)
+        for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+    )
+    if not _STREAMING_KWARGS.issuperset(decode_kwargs):
+        chroma, bass = zip(*features)
+        return decode_chords(
+            np.concatenate(chroma), np.concatenate(bass), time_signatures, tempo_map, offset, **decode_kwargs)
+
+    as_timeline = decode_kwargs.pop("as_timeline", False)
+    decoder = ChunkedDecoder(time_signatures, offset, **decode_kwargs)
+    segments = [decoder.feed(chroma, bass) for chroma, bass in features]
+    segments.append(decoder.flush())
+    if as_timeline:
+        return ChordTimeline.concat(ChordTimeline.from_segments(part, offset, tempo_map) for part in segments)
+    return segments_to_frame(np.concatenate(segments), tempo_map, offset)
+
+
+def recognize_chords_batch(
+        files: Iterable[Union[str, MidiFile, Sequence]], n_threads: Optional[int] = None, **kwargs
+) -> List[pd.DataFrame]:
+    """
+    使用线程池对多首曲目并行调用 recognize_chords
+
+    * 特征提取与解码中的 numba 函数均以 nogil 编译，计算期间释放 GIL；文件解析的 Python 部分与 DataFrame 的构建仍持有 GIL，
+      因此多核上的加速比取决于两者的比例，需要由 benchmark.stress_threads 在目标机器上实测
+    * recognize_chords 不修改输入与全局状态（CHORD_CONFIG 为只读），多个线程可以同时调用
+
+    :param files: 文件路径，或者已经实例化的 MidiFile, Sequence 类
+    :param n_threads: 线程数，为空时由 ThreadPoolExecutor 决定
+    :param kwargs: 传递给 recognize_chords 的参数
+    :return: 与 files 顺序相同的和弦 DataFrame 列表
+    """
+    files = list(files)
+    if n_threads == 1:
+        return [recognize_chords(file, **kwargs) for file in files]
+    with ThreadPoolExecutor(n_threads) as executor:
+        return list(executor.map(lambda file: recognize_chords(file, **kwargs), files))
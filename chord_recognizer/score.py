@@ -1,5 +1,6 @@
 import numpy as np
 from .config import CHORD_CONFIG
+from .config.gen_config import gen_score_bias, NOTE_BIAS, INVERSION_BIAS
 from typing import Union, List, Tuple
 from numba import njit
 
@@ -8,7 +9,7 @@ ref_bass: np.array = CHORD_CONFIG['bass']
 score_bias: np.array = CHORD_CONFIG['score_bias']
 
 
-@njit(fastmath=True)
+@njit(cache=True, nogil=True, fastmath=True)
 def chord_score(chroma: np.ndarray, bass: np.ndarray) -> np.ndarray:
     """
     调用 chord_score_batch 实现对单个frame对特征计算
@@ -23,7 +24,7 @@ def chord_score(chroma: np.ndarray, bass: np.ndarray) -> np.ndarray:
     return score
 
 
-@njit(cache=True, fastmath=True)
+@njit(cache=True, nogil=True, fastmath=True)
 def chord_score_batch(chroma: np.ndarray, bass: np.ndarray) -> np.ndarray:
     """
     根据 chroma 与 bass 特征，批量计算每一个frame 对每一类和弦的得分。
@@ -42,3 +43,159 @@ def chord_score_batch(chroma: np.ndarray, bass: np.ndarray) -> np.ndarray:
     score_bass = np.sum((0.5 * bass) * ref_bass, axis=2)
     score = score_chroma + (score_bass + score_bias)
     return score
+
+
+# 以下为循环相关（circular correlation）的打分 kernel。gen_chord_config 中每一个和弦模板都由同一个性质/转位模板
+# np.roll 12 个根音得到，类别按 [根音, 性质/转位] 排列，因此只需要保存根音为 C 的一组模板：
+# * 转位与原位和弦的 chroma 模板相同，去重后只保留每种性质一个 chroma 模板
+# * bass 模板只有一个非0值，bass 得分退化为按偏移量查表
+N_ROOT = 12
+N_QUALITY_CLASS = len(score_bias) // N_ROOT
+# chroma 模板的数值为 ±1/k，拆分为 ±1 的符号模板与 float32 精度的 1/k，组成音相同的和弦（如 C:min13 与 F:13）的得分严格相等，
+# 与 chord_score 一样由类别序号决定平局时的选择
+_circular_chroma, circular_quality_index = np.unique(
+    CHORD_CONFIG['chroma'][:N_QUALITY_CLASS], axis=0, return_inverse=True)
+circular_quality_index = circular_quality_index.reshape(-1)
+circular_chroma_sign = np.where(_circular_chroma, 1., -1.)
+circular_chroma_scale = (1 / _circular_chroma.sum(axis=1)).astype(np.float32).astype(np.float64)
+circular_bass_offset = np.argmax(ref_bass[:N_QUALITY_CLASS], axis=1)
+circular_score_bias = score_bias[:N_QUALITY_CLASS].astype(np.float64)
+_quality_note_count = CHORD_CONFIG['chroma'][:N_QUALITY_CLASS].sum(axis=1).astype(np.uint8)
+_quality_inverse = np.array(['/' in name for name in CHORD_CONFIG['name'][:N_QUALITY_CLASS]])
+for _root in range(N_ROOT):
+    _block = slice(_root * N_QUALITY_CLASS, (_root + 1) * N_QUALITY_CLASS)
+    assert np.array_equal(
+        np.roll(ref_chroma_weight[:N_QUALITY_CLASS], _root, axis=1), ref_chroma_weight[_block]) and \
+        np.array_equal(np.roll(ref_bass[:N_QUALITY_CLASS], _root, axis=1), ref_bass[_block]) and \
+        np.array_equal(score_bias[:N_QUALITY_CLASS], score_bias[_block]), \
+        "chord templates should be the 12 rotations of the templates with root C!"
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def chord_score_circular(chroma: np.ndarray, bass: np.ndarray) -> np.ndarray:
+    """
+    与 chord_score 结果相同，通过循环相关一次性计算 12 个根音的得分。
+
+    * 根音为 i 的得分为输入 chroma 与旋转后的根音为 C 的模板 sign[(p - i) % 12] 的内积
+    * 每一帧的乘法次数由 24 * num_classes 降为 12 * 12 * 性质数量，模板内存为原来的约 1/16
+
+    :param chroma: shape 为 [12]， 数值在 0～1 之间，对应和弦的 pitches
+    :param bass: shape 为 [12]，数值在 0~1 之间，但是每一个特征向量只有一个非0值，对应核心的 bass
+    :return: 返回该在每一个种类上的得分，shape为 [num_classes]，区间为[-inf, inf]
+    """
+    return circular_combine(circular_quality_score(chroma), bass, circular_score_bias)
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def circular_quality_score(chroma: np.ndarray) -> np.ndarray:
+    """
+    chord_score_circular 的第一步，与 score bias 无关，可以在更换 bias 时复用
+
+    :param chroma: shape 为 [12]
+    :return: shape 为 [12, 性质数量]，每个根音与每个去重后的 chroma 模板的得分
+    """
+    n_quality = circular_chroma_sign.shape[0]
+    quality_score = np.empty((N_ROOT, n_quality))
+    for i in range(N_ROOT):
+        for q in range(n_quality):
+            # 按绝对音高的顺序累加，保证组成音相同的模板得分严格相等
+            s = 0.
+            for p in range(12):
+                s += chroma[p] * circular_chroma_sign[q, (p - i) % 12]
+            quality_score[i, q] = s * circular_chroma_scale[q]
+    return quality_score
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def circular_combine(quality_score: np.ndarray, bass: np.ndarray, bias: np.ndarray) -> np.ndarray:
+    """
+    chord_score_circular 的第二步，加上 bass 得分与 score bias
+
+    :param quality_score: circular_quality_score 的返回值
+    :param bass: shape 为 [12]
+    :param bias: shape 为 [N_QUALITY_CLASS]，根音为 C 的各类和弦的 score bias，默认为 circular_score_bias
+    :return: shape 为 [num_classes]
+    """
+    score = np.empty(N_ROOT * N_QUALITY_CLASS)
+    for i in range(N_ROOT):
+        for k in range(N_QUALITY_CLASS):
+            score[i * N_QUALITY_CLASS + k] = quality_score[i, circular_quality_index[k]] + (
+                    0.5 * bass[(i + circular_bass_offset[k]) % 12] + bias[k])
+    return score
+
+
+def circular_bias(note_bias: float = NOTE_BIAS, inversion_bias: float = INVERSION_BIAS) -> np.ndarray:
+    """
+    按 gen_chord_config 的方式，用给定的系数重新计算根音为 C 的各类和弦的 score bias，
+    取默认值时与 circular_score_bias 逐位相同
+
+    :return: shape 为 [N_QUALITY_CLASS]，float64
+    """
+    return gen_score_bias(_quality_note_count, _quality_inverse, note_bias, inversion_bias).astype(np.float64)
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def chord_score_circular_batch(chroma: np.ndarray, bass: np.ndarray) -> np.ndarray:
+    """
+    chord_score_circular 的批量版本，与 chord_score_batch 结果相同
+
+    :param chroma: shape 为 [batch, 12]， 数值在 0～1 之间，对应和弦的 pitches
+    :param bass: shape 为 [batch, 12]，数值在 0~1 之间，但是每一个特征向量只有一个非0值，对应核心的 bass
+    :return: 返回每个frame在每一个种类上的得分，shape为 [batch, num_classes]，区间为[-inf, inf]
+    """
+    score = np.empty((chroma.shape[0], N_ROOT * N_QUALITY_CLASS))
+    for b in range(chroma.shape[0]):
+        score[b] = chord_score_circular(chroma[b], bass[b])
+    return score
+
+
+# 以下为低精度的打分 kernel，模板转置为 [24, num_classes] 的连续布局，前 12 行对应 chroma，后 12 行对应 bass，
+# 内层循环沿和弦种类方向连续访问，便于编译器向量化
+ref_template_f32 = np.ascontiguousarray(
+    np.concatenate([ref_chroma_weight, 0.5 * ref_bass], axis=1).T, dtype=np.float32)
+score_bias_f32 = score_bias.astype(np.float32)
+
+# 模板的数值均为 ±1/k (k = 3~7)、0.5 * bass 以及 -0.1 * k - 0.05 的组合，乘以 420 后均为整数，可以无损地表示为 int16
+FIXED_TEMPLATE_SCALE = 420
+# 每一拍的特征数值在 0~1 之间，量化为 int16 时的缩放倍数，区间特征的和需要小于 2^15
+FIXED_FEATURE_SCALE = 2 ** 11
+FIXED_SCORE_SCALE = FIXED_TEMPLATE_SCALE * FIXED_FEATURE_SCALE
+ref_template_i16 = np.rint(ref_template_f32.astype(np.float64) * FIXED_TEMPLATE_SCALE).astype(np.int16)
+score_bias_i32 = (
+        np.rint(score_bias.astype(np.float64) * FIXED_TEMPLATE_SCALE).astype(np.int32) * FIXED_FEATURE_SCALE)
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def chord_score_f32(span: np.ndarray, out: np.ndarray):
+    """
+    float32 版本的 chord_score，结果写入 out，不分配临时数组
+
+    :param span: shape 为 [24]，float32，前 12 维为 chroma，后 12 维为 bass
+    :param out: shape 为 [num_classes]，float32
+    """
+    n_class = out.shape[0]
+    for c in range(n_class):
+        out[c] = score_bias_f32[c]
+    for k in range(24):
+        v = span[k]
+        if v != 0:
+            for c in range(n_class):
+                out[c] += v * ref_template_f32[k, c]
+
+
+@njit(cache=True, nogil=True)
+def chord_score_i16(span: np.ndarray, out: np.ndarray):
+    """
+    定点版本的 chord_score，结果写入 out，数值为浮点得分乘以 FIXED_SCORE_SCALE
+
+    :param span: shape 为 [24]，int32，为量化后的特征乘以 FIXED_FEATURE_SCALE 的区间和
+    :param out: shape 为 [num_classes]，int32
+    """
+    n_class = out.shape[0]
+    for c in range(n_class):
+        out[c] = score_bias_i32[c]
+    for k in range(24):
+        v = span[k]
+        if v != 0:
+            for c in range(n_class):
+                out[c] += v * ref_template_i16[k, c]
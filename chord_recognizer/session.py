@@ -0,0 +1,441 @@
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from numba import njit
+
+from .decode import MAX_PREV, PREFIX_SCALE, DecodeParams, downbeat_and_score_weight, backtrack_segments, \
+    segments_to_frame, segment_type, fixed_features, _finish_span_score, _DEFAULT_PARAMS
+from .feature import note_type, get_abs_pianoroll, weight_from_stats, _grid_lowest, _grid_bass_chroma, \
+    _is_grid_precision, _chord_track_index
+from .score import circular_quality_score, circular_combine
+from .timeline import ChordTimeline
+from .util import Note, Sequence, TempoMap
+
+
+def _aligned_note_arr(notes: List[Note], precision: float) -> np.ndarray:
+    """
+    与 feature.to_note_arr 的量化相同，但不过滤 end 为 0 的 note，下标与 Track.note 一一对应
+    """
+    return np.fromiter(
+        map(lambda x: (x.pitch, (x.start / precision) + 0.5, ((x.duration + x.start) / precision) + 0.5), notes),
+        dtype=note_type, count=len(notes)
+    )
+
+
+def _clip_notes(note_arr: np.ndarray, lo: int, hi: int) -> np.ndarray:
+    """
+    :return: 与 [lo, hi) 帧重叠的 note，裁剪到该范围内并平移到以 lo 为 0
+    """
+    note_arr = note_arr[(note_arr['end'] > 0) & (note_arr['start'] < hi) & (note_arr['end'] > lo)]
+    result = np.empty(len(note_arr), dtype=note_type)
+    result['pitch'] = note_arr['pitch']
+    result['start'] = np.maximum(note_arr['start'], lo) - lo
+    result['end'] = np.minimum(note_arr['end'], hi) - lo
+    return result
+
+
+def _beat_stats(note_arr: np.ndarray, first_beat: int, last_beat: int, chord_window: int):
+    """
+    单个 track 在 [first_beat, last_beat) 拍内的逐拍统计，按拍求和后与 feature._grid_track_stats 相同
+
+    :return: 每拍每个音级的发声帧数 pc，shape 为 [n, 12]（即 extract_chord_features 中的 window_sum），
+        每拍有音发声的帧数 sounding，每拍各帧最低音的音高之和 lowest_sum，以及有最低音的帧数 lowest_count
+    """
+    n = last_beat - first_beat
+    length = n * chord_window
+    local = _clip_notes(note_arr, first_beat * chord_window, last_beat * chord_window)
+    pc = np.zeros((n, 12), dtype=np.int64)
+    sounding = np.zeros(n, dtype=np.int64)
+    lowest_sum = np.zeros(n, dtype=np.int64)
+    lowest_count = np.zeros(n, dtype=np.int64)
+    if len(local) == 0:
+        return pc, sounding, lowest_sum, lowest_count
+    roll = get_abs_pianoroll(local, length).reshape(n, chord_window, 12)
+    pc[:] = roll.sum(axis=1)
+    sounding[:] = roll.any(axis=2).sum(axis=1)
+    times, lowest = _grid_lowest(local, length, np.arange(0, length + 1, chord_window))
+    nonempty = lowest < 128
+    beat = times[:-1][nonempty] // chord_window
+    duration = np.diff(times)[nonempty]
+    np.add.at(lowest_sum, beat, lowest[nonempty].astype(np.int64) * duration)
+    np.add.at(lowest_count, beat, duration)
+    return pc, sounding, lowest_sum, lowest_count
+
+
+@njit(cache=True, nogil=True)
+def _count_spans(downbeat, max_prev, max_downbeats):
+    """
+    :return: 以第 i 拍结尾的候选区间数，与 score_dp 中的 downbeat 规则相同
+    """
+    n_frame = len(downbeat)
+    n_span = np.zeros(n_frame, dtype=np.int32)
+    for i in range(n_frame):
+        n_downbeat = 0
+        for j in range(max_prev):
+            if i - j < 0:
+                break
+            n_span[i] = j + 1
+            if j > 0 and downbeat[i - j + 1]:  # downbeat
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+    return n_span
+
+
+@njit(cache=True, nogil=True)
+def _rescore_spans(span_feature, rows, cols, weight, score_floor, span_bonus, bias, span_scores, span_choices):
+    """
+    重新计算 (rows[k], cols[k]) 区间的得分与最佳和弦，与 decode._span_score 相同
+    """
+    for k in range(len(rows)):
+        i, j = rows[k], cols[k]
+        logits = circular_combine(circular_quality_score(span_feature[i, j, :12]), span_feature[i, j, 12:], bias)
+        span_scores[i, j], span_choices[i, j] = _finish_span_score(logits, weight, i, j, score_floor, span_bonus)
+
+
+@njit(cache=True, nogil=True)
+def _dp_suffix(span_scores, span_choices, n_span, cum_scores, final_choices, start_pos, first, last_changed, max_prev):
+    """
+    从第 first 拍开始，用缓存的区间得分重新进行只包含加法与比较的动态规划
+
+    * 第 last_changed 拍之后的区间得分没有变化，连续 max_prev 拍的结果与缓存相同时，之后的结果也必然相同，提前结束
+
+    :return: 停止时的拍数
+    """
+    n_frame = len(n_span)
+    n_same = 0
+    for i in range(first, n_frame):
+        best_score = -np.inf
+        best_choice = 0
+        best_pos = 0
+        for j in range(n_span[i]):
+            pre_score = 0 if i - j == 0 else cum_scores[i - j - 1]
+            cur_score = pre_score + span_scores[i, j]
+            if best_score < cur_score:
+                best_score = cur_score
+                best_choice = span_choices[i, j]
+                best_pos = i - j - 1
+        if i > last_changed and best_score == cum_scores[i] and best_choice == final_choices[i] \
+                and best_pos == start_pos[i]:
+            n_same += 1
+            if n_same >= max_prev:
+                return i + 1
+        else:
+            n_same = 0
+            cum_scores[i] = best_score
+            final_choices[i] = best_choice
+            start_pos[i] = best_pos
+    return n_frame
+
+
+def _resize(array: np.ndarray, n: int, fill=0) -> np.ndarray:
+    if len(array) >= n:
+        return array[:n]
+    result = np.full((n, *array.shape[1:]), fill, dtype=array.dtype)
+    result[:len(array)] = array
+    return result
+
+
+class RecognitionSession:
+    """
+    增量的和弦识别，用于编辑器中逐个修改 note 后重新识别，结果与对修改后的 Sequence 调用 recognize_chords 完全相同
+
+    * 缓存每个 track 的逐拍统计、逐拍特征及其定点量化、每个候选区间的特征与得分以及动态规划的结果；
+      拍数由每一拍结束的 note 数维护，不需要遍历 note
+    * 修改 note 后只重新统计受影响的拍，只有 float32 特征发生变化的区间才重新打分（打分是最主要的开销），
+      之后从第一个变化的区间开始，用缓存的得分重新进行动态规划，与缓存的路径重新汇合后提前结束
+    * 区间特征由定点量化的逐拍特征求和（见 decode.prefix_sum），没有舍入误差，只与区间内的拍有关，
+      因此一拍的特征变化后，只需要重新计算以该拍到之后 max_prev - 1 拍结尾的区间
+    * 一次修改的开销为：
+      - 被修改 track 的 note 数组（计算低音时为所有 track 的 note 数组）的一次向量化比较，用于截取受影响的 note；
+      - 修改范围内的拍，以及特征发生变化的拍之后 max_prev - 1 拍内结尾的区间的重新计算；
+      - track 的权重是整首曲目的统计量，修改音高或时长改变了平均厚度或平均低音时，可能改变多个 track 的权重，
+        此时重新计算权重变化的 track 发声的拍的 pitch 特征，并重新打分其中特征确实变化的区间，这些拍可能遍布整首曲目；
+      - 拍数变化时（在曲目结尾增删 note），与拍号相关的逐拍数组按新的拍数重建
+    * 只支持默认的 note_precision=0.25（基于网格的特征）与 float64 的解码
+    """
+
+    def __init__(self, sequence: Sequence, note_precision: float = 0.25, min_track_weight: float = 0.,
+                 max_prev: int = MAX_PREV, max_downbeats: int = 1, params: Optional[DecodeParams] = None):
+        """
+        :param sequence: 需要识别的曲目，之后的修改会直接作用在 sequence.track[i].note 上
+        :param note_precision: 见 recognize_chords，只支持默认的 0.25
+        :param min_track_weight: 见 recognize_chords
+        :param max_prev: 见 decode.score_dp
+        :param max_downbeats: 见 decode.score_dp
+        :param params: 见 decode.decode_chords
+        """
+        assert _is_grid_precision(note_precision), \
+            "only the default note_precision of 0.25 is supported in the session!"
+        assert max_prev > 0 and max_downbeats > 0, "max_prev and max_downbeats should be positive!"
+        self.sequence = sequence
+        self.note_precision = note_precision
+        self.min_track_weight = min_track_weight
+        self.max_prev = max_prev
+        self.max_downbeats = max_downbeats
+        self.params = _DEFAULT_PARAMS if params is None else params
+        self._bias = self.params.bias()
+        self._window = int(1 / note_precision)
+
+        tracks = _chord_track_index(sequence.track)
+        self._slot = {t: k for k, t in enumerate(tracks)}  # track 下标 -> 参与和弦识别的 track 的序号
+        self._notes = [_aligned_note_arr(sequence.track[t].note, note_precision) for t in tracks]
+        n_track = len(tracks)
+        # 每个 track 中 end 大于 0（参与识别）的 note 数，以及所有 track 中在每一拍结束的 note 数
+        self._n_valid = np.zeros(n_track, dtype=np.int64)
+        self._end_count = np.zeros(0, dtype=np.int64)
+        self._end_top = 0
+        for k, notes in enumerate(self._notes):
+            self._count_notes(k, notes, 1)
+
+        self.n_beat = 0
+        # 每个 track 的逐拍统计及其总和，见 _beat_stats
+        self._pc = [np.zeros((0, 12), dtype=np.int64) for _ in range(n_track)]
+        self._sounding = [np.zeros(0, dtype=np.int64) for _ in range(n_track)]
+        self._lowest_sum = [np.zeros(0, dtype=np.int64) for _ in range(n_track)]
+        self._lowest_count = [np.zeros(0, dtype=np.int64) for _ in range(n_track)]
+        self._totals = np.zeros((n_track, 4), dtype=np.int64)  # pc, sounding, lowest_sum, lowest_count 的总和
+        self._track_weight = np.zeros(n_track)
+        self._chroma = np.zeros((0, 12))
+        self._bass = np.zeros((0, 12))
+        self._fixed = np.zeros((0, 24), dtype=np.int64)  # 逐拍特征的定点量化，见 decode.fixed_features
+        # 区间与动态规划的缓存
+        self._weight = np.zeros(0, dtype=np.float32)
+        self._n_span = np.zeros(0, dtype=np.int32)
+        self._span_feature = np.zeros((0, max_prev, 24), dtype=np.float32)
+        self._span_scores = np.zeros((0, max_prev))
+        self._span_choices = np.zeros((0, max_prev), dtype=np.int32)
+        self._cum_scores = np.zeros(0)
+        self._final_choices = np.zeros(0, dtype=np.int32)
+        self._start_pos = np.zeros(0, dtype=np.int32)
+
+        self._pending = [(k, 0, np.iinfo(np.int64).max) for k in range(n_track)]
+        self.last_update: Tuple[int, int] = (0, 0)  # 上一次更新时重新进行动态规划的拍的范围
+        self._refresh()
+
+    # ---------------------------------------- 编辑 ----------------------------------------
+
+    def insert_note(self, track: int, note: Note) -> int:
+        """
+        在 track 的末尾插入 note
+
+        :return: 新 note 在 sequence.track[track].note 中的下标
+        """
+        notes = self.sequence.track[track].note
+        notes.append(note)
+        if track in self._slot:
+            k = self._slot[track]
+            new = _aligned_note_arr([note], self.note_precision)
+            self._notes[k] = np.concatenate([self._notes[k], new])
+            self._mark(k, new[:0], new)
+        return len(notes) - 1
+
+    def delete_note(self, track: int, index: int) -> Note:
+        """
+        删除 sequence.track[track].note[index]，之后的 note 下标减一
+
+        :return: 被删除的 note
+        """
+        note = self.sequence.track[track].note.pop(index)
+        if track in self._slot:
+            k = self._slot[track]
+            old = self._notes[k][index: index + 1].copy()
+            self._notes[k] = np.delete(self._notes[k], index)
+            self._mark(k, old, old[:0])
+        return note
+
+    def modify_note(self, track: int, index: int, note: Note):
+        """
+        将 sequence.track[track].note[index] 替换为 note
+        """
+        self.sequence.track[track].note[index] = note
+        if track in self._slot:
+            k = self._slot[track]
+            old = self._notes[k][index: index + 1].copy()
+            new = _aligned_note_arr([note], self.note_precision)
+            self._notes[k][index] = new[0]
+            self._mark(k, old, new)
+
+    def _count_notes(self, k: int, notes: np.ndarray, sign: int):
+        ends = notes['end'][notes['end'] > 0].astype(np.int64)
+        if len(ends) == 0:
+            return
+        self._n_valid[k] += sign * len(ends)
+        beats = ends // self._window
+        top = int(beats.max()) + 1
+        if top > len(self._end_count):
+            self._end_count = _resize(self._end_count, max(top, 2 * len(self._end_count)))
+        np.add.at(self._end_count, beats, sign)
+        self._end_top = max(self._end_top, top)
+
+    def _mark(self, k: int, old: np.ndarray, new: np.ndarray):
+        self._count_notes(k, old, -1)
+        self._count_notes(k, new, 1)
+        changed = np.concatenate([old, new])
+        changed = changed[changed['end'] > 0]
+        if len(changed) > 0:
+            first = int(changed['start'].min()) // self._window
+            last = -(-int(changed['end'].max()) // self._window)
+            self._pending.append((k, first, last))
+
+    # ---------------------------------------- 识别 ----------------------------------------
+
+    def recognize(self, with_seconds: bool = False, as_timeline: bool = False) -> Union[pd.DataFrame, ChordTimeline]:
+        """
+        更新所有尚未处理的修改，返回与 recognize_chords(self.sequence, ...) 相同的和弦
+
+        :param with_seconds: 见 recognize_chords
+        :param as_timeline: 见 decode.decode_chords
+        """
+        self._refresh()
+        segments = np.empty(0, dtype=segment_type)
+        if self.n_beat > 0:
+            starts, ends, chords = backtrack_segments(self._final_choices, self._start_pos)
+            segments = np.empty(len(chords), dtype=segment_type)
+            segments['start'] = starts
+            segments['end'] = ends
+            segments['chord'] = chords
+        tempo_map = TempoMap.from_qpm(self.sequence.qpm) if with_seconds else None
+        if as_timeline:
+            return ChordTimeline.from_segments(segments, tempo_map=tempo_map)
+        return segments_to_frame(segments, tempo_map)
+
+    def _count_beats(self) -> int:
+        # 与 feature.count_beats 相同，即最后一个 note 结束的拍 + 1；只在末尾的 note 被删除时向前查找
+        while self._end_top > 0 and self._end_count[self._end_top - 1] == 0:
+            self._end_top -= 1
+        return self._end_top
+
+    def _compute_track_weight(self) -> np.ndarray:
+        weight = np.zeros(len(self._notes))
+        index = np.flatnonzero(self._n_valid > 0)
+        if len(index) == 0:
+            return weight
+        global_end = self.n_beat * self._window
+        pc_sum, sounding, lowest_sum, lowest_count = self._totals[index].T
+        thickness_mean = [p / s if s > 0 else 0 for p, s in zip(pc_sum, sounding)]
+        bass_mean = [ls / lc if lc / global_end > 0.2 else 128 for ls, lc in zip(lowest_sum, lowest_count)]
+        weight[index] = weight_from_stats(thickness_mean, bass_mean)
+        return weight
+
+    def _chroma_rows(self, rows: np.ndarray) -> np.ndarray:
+        chroma = np.zeros((len(rows), 12))
+        for k in range(len(self._notes)):
+            w = self._track_weight[k]
+            if self._n_valid[k] == 0 or w < self.min_track_weight:
+                continue
+            np.maximum(chroma, self._pc[k][rows] * (w / self._window), out=chroma)
+        return chroma
+
+    def _bass_rows(self, lo: int, hi: int) -> np.ndarray:
+        local = np.concatenate(
+            [_clip_notes(notes, lo * self._window, hi * self._window) for notes in self._notes] or
+            [np.empty(0, dtype=note_type)])
+        if len(local) == 0:
+            return np.zeros((hi - lo, 12))
+        return _grid_bass_chroma(local, (hi - lo) * self._window, self._window)
+
+    def _refresh(self):
+        if len(self._pending) == 0:
+            return
+        old_n, new_n = self.n_beat, self._count_beats()
+        size = max(old_n, new_n)
+
+        # 1. 逐拍统计，先在 max(old_n, new_n) 的范围内更新，超出 new_n 的拍已经没有 note
+        ranges = []
+        for k in range(len(self._notes)):
+            self._pc[k] = _resize(self._pc[k], size)
+            self._sounding[k] = _resize(self._sounding[k], size)
+            self._lowest_sum[k] = _resize(self._lowest_sum[k], size)
+            self._lowest_count[k] = _resize(self._lowest_count[k], size)
+        for k, lo, hi in self._pending:
+            lo, hi = max(lo, 0), min(hi, size)
+            if hi <= lo:
+                continue
+            stats = _beat_stats(self._notes[k], lo, hi, self._window)
+            for cache, new, column in zip(
+                    (self._pc[k], self._sounding[k], self._lowest_sum[k], self._lowest_count[k]), stats, range(4)):
+                self._totals[k, column] += new.sum() - cache[lo: hi].sum()
+                cache[lo: hi] = new
+            ranges.append((lo, min(hi, new_n)))
+        self._pending = []
+        for k in range(len(self._notes)):
+            self._pc[k] = self._pc[k][:new_n]
+            self._sounding[k] = self._sounding[k][:new_n]
+            self._lowest_sum[k] = self._lowest_sum[k][:new_n]
+            self._lowest_count[k] = self._lowest_count[k][:new_n]
+        self.n_beat = new_n
+
+        # 2. 逐拍特征，track 权重变化时只重新计算该 track 发声的拍
+        old_weight, self._track_weight = self._track_weight, self._compute_track_weight()
+        dirty = [np.arange(lo, hi) for lo, hi in ranges] + [np.arange(old_n, new_n)]
+        dirty += [np.flatnonzero(self._sounding[k]) for k in np.flatnonzero(self._track_weight != old_weight)]
+        rows = np.unique(np.concatenate(dirty))
+        chroma, bass = _resize(self._chroma, new_n), _resize(self._bass, new_n)
+        old_chroma, old_bass = chroma[rows], bass[rows]
+        chroma[rows] = self._chroma_rows(rows)
+        for lo, hi in ranges:
+            if hi > lo:
+                bass[lo: hi] = self._bass_rows(lo, hi)
+        self._chroma, self._bass = chroma, bass
+        changed = rows[(rows >= old_n) | np.any(chroma[rows] != old_chroma, axis=1) |
+                       np.any(bass[rows] != old_bass, axis=1)]
+
+        # 3. 区间特征，只有以变化的拍到之后 max_prev - 1 拍结尾的区间可能变化，其中 float32 特征变化的区间需要重新打分
+        if new_n != old_n:
+            downbeat, self._weight = downbeat_and_score_weight(
+                new_n, self.sequence.timeSignature, beat_weights=self.params.beat_weights)
+            self._n_span = _count_spans(downbeat, self.max_prev, self.max_downbeats)
+            self._fixed = _resize(self._fixed, new_n)
+            self._span_feature = _resize(self._span_feature, new_n, np.nan)
+            self._span_scores = _resize(self._span_scores, new_n)
+            self._span_choices = _resize(self._span_choices, new_n)
+            self._cum_scores = _resize(self._cum_scores, new_n, np.nan)
+            self._final_choices = _resize(self._final_choices, new_n)
+            self._start_pos = _resize(self._start_pos, new_n)
+        if len(changed) == 0:
+            self.last_update = (new_n, new_n)
+            return
+        self._fixed[changed] = fixed_features(np.concatenate([chroma[changed], bass[changed]], axis=1))
+        span_rows = np.unique((changed[:, None] + np.arange(self.max_prev)).ravel())
+        span_rows = span_rows[span_rows < new_n]
+        span_feature = self._span_sums(span_rows)
+        valid = np.arange(self.max_prev) < self._n_span[span_rows, None]
+        rows, cols = np.nonzero(valid & np.any(span_feature != self._span_feature[span_rows], axis=2))
+        self._span_feature[span_rows] = span_feature
+        if len(rows) > 0:
+            rows = span_rows[rows].astype(np.int64)
+            cols = cols.astype(np.int64)
+            _rescore_spans(self._span_feature, rows, cols, self._weight, self.params.score_floor,
+                           self.params.span_bonus, self._bias, self._span_scores, self._span_choices)
+            first_row, last_row = int(rows[0]), int(rows[-1])
+        else:
+            first_row, last_row = old_n, old_n - 1
+
+        # 4. 动态规划，新增的拍总是需要计算
+        first_dp = min(first_row, old_n)
+        last_changed = max(last_row, new_n - 1 if new_n > old_n else -1)
+        if first_dp < new_n:
+            stop = _dp_suffix(self._span_scores, self._span_choices, self._n_span, self._cum_scores,
+                              self._final_choices, self._start_pos, first_dp, last_changed, self.max_prev)
+            self.last_update = (first_dp, stop)
+        else:
+            self.last_update = (new_n, new_n)
+
+    def _span_sums(self, rows: np.ndarray) -> np.ndarray:
+        """
+        由定点量化的逐拍特征求得以 rows 中每一拍结尾的所有候选区间的特征，整数求和没有误差，与 decode._span_features 逐位相同
+
+        :return: shape 为 [len(rows), max_prev, 24]，float32，不存在的区间为 nan
+        """
+        result = np.full((len(rows), self.max_prev, 24), np.nan, dtype=np.float32)
+        total = np.zeros((len(rows), 24), dtype=np.int64)
+        n_span = self._n_span[rows]
+        for j in range(self.max_prev):
+            active = np.flatnonzero(j < n_span)
+            if len(active) == 0:
+                break
+            total[active] += self._fixed[rows[active] - j]
+            result[active, j] = (total[active] * (1 / PREFIX_SCALE)).astype(np.float32)
+        return result
@@ -0,0 +1,206 @@
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .config import CHORD_CONFIG
+from .util import TempoMap
+
+
+class ChordTimeline:
+    """
+    按时间排序的和弦片段，由 start, end, chord 三个数组表示，用于对识别结果进行批量的时间点查询与区间查询
+
+    * 片段 [start, end] 覆盖 [start, end + 1) 拍，片段之间互不重叠，start 与 end 均单调递增，查询由 np.searchsorted 完成
+    * 数据由若干块连续的数组组成，切片与拼接只引用原数组的视图，不会拷贝片段数据
+    * chord 为 CHORD_CONFIG 中的和弦序号，-1 表示 N
+    """
+
+    def __init__(self, parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = (),
+                 tempo_map: Optional[TempoMap] = None):
+        """
+        :param parts: 按时间顺序排列的 (start, end, chord) 数组，可以为视图；通常由 from_arrays, from_segments 得到
+        :param tempo_map: 可选，to_frame 时额外输出以秒为单位的 start_sec 与 end_sec 两列
+        """
+        self._parts = [part for part in parts if len(part[0]) > 0]
+        self.tempo_map = tempo_map
+        self._first = np.array([starts[0] for starts, _, _ in self._parts], dtype=np.int64)
+        self._count = np.cumsum([0, *(len(starts) for starts, _, _ in self._parts)])
+
+    @classmethod
+    def from_arrays(cls, starts, ends, chords, tempo_map: Optional[TempoMap] = None) -> "ChordTimeline":
+        """
+        :param starts: 每个片段的第一拍
+        :param ends: 每个片段的最后一拍（闭区间）
+        :param chords: 每个片段的和弦序号，-1 表示 N
+        """
+        starts = np.ascontiguousarray(starts, dtype=np.int64)
+        ends = np.ascontiguousarray(ends, dtype=np.int64)
+        chords = np.ascontiguousarray(chords, dtype=np.int32)
+        assert len(starts) == len(ends) == len(chords), "starts, ends and chords should have the same length!"
+        assert np.all(starts <= ends) and np.all(starts[1:] > ends[:-1]), \
+            "chord segments should be sorted and non-overlapping!"
+        return cls([(starts, ends, chords)], tempo_map)
+
+    @classmethod
+    def from_segments(cls, segments: np.ndarray, offset: int = 0,
+                      tempo_map: Optional[TempoMap] = None) -> "ChordTimeline":
+        """
+        由和弦片段构建只有一块数据的 timeline，start 与 end 转换为 int64 并加上 offset，因此会拷贝一次
+
+        :param segments: dtype 为 decode.segment_type 的和弦片段，例如 ChunkedDecoder 的输出
+        :param offset: 见 decode.decode_chords
+        """
+        return cls.from_arrays(
+            segments['start'].astype(np.int64) + offset, segments['end'].astype(np.int64) + offset,
+            segments['chord'], tempo_map)
+
+    @classmethod
+    def from_frame(cls, chords: pd.DataFrame, tempo_map: Optional[TempoMap] = None) -> "ChordTimeline":
+        """
+        :param chords: decode_chords 或者 recognize_chords 返回的 DataFrame
+        """
+        index = {name: i for i, name in enumerate(CHORD_CONFIG['name'][:-1])}
+        return cls.from_arrays(
+            chords['start'].to_numpy(), chords['end'].to_numpy(),
+            [index.get(name, -1) for name in chords['name']], tempo_map)
+
+    @classmethod
+    def concat(cls, timelines: Iterable["ChordTimeline"]) -> "ChordTimeline":
+        """
+        按时间顺序拼接多个 timeline，不拷贝片段数据，相邻的相同和弦不会被合并
+
+        * tempo_map 取第一个 timeline 的 tempo_map
+        """
+        timelines = list(timelines)
+        parts = [part for timeline in timelines for part in timeline._parts]
+        for (_, prev_ends, _), (next_starts, _, _) in zip(parts[:-1], parts[1:]):
+            assert next_starts[0] > prev_ends[-1], "timelines should be concatenated in time order!"
+        return cls(parts, timelines[0].tempo_map if timelines else None)
+
+    def __add__(self, other: "ChordTimeline") -> "ChordTimeline":
+        return ChordTimeline.concat([self, other])
+
+    def __len__(self) -> int:
+        return int(self._count[-1])
+
+    def __repr__(self):
+        return f"ChordTimeline(n_segment={len(self)}, n_part={len(self._parts)})"
+
+    def _column(self, k: int) -> np.ndarray:
+        if len(self._parts) == 1:
+            return self._parts[0][k]
+        if len(self._parts) == 0:
+            return np.zeros(0, dtype=np.int32 if k == 2 else np.int64)
+        return np.concatenate([part[k] for part in self._parts])
+
+    @property
+    def starts(self) -> np.ndarray:
+        """
+        所有片段的 start，只有一块数据时为视图，否则为拼接后的拷贝，chords, ends 相同
+        """
+        return self._column(0)
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self._column(1)
+
+    @property
+    def chords(self) -> np.ndarray:
+        return self._column(2)
+
+    @property
+    def names(self) -> np.ndarray:
+        return CHORD_CONFIG['name'][self.chords]
+
+    def __getitem__(self, item: Union[int, slice]):
+        """
+        按片段序号索引，整数返回 (start, end, name)，步长为 1 的切片返回新的 timeline（视图）
+        """
+        n = len(self)
+        if isinstance(item, slice):
+            lo, hi, step = item.indices(n)
+            assert step == 1, "only slices with step 1 are supported!"
+            parts = []
+            for (starts, ends, chords), base in zip(self._parts, self._count[:-1]):
+                a, b = max(lo - base, 0), min(hi - base, len(starts))
+                if b > a:
+                    parts.append((starts[a: b], ends[a: b], chords[a: b]))
+            return ChordTimeline(parts, self.tempo_map)
+        item = int(item)
+        if item < 0:
+            item += n
+        if not 0 <= item < n:
+            raise IndexError(f"index {item} is out of range!")
+        p = int(np.searchsorted(self._count, item, side='right')) - 1
+        starts, ends, chords = self._parts[p]
+        k = item - self._count[p]
+        return int(starts[k]), int(ends[k]), CHORD_CONFIG['name'][chords[k]]
+
+    def index_at(self, beats) -> np.ndarray:
+        """
+        批量查询每个时间点所在片段的序号
+
+        :param beats: 时间点，单位为 1拍，可以为小数，标量或者任意形状的数组
+        :return: 与 beats 形状相同的 int64 数组，没有被任何片段覆盖的时间点为 -1
+        """
+        beats = np.asarray(beats, dtype=np.float64)
+        result = np.full(beats.shape, -1, dtype=np.int64)
+        if len(self._parts) == 0:
+            return result
+        part = np.searchsorted(self._first, beats, side='right') - 1
+        for p in np.unique(part[part >= 0]):
+            starts, ends, _ = self._parts[p]
+            mask = part == p
+            k = np.searchsorted(starts, beats[mask], side='right') - 1
+            result[mask] = np.where(beats[mask] < ends[k] + 1, k + self._count[p], -1)
+        return result
+
+    def chords_at(self, beats) -> np.ndarray:
+        """
+        :return: 每个时间点的和弦序号，未被覆盖的时间点为 -1，即 N
+        """
+        index = self.index_at(beats)
+        if len(self) == 0:
+            return np.full(index.shape, -1, dtype=np.int32)
+        return np.where(index >= 0, self.chords[np.maximum(index, 0)], -1).astype(np.int32)
+
+    def names_at(self, beats) -> np.ndarray:
+        """
+        :return: 每个时间点的和弦名，未被覆盖的时间点为 N
+        """
+        return CHORD_CONFIG['name'][self.chords_at(beats)]
+
+    def between(self, start: float, end: float) -> "ChordTimeline":
+        """
+        区间查询，返回与 [start, end) 拍有重叠的所有片段（不裁剪），结果为视图
+
+        * 需要按小节查询时，先由 decode.bar_to_beat 将小节序号转换为拍数
+        """
+        parts = []
+        for starts, ends, chords in self._parts:
+            a = np.searchsorted(ends, start - 1, side='right')
+            b = np.searchsorted(starts, end, side='left')
+            if b > a:
+                parts.append((starts[a: b], ends[a: b], chords[a: b]))
+        return ChordTimeline(parts, self.tempo_map)
+
+    def to_frame(self, tempo_map: Optional[TempoMap] = None) -> pd.DataFrame:
+        """
+        转换为与 decode_chords 相同格式的 DataFrame
+
+        :param tempo_map: 可选，为空时使用 self.tempo_map
+        """
+        tempo_map = self.tempo_map if tempo_map is None else tempo_map
+        chord_pitches = CHORD_CONFIG['pitch']
+        chords = self.chords
+        df = pd.DataFrame({
+            'start': self.starts,
+            'end': self.ends,
+            'name': CHORD_CONFIG['name'][chords],
+            'pitch': [list(chord_pitches[choice]) if choice != -1 else [] for choice in chords.tolist()]
+        })
+        if tempo_map is not None:
+            df['start_sec'] = tempo_map.beats_to_seconds(df['start'].to_numpy())
+            df['end_sec'] = tempo_map.beats_to_seconds(df['end'].to_numpy() + 1)
+        return df
@@ -1,2 +1,4 @@
 from .noteSet import Note, NoteSet
-from .sequence import Track, Sequence, GlobalChange, TimeSignature, TrackChange
+from .sequence import Track, Sequence, GlobalChange, TimeSignature, TrackChange, detect_format
+from .tempoMap import TempoMap
+from .msfIO import MsfContainerReader, MsfContainerWriter, read_msf_arrays, write_msf_arrays, is_msf_header
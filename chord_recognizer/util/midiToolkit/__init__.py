@@ -1,3 +1,3 @@
-from .parser import MidiFile
+from .parser import MidiFile, LOAD_ALL, LOAD_CHORD
 from .containers import KeySignature, TimeSignature, Lyric, Note, PitchBend, ControlChange, Instrument, TempoChange, \
     Marker, Pedal
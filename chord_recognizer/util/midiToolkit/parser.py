@@ -1,16 +1,58 @@
 import collections
 import functools
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import struct
 import mido
 import numpy as np
+from mido.midifiles.meta import meta_charset
+from numba import njit
 
 from .containers import KeySignature, TimeSignature, Lyric, Note, PitchBend, ControlChange, Instrument, TempoChange, \
     Marker, Pedal
+from .reader import read_midi, split_tracks, scan_track, build_track_events, RawMidi, RawParseError, \
+    charset_lock
+from ..tempoMap import TempoMap
 
 DEFAULT_BPM = int(120)
 
+# event groups that can be selected with the ``load`` argument of MidiFile
+LOAD_ALL = frozenset({
+    'notes', 'tempo', 'time_signature', 'key_signature', 'markers', 'lyrics', 'control_changes', 'pitch_bends'})
+# the event groups used by chord recognition
+LOAD_CHORD = frozenset({'notes', 'tempo', 'time_signature'})
+# numba's tbb thread pool is not fork-safe: forking a process that has run a parallel
+# kernel hangs it at exit, so worker processes are started by a forkserver (spawn if unavailable)
+_MP_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
 
 class MidiFile(object):
-    def __init__(self, filename=None, file=None, ticks_per_beat=480, clip=False, charset='latin1'):
+    def __init__(self, filename=None, file=None, ticks_per_beat=480, clip=False, charset='latin1', load=None,
+                 n_jobs=1):
+        """
+        Parameters
+        ----------
+        load : set of str, optional
+            Event groups to load, a subset of ``LOAD_ALL``, e.g.
+            ``{'notes', 'tempo', 'time_signature'}``. Unselected groups are
+            skipped during the parse and left empty (tempo falls back to
+            the default bpm). None loads everything. Pedals are derived
+            from control changes.
+        file : bytes-like or file object, optional
+            A bytes-like object (bytes, bytearray, memoryview, ...) is
+            scanned in place without copying; a file object is read once.
+        n_jobs : int
+            Number of worker processes used to parse the tracks of a type-1
+            file. The instruments are merged in track order, so the result
+            does not depend on ``n_jobs``. Only worth it for large multitrack
+            files, as every worker has to send its notes back.
+
+        """
+        load = LOAD_ALL if load is None else frozenset(load)
+        if not load <= LOAD_ALL:
+            raise ValueError('Invalid load groups: {}'.format(sorted(load - LOAD_ALL)))
         # create empty file
         if (filename is None and file is None):
             self.ticks_per_beat = ticks_per_beat
@@ -26,30 +68,45 @@ class MidiFile(object):
         else:
             if filename:
                 # filename
-                mido_obj = mido.MidiFile(filename=filename, clip=clip, charset=charset)
+                with open(filename, 'rb') as f:
+                    data = f.read()
+            elif isinstance(file, (bytes, bytearray, memoryview)):
+                data = memoryview(file).cast('B')
             else:
-                mido_obj = mido.MidiFile(file=file, clip=clip, charset=charset)
+                data = file.read()
+
+            # scan the raw bytes and only keep the selected events, fall back to mido for unusual files
+            instruments = None
+            try:
+                if n_jobs > 1:
+                    mido_obj, max_tick, instruments = _read_midi_parallel(data, load, clip, charset, n_jobs)
+                else:
+                    mido_obj, max_tick = read_midi(data, load, clip=clip, charset=charset)
+            except RawParseError:
+                with charset_lock:
+                    mido_obj = mido.MidiFile(file=io.BytesIO(data), clip=clip, charset=charset)
+                # convert delta time to cumulative time
+                mido_obj = self._convert_delta_to_cumulative(mido_obj)
+                max_tick = max([max([e.time for e in t]) for t in mido_obj.tracks]) + 1
 
             # ticks_per_beat
             self.ticks_per_beat = mido_obj.ticks_per_beat
 
-            # convert delta time to cumulative time
-            mido_obj = self._convert_delta_to_cumulative(mido_obj)
-
             # load tempo changes
-            self.tempo_changes = self._load_tempo_changes(mido_obj)
+            self.tempo_changes = self._load_tempo_changes(mido_obj) \
+                if 'tempo' in load else [TempoChange(DEFAULT_BPM, 0)]
 
             # load key signatures
-            self.key_signature_changes = self._load_key_signatures(mido_obj)
+            self.key_signature_changes = self._load_key_signatures(mido_obj) if 'key_signature' in load else []
 
             # load time signatures
-            self.time_signature_changes = self._load_time_signatures(mido_obj)
+            self.time_signature_changes = self._load_time_signatures(mido_obj) if 'time_signature' in load else []
 
             # load markers
-            self.markers = self._load_markers(mido_obj)
+            self.markers = self._load_markers(mido_obj) if 'markers' in load else []
 
             # load lyrics
-            self.lyrics = self._load_lyrics(mido_obj)
+            self.lyrics = self._load_lyrics(mido_obj) if 'lyrics' in load else []
 
             # sort events by time
             self.time_signature_changes.sort(key=lambda ts: ts.time)
@@ -57,10 +114,12 @@ class MidiFile(object):
             self.lyrics.sort(key=lambda lyc: lyc.time)
 
             # compute max tick
-            self.max_tick = max([max([e.time for e in t]) for t in mido_obj.tracks]) + 1
+            self.max_tick = max_tick
 
             # load instruments
-            self.instruments = self._load_instruments(mido_obj)
+            if instruments is None:
+                instruments = self._load_instruments(mido_obj, load)
+            self.instruments = instruments
 
         # tick and sec mapping
 
@@ -142,7 +201,21 @@ class MidiFile(object):
                     lyrics.append(Lyric(event.text, event.time))
         return lyrics
 
-    def _load_instruments(self, midi_data):
+    def _load_instruments(self, midi_data, load=LOAD_ALL):
+        instruments = []
+        for track_idx, track in enumerate(midi_data.tracks):
+            instruments.extend(self._load_track_instruments(track_idx, track, load))
+        return instruments
+
+    @staticmethod
+    def _load_track_instruments(track_idx, track, load=LOAD_ALL):
+        """Load the instruments of one track, in the order they are created.
+        Instruments never span tracks, so tracks can be loaded independently.
+
+        """
+        load_notes = 'notes' in load
+        load_pitch_bends = 'pitch_bends' in load
+        load_control_changes = 'control_changes' in load
         instrument_map = collections.OrderedDict()
         # Store a similar mapping to instruments storing "straggler events",
         # e.g. events which appear before we want to initialize an Instrument
@@ -190,112 +263,111 @@ class MidiFile(object):
                 stragglers[(channel, track)] = instrument
             return instrument
 
-        for track_idx, track in enumerate(midi_data.tracks):
-            # Keep track of last note on location:
-            # key = (instrument, note),
-            # value = (note-on tick, velocity)
-            last_note_on = collections.defaultdict(list)
-            # Keep track of which instrument is playing in each channel
-            # initialize to program 0 for all channels
-            current_instrument = np.zeros(16, dtype=np.int)
-            ped_list = []
-            for event in track:
-                # Look for track name events
-                if event.type == 'track_name':
-                    # Set the track name for the current track
-                    track_name_map[track_idx] = event.name
-                # Look for program change events
-                if event.type == 'program_change':
-                    # Update the instrument for this channel
-                    current_instrument[event.channel] = event.program
-                # Note ons are note on events with velocity > 0
-                elif event.type == 'note_on' and event.velocity > 0:
-                    # Store this as the last note-on location
-                    note_on_index = (event.channel, event.note)
-                    last_note_on[note_on_index].append((
-                        event.time, event.velocity))
-                # Note offs can also be note on events with 0 velocity
-                elif event.type == 'note_off' or (event.type == 'note_on' and
-                                                  event.velocity == 0):
-                    # Check that a note-on exists (ignore spurious note-offs)
-                    key = (event.channel, event.note)
-                    if key in last_note_on:
-                        # Get the start/stop times and velocity of every note
-                        # which was turned on with this instrument/drum/pitch.
-                        # One note-off may close multiple note-on events from
-                        # previous ticks. In case there's a note-off and then
-                        # note-on at the same tick we keep the open note from
-                        # this tick.
-                        end_tick = event.time
-                        open_notes = last_note_on[key]
-
-                        notes_to_close = [
-                            (start_tick, velocity)
-                            for start_tick, velocity in open_notes
-                            if start_tick != end_tick]
-                        notes_to_keep = [
-                            (start_tick, velocity)
-                            for start_tick, velocity in open_notes
-                            if start_tick == end_tick]
-
-                        for start_tick, velocity in notes_to_close:
-                            start_time = start_tick
-                            end_time = end_tick
-                            # Create the note event
-                            note = Note(velocity, event.note, start_time,
-                                        end_time)
-                            # Get the program and drum type for the current
-                            # instrument
-                            program = current_instrument[event.channel]
-                            # Retrieve the Instrument instance for the current
-                            # instrument
-                            # Create a new instrument if none exists
-                            instrument = __get_instrument(
-                                program, event.channel, track_idx, 1)
-                            # Add the note event
-                            instrument.notes.append(note)
-
-                        if len(notes_to_close) > 0 and len(notes_to_keep) > 0:
-                            # Note-on on the same tick but we already closed
-                            # some previous notes -> it will continue, keep it.
-                            last_note_on[key] = notes_to_keep
-                        else:
-                            # Remove the last note on for this instrument
-                            del last_note_on[key]
-                # Store pitch bends
-                elif event.type == 'pitchwheel':
-                    # Create pitch bend class instance
-                    bend = PitchBend(event.pitch, event.time)
-                    # Get the program for the current inst
-                    program = current_instrument[event.channel]
-                    # Retrieve the Instrument instance for the current inst
-                    # Don't create a new instrument if none exists
-                    instrument = __get_instrument(
-                        program, event.channel, track_idx, 0)
-                    # Add the pitch bend event
-                    instrument.pitch_bends.append(bend)
-                # Store control changes
-                elif event.type == 'control_change':
-                    control_change = ControlChange(
-                        event.control, event.value, event.time)
-                    # Get the program for the current inst
-                    program = current_instrument[event.channel]
-                    # Retrieve the Instrument instance for the current inst
-                    # Don't create a new instrument if none exists
-                    instrument = __get_instrument(
-                        program, event.channel, track_idx, 0)
+        # Keep track of last note on location:
+        # key = (instrument, note),
+        # value = (note-on tick, velocity)
+        last_note_on = collections.defaultdict(list)
+        # Keep track of which instrument is playing in each channel
+        # initialize to program 0 for all channels
+        current_instrument = np.zeros(16, dtype=np.int)
+        ped_list = []
+        for event in track:
+            # Look for track name events
+            if event.type == 'track_name':
+                # Set the track name for the current track
+                track_name_map[track_idx] = event.name
+            # Look for program change events
+            if event.type == 'program_change':
+                # Update the instrument for this channel
+                current_instrument[event.channel] = event.program
+            # Note ons are note on events with velocity > 0
+            elif event.type == 'note_on' and event.velocity > 0 and load_notes:
+                # Store this as the last note-on location
+                note_on_index = (event.channel, event.note)
+                last_note_on[note_on_index].append((
+                    event.time, event.velocity))
+            # Note offs can also be note on events with 0 velocity
+            elif load_notes and (event.type == 'note_off' or (event.type == 'note_on' and
+                                                              event.velocity == 0)):
+                # Check that a note-on exists (ignore spurious note-offs)
+                key = (event.channel, event.note)
+                if key in last_note_on:
+                    # Get the start/stop times and velocity of every note
+                    # which was turned on with this instrument/drum/pitch.
+                    # One note-off may close multiple note-on events from
+                    # previous ticks. In case there's a note-off and then
+                    # note-on at the same tick we keep the open note from
+                    # this tick.
+                    end_tick = event.time
+                    open_notes = last_note_on[key]
+
+                    notes_to_close = [
+                        (start_tick, velocity)
+                        for start_tick, velocity in open_notes
+                        if start_tick != end_tick]
+                    notes_to_keep = [
+                        (start_tick, velocity)
+                        for start_tick, velocity in open_notes
+                        if start_tick == end_tick]
+
+                    for start_tick, velocity in notes_to_close:
+                        start_time = start_tick
+                        end_time = end_tick
+                        # Create the note event
+                        note = Note(velocity, event.note, start_time,
+                                    end_time)
+                        # Get the program and drum type for the current
+                        # instrument
+                        program = current_instrument[event.channel]
+                        # Retrieve the Instrument instance for the current
+                        # instrument
+                        # Create a new instrument if none exists
+                        instrument = __get_instrument(
+                            program, event.channel, track_idx, 1)
+                        # Add the note event
+                        instrument.notes.append(note)
+
+                    if len(notes_to_close) > 0 and len(notes_to_keep) > 0:
+                        # Note-on on the same tick but we already closed
+                        # some previous notes -> it will continue, keep it.
+                        last_note_on[key] = notes_to_keep
+                    else:
+                        # Remove the last note on for this instrument
+                        del last_note_on[key]
+            # Store pitch bends
+            elif event.type == 'pitchwheel' and load_pitch_bends:
+                # Create pitch bend class instance
+                bend = PitchBend(event.pitch, event.time)
+                # Get the program for the current inst
+                program = current_instrument[event.channel]
+                # Retrieve the Instrument instance for the current inst
+                # Don't create a new instrument if none exists
+                instrument = __get_instrument(
+                    program, event.channel, track_idx, 0)
+                # Add the pitch bend event
+                instrument.pitch_bends.append(bend)
+            # Store control changes
+            elif event.type == 'control_change' and load_control_changes:
+                control_change = ControlChange(
+                    event.control, event.value, event.time)
+                # Get the program for the current inst
+                program = current_instrument[event.channel]
+                # Retrieve the Instrument instance for the current inst
+                # Don't create a new instrument if none exists
+                instrument = __get_instrument(
+                    program, event.channel, track_idx, 0)
+                # Add the control change event
+                instrument.control_changes.append(control_change)
+
+                # Process pedals
+                if ped_list and event.control == 64 and event.value == 0:  # pedal list not empty: already have 'on'
+                    ped_list.append(event)  # Now have on and off
+                    pedal = Pedal(ped_list[0].time, ped_list[1].time)
                     # Add the control change event
-                    instrument.control_changes.append(control_change)
-
-                    # Process pedals
-                    if ped_list and event.control == 64 and event.value == 0:  # pedal list not empty: already have 'on'
-                        ped_list.append(event)  # Now have on and off
-                        pedal = Pedal(ped_list[0].time, ped_list[1].time)
-                        # Add the control change event
-                        instrument.pedals.append(pedal)
-                        ped_list = []
-                    elif not ped_list and event.control == 64 and event.value == 127:
-                        ped_list.append(event)  # Now only have on
+                    instrument.pedals.append(pedal)
+                    ped_list = []
+                elif not ped_list and event.control == 64 and event.value == 127:
+                    ped_list.append(event)  # Now only have on
 
         # Initialize list of instruments from instrument_map
         instruments = [i for i in instrument_map.values()]
@@ -307,6 +379,12 @@ class MidiFile(object):
             self.max_tick,
             self.tempo_changes)
 
+    def get_tempo_map(self):
+        """
+        返回分段线性的 TempoMap，相比 get_tick_to_time_mapping，不需要分配 max_tick + 1 长度的数组
+        """
+        return TempoMap.from_tempo_changes(self.tempo_changes, self.ticks_per_beat)
+
     def __repr__(self):
         return self.__str__()
 
@@ -371,6 +449,16 @@ class MidiFile(object):
         else:
             raise ValueError('Invalid instrument index')
 
+        # without segment, use the bulk writer, which produces the same bytes
+        if segment is None:
+            data = self.to_bytes(instrument_idx=instrument_idx, charset=charset)
+            if filename:
+                with open(filename, 'wb') as f:
+                    f.write(data)
+            else:
+                file.write(data)
+            return
+
         # crop segment
         if segment is not None:
             if not isinstance(segment, list) and not isinstance(segment, tuple):
@@ -617,6 +705,168 @@ class MidiFile(object):
             midi_parsed.save(file=file)
 
 
+    def to_bytes(self, instrument_idx=None, charset='latin1'):
+        """Encode the midi file to bytes, equivalent to ``dump`` without segment.
+
+        Sort keys are computed in bulk and events are sorted with a stable
+        ``np.lexsort`` instead of a comparator, and channel events are
+        encoded (delta time, running status) by a compiled kernel instead
+        of building one mido message per event. The output is byte
+        identical to the mido based writer.
+
+        """
+        if instrument_idx is not None and len(instrument_idx) == 0:
+            return b''
+        if isinstance(instrument_idx, int):
+            instrument_idx = [instrument_idx]
+
+        chunks = [self._encode_meta_track(charset)]
+        channels = list(range(16))
+        channels.remove(9)  # for durm
+        for cur_idx, instrument in enumerate(self.instruments):
+            if instrument_idx and cur_idx not in instrument_idx:
+                continue
+            channel = 9 if instrument.is_drum else channels[cur_idx % len(channels)]
+            data = b''
+            if instrument.name:
+                with charset_lock, meta_charset(charset):
+                    data = b'\x00' + bytes(mido.MetaMessage('track_name', name=instrument.name).bytes())
+            chunks.append(data + _encode_instrument_events(instrument, channel))
+
+        header = struct.pack('>hhh', 1, len(chunks), self.ticks_per_beat)
+        return b''.join(
+            [b'MThd', struct.pack('>I', len(header)), header] +
+            [b for chunk in chunks for b in (b'MTrk', struct.pack('>I', len(chunk)), chunk)]
+        )
+
+    def _encode_meta_track(self, charset):
+        key_number_to_mido_key_name = [
+            'C', 'Db', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B',
+            'Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am',
+            'Bbm', 'Bm']
+        # (time, secondary sort key, message), in the same insertion order as dump
+        events = []
+        if not self.time_signature_changes or min(ts.time for ts in self.time_signature_changes) > 0.0:
+            events.append((0, 2, mido.MetaMessage('time_signature', numerator=4, denominator=4)))
+        events += [
+            (ts.time, 2, mido.MetaMessage('time_signature', numerator=ts.numerator, denominator=ts.denominator))
+            for ts in self.time_signature_changes]
+        if not self.tempo_changes or min(t.time for t in self.tempo_changes) > 0.0:
+            events.append((0, 1, mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(DEFAULT_BPM))))
+        events += [
+            (t.time, 1, mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(t.tempo)))
+            for t in self.tempo_changes]
+        events += [(l.time, 5, mido.MetaMessage('lyrics', text=l.text)) for l in self.lyrics]
+        events += [(m.time, 4, mido.MetaMessage('marker', text=m.text)) for m in self.markers]
+        events += [
+            (ks.time, 3, mido.MetaMessage('key_signature', key=key_number_to_mido_key_name[ks.key_number]))
+            for ks in self.key_signature_changes]
+        events.sort(key=lambda e: (e[0], e[1]))
+
+        data = bytearray()
+        tick = 0
+        with charset_lock, meta_charset(charset):
+            for time, _, message in events:
+                data += _encode_variable_int(time - tick)
+                data += bytes(message.bytes())
+                tick = time
+        data += b'\x01\xff\x2f\x00'  # end of track, 1 tick after the last event
+        return bytes(data)
+
+
+def _encode_variable_int(value):
+    result = [value & 0x7f]
+    value >>= 7
+    while value:
+        result.append((value & 0x7f) | 0x80)
+        value >>= 7
+    return bytes(result[::-1])
+
+
+def _encode_instrument_events(instrument, channel):
+    """Collect, sort and encode all channel events of an instrument.
+
+    Sort keys follow the secondary sort of ``dump``: program change,
+    pitch bend, control change, note on (note off before note on at the
+    same tick and pitch), ties broken by insertion order.
+
+    """
+    notes = np.array(
+        [(n.start, n.end, n.pitch, n.velocity) for n in instrument.notes], dtype=np.int64).reshape(-1, 4)
+    bends = np.array([(b.time, b.pitch) for b in instrument.pitch_bends], dtype=np.int64).reshape(-1, 2)
+    if instrument.control_changes:
+        ccs = np.array(
+            [(c.time, c.number, c.value) for c in instrument.control_changes], dtype=np.int64).reshape(-1, 3)
+    else:
+        ccs = np.array(
+            [e for p in instrument.pedals for e in ((p.start, 64, 127), (p.end, 64, 0))], dtype=np.int64
+        ).reshape(-1, 3)
+    n_note = len(notes)
+
+    bend_value = bends[:, 1] + 8192
+    note_time = np.stack([notes[:, 0], notes[:, 1]], axis=1).reshape(-1)
+    note_pitch = np.repeat(notes[:, 2], 2)
+    note_velocity = np.stack([notes[:, 3], np.zeros(n_note, dtype=np.int64)], axis=1).reshape(-1)
+
+    # same insertion order as dump: program change, control changes, pitch bends, pedals, notes
+    cc_first = bool(instrument.control_changes)
+    parts = [
+        (np.zeros(1, dtype=np.int64), np.array([6 << 16]), 0xC0, np.array([instrument.program]), np.zeros(1), 1),
+        (ccs[:, 0], (8 << 16) + ccs[:, 1] * 256 + ccs[:, 2], 0xB0, ccs[:, 1], ccs[:, 2], 2),
+        (bends[:, 0], (7 << 16) + bends[:, 1], 0xE0, bend_value & 0x7f, bend_value >> 7, 2),
+        (note_time, (10 << 16) + note_pitch * 256 + note_velocity, 0x90, note_pitch, note_velocity, 2),
+    ]
+    if not cc_first:
+        parts[1], parts[2] = parts[2], parts[1]
+    time = np.concatenate([p[0] for p in parts]).astype(np.int64)
+    key = np.concatenate([p[1] for p in parts]).astype(np.int64)
+    status = np.concatenate([np.full(len(p[0]), p[2] | channel) for p in parts]).astype(np.uint8)
+    data1 = np.concatenate([p[3] for p in parts]).astype(np.uint8)
+    data2 = np.concatenate([p[4] for p in parts]).astype(np.uint8)
+    n_data = np.concatenate([np.full(len(p[0]), p[5]) for p in parts]).astype(np.uint8)
+
+    order = np.lexsort((np.arange(len(time)), key, time))
+    time, status, data1, data2, n_data = time[order], status[order], data1[order], data2[order], n_data[order]
+
+    # drop control changes whose value equals the previous control change
+    is_cc = (status & 0xF0) == 0xB0
+    cc_value = data2[is_cc].astype(np.int64)
+    keep = np.ones(len(time), dtype=bool)
+    keep[is_cc] = cc_value != np.concatenate([[0], cc_value[:-1]])
+    time, status, data1, data2, n_data = time[keep], status[keep], data1[keep], data2[keep], n_data[keep]
+
+    delta = np.diff(time, prepend=0)
+    data = _encode_channel_events(delta, status, data1, data2, n_data)
+    # end of track, 1 tick after the last event
+    return data.tobytes() + b'\x01\xff\x2f\x00'
+
+
+@njit(cache=True, nogil=True)
+def _encode_channel_events(delta, status, data1, data2, n_data):
+    out = np.empty(len(delta) * 7, dtype=np.uint8)
+    pos = 0
+    running_status = -1
+    for i in range(len(delta)):
+        # variable length quantity, big endian
+        value = delta[i]
+        n_byte = 1
+        while value >> (7 * n_byte):
+            n_byte += 1
+        for k in range(n_byte - 1, -1, -1):
+            out[pos] = ((value >> (7 * k)) & 0x7f) | (0x80 if k > 0 else 0)
+            pos += 1
+        if status[i] != running_status:
+            out[pos] = status[i]
+            pos += 1
+            running_status = status[i]
+        out[pos] = data1[i]
+        pos += 1
+        if n_data[i] == 2:
+            out[pos] = data2[i]
+            pos += 1
+    return out[:pos]
+
+
 def _check_note_within_range(note, st, ed, shift=True):
     tmp_st = max(st, note.start)
     tmp_ed = max(st, min(note.end, ed))
@@ -686,6 +936,43 @@ def _get_tick_index_by_seconds(sec, tick_to_time):
         return _find_nearest_np(tick_to_time, sec)
 
 
+def _parse_track(chunk, track_idx, load, clip, charset):
+    """Parse one MTrk chunk in a worker process.
+
+    Returns the instruments of the track, its meta events and its last tick.
+
+    """
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    scanned = scan_track(buf, 0, len(buf), load, clip)
+    events = build_track_events(buf, scanned, charset)
+    instruments = MidiFile._load_track_instruments(track_idx, events, load)
+    meta_events = [e for e in events if isinstance(e, mido.MetaMessage)]
+    return instruments, meta_events, scanned[-2]
+
+
+def _read_midi_parallel(data, load, clip, charset, n_jobs):
+    """Parse the tracks of a type-1 midi file with a process pool.
+
+    Returns a ``RawMidi`` holding the meta events of each track, the max
+    tick and the instruments of all tracks in track order. Other file types
+    and single track files are parsed serially.
+
+    """
+    midi_type, ticks_per_beat, ranges = split_tracks(data)
+    if midi_type != 1 or len(ranges) < 2:
+        midi_data, max_tick = read_midi(data, load, clip=clip, charset=charset)
+        return midi_data, max_tick, None
+
+    n = len(ranges)
+    with ProcessPoolExecutor(max_workers=min(n_jobs, n), mp_context=_MP_CONTEXT) as executor:
+        results = list(executor.map(
+            _parse_track, [bytes(data[begin: end]) for begin, end in ranges], range(n),
+            [load] * n, [clip] * n, [charset] * n))
+    instruments = [instrument for result in results for instrument in result[0]]
+    max_tick = max(result[2] for result in results) + 1
+    return RawMidi(ticks_per_beat, [result[1] for result in results]), max_tick, instruments
+
+
 def _get_tick_to_time_mapping(ticks_per_beat, max_tick, tempo_changes):
     tick_to_time = np.zeros(max_tick + 1)
     num_tempi = len(tempo_changes)
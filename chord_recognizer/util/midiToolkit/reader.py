@@ -0,0 +1,264 @@
+import struct
+import threading
+
+import numpy as np
+from mido.midifiles.meta import build_meta_message, meta_charset
+from numba import njit
+
+# status nibble (status >> 4) of channel messages and their number of data bytes
+_CHANNEL_TYPE = {
+    0x8: 'note_off', 0x9: 'note_on', 0xA: 'polytouch', 0xB: 'control_change',
+    0xC: 'program_change', 0xD: 'aftertouch', 0xE: 'pitchwheel'}
+# data bytes of system common / realtime messages, -1 for undefined status bytes
+_SYSTEM_DATA_LEN = np.array([-1, 1, 2, 1, -1, -1, 0, -1, 0, -1, 0, 0, 0, -1, 0, -1], dtype=np.int64)
+
+# which channel messages and meta messages are kept for each load group
+_LOAD_CHANNEL = {'notes': (0x8, 0x9), 'control_changes': (0xB,), 'pitch_bends': (0xE,)}
+_LOAD_META = {'tempo': (0x51,), 'time_signature': (0x58,), 'key_signature': (0x59,), 'markers': (0x06,),
+              'lyrics': (0x05,)}
+_TRACK_NAME = 0x03
+
+# error codes of _scan_track
+_OK, _ERR_RUNNING_STATUS, _ERR_DATA_BYTE, _ERR_STATUS, _ERR_OVERRUN = 0, 1, 2, 3, 4
+
+
+# mido.midifiles.meta.meta_charset switches a module global, every use of it is serialized by this lock
+charset_lock = threading.RLock()
+
+
+class RawParseError(Exception):
+    pass
+
+
+class _Event(object):
+    """A light weight channel event with the attributes of the mido message
+    that ``MidiFile`` reads. ``time`` is in cumulative ticks.
+
+    """
+    __slots__ = ('type', 'time', 'channel', 'note', 'velocity', 'control', 'value', 'program', 'pitch')
+
+    def __init__(self, type, time, channel):
+        self.type = type
+        self.time = time
+        self.channel = channel
+
+
+class RawMidi(object):
+    """The subset of ``mido.MidiFile`` used by ``MidiFile``, with cumulative
+    tick times already applied.
+
+    """
+
+    def __init__(self, ticks_per_beat, tracks):
+        self.ticks_per_beat = ticks_per_beat
+        self.tracks = tracks
+
+
+@njit(cache=True, nogil=True)
+def _read_vlq(buf, pos, end):
+    value = 0
+    while pos < end:
+        b = buf[pos]
+        pos += 1
+        value = (value << 7) | (b & 0x7f)
+        if b < 0x80:
+            return value, pos
+    return -1, pos
+
+
+@njit(cache=True, nogil=True)
+def _scan_track(buf, begin, end, keep_channel, keep_meta, clip):
+    """Scan one MTrk chunk and keep only the selected events.
+
+    Returns cumulative ticks, status bytes (0xFF for meta events), the two
+    data bytes (the meta type in ``data1`` for meta events), the payload
+    range of meta events, the tick of the last event and an error code.
+    Running status follows mido: every status byte except 0xFF sets it.
+
+    """
+    n_max = end - begin
+    tick = np.empty(n_max, dtype=np.int64)
+    status = np.empty(n_max, dtype=np.uint8)
+    data1 = np.empty(n_max, dtype=np.uint8)
+    data2 = np.empty(n_max, dtype=np.uint8)
+    meta_begin = np.empty(n_max, dtype=np.int64)
+    meta_len = np.empty(n_max, dtype=np.int64)
+
+    n = 0
+    pos = begin
+    cur_tick = 0
+    last_status = -1
+    while pos < end:
+        delta, pos = _read_vlq(buf, pos, end)
+        if delta < 0 or pos >= end:
+            return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, _ERR_OVERRUN
+        cur_tick += delta
+        s = np.int64(buf[pos])
+        if s < 0x80:
+            if last_status < 0:
+                return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, \
+                    _ERR_RUNNING_STATUS
+            s = last_status
+        else:
+            pos += 1
+            if s != 0xFF:
+                last_status = s
+
+        if s == 0xFF:
+            if pos >= end:
+                return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, \
+                    _ERR_OVERRUN
+            meta_type = buf[pos]
+            length, pos = _read_vlq(buf, pos + 1, end)
+            if length < 0 or pos + length > end:
+                return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, \
+                    _ERR_OVERRUN
+            if keep_meta[meta_type]:
+                tick[n] = cur_tick
+                status[n] = 0xFF
+                data1[n] = meta_type
+                data2[n] = 0
+                meta_begin[n] = pos
+                meta_len[n] = length
+                n += 1
+            pos += length
+        elif s == 0xF0 or s == 0xF7:
+            length, pos = _read_vlq(buf, pos, end)
+            if length < 0 or pos + length > end:
+                return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, \
+                    _ERR_OVERRUN
+            pos += length
+        else:
+            if s >= 0xF0:
+                n_data = _SYSTEM_DATA_LEN[s & 0x0F]
+                if n_data < 0:
+                    return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, \
+                        _ERR_STATUS
+            else:
+                n_data = 1 if (s >> 4) == 0xC or (s >> 4) == 0xD else 2
+            if pos + n_data > end:
+                return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, \
+                    _ERR_OVERRUN
+            d1 = np.int64(buf[pos]) if n_data > 0 else 0
+            d2 = np.int64(buf[pos + 1]) if n_data > 1 else 0
+            pos += n_data
+            if d1 > 127 or d2 > 127:
+                if not clip:
+                    return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, \
+                        _ERR_DATA_BYTE
+                d1 = min(d1, 127)
+                d2 = min(d2, 127)
+            if s < 0xF0 and keep_channel[s >> 4]:
+                tick[n] = cur_tick
+                status[n] = s
+                data1[n] = d1
+                data2[n] = d2
+                meta_begin[n] = 0
+                meta_len[n] = 0
+                n += 1
+    return tick[:n], status[:n], data1[:n], data2[:n], meta_begin[:n], meta_len[:n], cur_tick, _OK
+
+
+def _keep_masks(load):
+    keep_channel = np.zeros(16, dtype=np.bool_)
+    keep_channel[0xC] = True  # program changes decide the instruments
+    keep_meta = np.zeros(128, dtype=np.bool_)
+    keep_meta[_TRACK_NAME] = True
+    for group in load:
+        for s in _LOAD_CHANNEL.get(group, ()):
+            keep_channel[s] = True
+        for t in _LOAD_META.get(group, ()):
+            keep_meta[t] = True
+    return keep_channel, keep_meta
+
+
+def split_tracks(data):
+    """Split a standard midi file into its header fields and the byte
+    ranges of its MTrk chunks.
+
+    Returns ``(type, ticks_per_beat, [(begin, end), ...])``.
+
+    """
+    if len(data) < 14 or bytes(data[:4]) != b'MThd':
+        raise RawParseError('MThd not found. Probably not a MIDI file')
+    header_size = struct.unpack('>L', data[4:8])[0]
+    midi_type, num_tracks, ticks_per_beat = struct.unpack('>hhh', data[8:14])
+    pos = 8 + header_size
+    ranges = []
+    for _ in range(num_tracks):
+        if pos + 8 > len(data):
+            raise RawParseError('unexpected end of file')
+        name, size = struct.unpack('>4sL', data[pos: pos + 8])
+        if name != b'MTrk':
+            raise RawParseError('no MTrk header at start of track')
+        if pos + 8 + size > len(data):
+            raise RawParseError('unexpected end of file')
+        ranges.append((pos + 8, pos + 8 + size))
+        pos += 8 + size
+    return midi_type, ticks_per_beat, ranges
+
+
+def scan_track(buf, begin, end, load, clip=False):
+    """Scan the events of one track selected by ``load``, see ``_scan_track``.
+    The compiled scan releases the GIL.
+
+    """
+    keep_channel, keep_meta = _keep_masks(load)
+    result = _scan_track(buf, begin, end, keep_channel, keep_meta, clip)
+    if result[-1] != _OK:
+        raise RawParseError('invalid track data, error code {}'.format(result[-1]))
+    return result
+
+
+def build_track_events(buf, scanned, charset='latin1'):
+    """Build the event list of one track from the output of ``scan_track``."""
+    tick, status, data1, data2, meta_begin, meta_len, _, _ = scanned
+    events = []
+    for t, s, d1, d2 in zip(tick.tolist(), status.tolist(), data1.tolist(), data2.tolist()):
+        if s == 0xFF:
+            events.append(None)
+            continue
+        kind = s >> 4
+        event = _Event(_CHANNEL_TYPE[kind], t, s & 0x0F)
+        if kind == 0x8 or kind == 0x9:
+            event.note = d1
+            event.velocity = d2
+        elif kind == 0xB:
+            event.control = d1
+            event.value = d2
+        elif kind == 0xC:
+            event.program = d1
+        elif kind == 0xE:
+            event.pitch = (d1 | (d2 << 7)) - 8192
+        events.append(event)
+
+    meta_index = np.flatnonzero(status == 0xFF).tolist()
+    if meta_index:
+        with charset_lock, meta_charset(charset):
+            for k in meta_index:
+                mb, t = int(meta_begin[k]), int(tick[k])
+                event = build_meta_message(int(data1[k]), buf[mb: mb + meta_len[k]].tolist(), t)
+                event.time = t
+                events[k] = event
+    return events
+
+
+def read_midi(data, load, clip=False, charset='latin1'):
+    """Parse a standard midi file directly from a bytes-like object.
+
+    Only the event groups in ``load`` are materialized; everything else is
+    skipped by the compiled scanner without creating python objects.
+
+    Returns ``(RawMidi, max_tick)``. Raises ``RawParseError`` for input
+    that the scanner does not handle, so callers can fall back to mido.
+
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    _, ticks_per_beat, ranges = split_tracks(data)
+    tracks = []
+    max_tick = 0
+    for begin, end in ranges:
+        scanned = scan_track(buf, begin, end, load, clip)
+        max_tick = max(max_tick, scanned[-2])
+        tracks.append(build_track_events(buf, scanned, charset))
+    return RawMidi(ticks_per_beat, tracks), max_tick + 1
@@ -0,0 +1,432 @@
+import mmap
+import struct
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+from numba import njit
+
+from ..trdparty import MSF_pb2 as msf
+
+# 与 MSF 中 Note 的字段一一对应，时间单位为 quantization，attribute 的下标与 noteSet.NOTE_ATTR_TYPE 一致，缺失时为 -1
+N_NOTE_ATTR = 4
+msf_note_type = np.dtype([
+    ('pitch', np.uint32),
+    ('start', np.uint32),
+    ('duration', np.uint32),
+    ('attribute', np.int64, (N_NOTE_ATTR,))
+])
+
+# protobuf 中 Sequence 与 Track 的字段编号
+_SEQUENCE_TRACK = 3
+_TRACK_NOTE = 3
+_WIRE_VARINT, _WIRE_FIXED64, _WIRE_LEN, _WIRE_FIXED32 = 0, 1, 2, 5
+# Sequence 中每个字段合法的 tag，message 与字符串为 LEN，其余标量为 VARINT
+_SEQUENCE_TAGS = frozenset(
+    (f.number << 3) | (_WIRE_LEN if f.type in (f.TYPE_MESSAGE, f.TYPE_STRING, f.TYPE_BYTES) else _WIRE_VARINT)
+    for f in msf.Sequence.DESCRIPTOR.fields
+)
+
+
+@njit(cache=True, nogil=True)
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (np.int64(b) & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+@njit(cache=True, nogil=True)
+def _next_field(buf, pos):
+    """
+    :return: 字段编号、wire type、数值（varint 的值或者 LEN 的长度）、payload 的起点、下一个字段的起点
+    """
+    tag, pos = _read_varint(buf, pos)
+    field, wire = tag >> 3, tag & 7
+    if wire == _WIRE_VARINT:
+        value, nxt = _read_varint(buf, pos)
+        return field, wire, value, pos, nxt
+    if wire == _WIRE_LEN:
+        value, pos = _read_varint(buf, pos)
+        return field, wire, value, pos, pos + value
+    if wire == _WIRE_FIXED64:
+        return field, wire, 0, pos, pos + 8
+    if wire == _WIRE_FIXED32:
+        return field, wire, 0, pos, pos + 4
+    raise ValueError("unsupported wire type")
+
+
+@njit(cache=True, nogil=True)
+def _scan_fields(buf, begin, end):
+    """
+    扫描 [begin, end) 中的所有字段
+
+    :return: 每个字段的编号、wire type、字段（包含 tag）的起点、payload 的起点与终点
+    """
+    n = 0
+    pos = begin
+    while pos < end:
+        pos = _next_field(buf, pos)[4]
+        n += 1
+    field = np.empty(n, dtype=np.int64)
+    wire = np.empty(n, dtype=np.int64)
+    field_begin = np.empty(n, dtype=np.int64)
+    payload_begin = np.empty(n, dtype=np.int64)
+    payload_end = np.empty(n, dtype=np.int64)
+    pos = begin
+    for i in range(n):
+        field_begin[i] = pos
+        f, w, _, pb, pos = _next_field(buf, pos)
+        field[i] = f
+        wire[i] = w
+        payload_begin[i] = pb
+        payload_end[i] = pos
+    return field, wire, field_begin, payload_begin, payload_end
+
+
+@njit(cache=True, nogil=True)
+def _decode_track_notes(buf, begin, end):
+    """
+    解码一个 Track 中所有的 Note，并将其余字段原样拷贝出来
+
+    :return: Note 的各个字段，以及去掉 Note 之后的 Track 的字节
+    """
+    field, wire, field_begin, payload_begin, payload_end = _scan_fields(buf, begin, end)
+    is_note = (field == _TRACK_NOTE) & (wire == _WIRE_LEN)
+    n_note = is_note.sum()
+    pitch = np.zeros(n_note, dtype=np.uint32)
+    start = np.zeros(n_note, dtype=np.uint32)
+    duration = np.zeros(n_note, dtype=np.uint32)
+    attribute = np.full((n_note, N_NOTE_ATTR), -1, dtype=np.int64)
+
+    rest_len = 0
+    for i in range(len(field)):
+        if not is_note[i]:
+            rest_len += payload_end[i] - field_begin[i]
+    rest = np.empty(rest_len, dtype=np.uint8)
+
+    n = 0
+    r = 0
+    for i in range(len(field)):
+        if not is_note[i]:
+            length = payload_end[i] - field_begin[i]
+            rest[r: r + length] = buf[field_begin[i]: payload_end[i]]
+            r += length
+            continue
+        pos = payload_begin[i]
+        while pos < payload_end[i]:
+            f, w, value, pb, pos = _next_field(buf, pos)
+            if f == 1:
+                pitch[n] = value
+            elif f == 2:
+                start[n] = value
+            elif f == 3:
+                duration[n] = value
+            elif f == 4 and w == _WIRE_LEN:
+                attr_type, attr_value = -1, 0
+                p = pb
+                while p < pos:
+                    af, _, av, _, p = _next_field(buf, p)
+                    if af == 1:
+                        attr_type = av
+                    elif af == 2:
+                        attr_value = av
+                if 0 <= attr_type < N_NOTE_ATTR:
+                    attribute[n, attr_type] = attr_value
+        n += 1
+    return pitch, start, duration, attribute, rest
+
+
+@njit(cache=True, nogil=True)
+def _varint_size(value):
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+@njit(cache=True, nogil=True)
+def _write_varint(out, pos, value):
+    while value >= 0x80:
+        out[pos] = (value & 0x7f) | 0x80
+        value >>= 7
+        pos += 1
+    out[pos] = value
+    return pos + 1
+
+
+@njit(cache=True, nogil=True)
+def _encode_track_notes(pitch, start, duration, attribute):
+    """
+    将 Note 的各个字段编码为 Track 中 repeated Note 字段的字节，字段顺序与 protobuf 的序列化结果一致
+    """
+    n_note = len(pitch)
+    sizes = np.empty(n_note, dtype=np.int64)
+    total = 0
+    for n in range(n_note):
+        size = 3 + _varint_size(pitch[n]) + _varint_size(start[n]) + _varint_size(duration[n])
+        for k in range(attribute.shape[1]):
+            if attribute[n, k] >= 0:
+                attr_size = 2 + _varint_size(k) + _varint_size(attribute[n, k])
+                size += 1 + _varint_size(attr_size) + attr_size
+        sizes[n] = size
+        total += 1 + _varint_size(size) + size
+
+    out = np.empty(total, dtype=np.uint8)
+    pos = 0
+    for n in range(n_note):
+        out[pos] = (_TRACK_NOTE << 3) | _WIRE_LEN
+        pos = _write_varint(out, pos + 1, sizes[n])
+        out[pos] = (1 << 3) | _WIRE_VARINT
+        pos = _write_varint(out, pos + 1, pitch[n])
+        out[pos] = (2 << 3) | _WIRE_VARINT
+        pos = _write_varint(out, pos + 1, start[n])
+        out[pos] = (3 << 3) | _WIRE_VARINT
+        pos = _write_varint(out, pos + 1, duration[n])
+        for k in range(attribute.shape[1]):
+            if attribute[n, k] >= 0:
+                out[pos] = (4 << 3) | _WIRE_LEN
+                pos = _write_varint(out, pos + 1, 2 + _varint_size(k) + _varint_size(attribute[n, k]))
+                out[pos] = (1 << 3) | _WIRE_VARINT
+                pos = _write_varint(out, pos + 1, k)
+                out[pos] = (2 << 3) | _WIRE_VARINT
+                pos = _write_varint(out, pos + 1, attribute[n, k])
+    return out
+
+
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _decode_varint(data, pos: int) -> Tuple[int, int]:
+    result, shift = 0, 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def is_msf_header(data: Union[bytes, bytearray, memoryview]) -> bool:
+    """
+    根据第一个字段的 tag 判断字节是否可能是序列化的 msf.Sequence，空的字节对应空的 Sequence
+
+    :param data: 字节，只读取开头的几个字节
+    """
+    if len(data) == 0:
+        return True
+    tag = 0
+    for shift, b in zip(range(0, 35, 7), bytes(data[:5])):
+        tag |= (b & 0x7f) << shift
+        if b < 0x80:
+            return tag in _SEQUENCE_TAGS
+    return False
+
+
+def read_msf_arrays(data: Union[bytes, bytearray, memoryview]) -> Tuple[msf.Sequence, List[np.ndarray]]:
+    """
+    直接从 msf 的字节中解码 Note，不为每一个 Note 创建 protobuf 对象
+
+    :param data: msf.Sequence 序列化后的字节，可以是 mmap 的切片等不拷贝的 buffer
+    :return: 不包含 Note 的 msf.Sequence，以及每个 Track 的 Note 数组，dtype 为 msf_note_type，时间单位为 quantization
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    field, wire, field_begin, payload_begin, payload_end = _scan_fields(buf, 0, len(buf))
+    is_track = (field == _SEQUENCE_TRACK) & (wire == _WIRE_LEN)
+
+    header = b"".join(buf[b: e].tobytes() for b, e, t in zip(field_begin, payload_end, is_track) if not t)
+    sequence = msf.Sequence.FromString(header)
+    note_arrays = []
+    for b, e in zip(payload_begin[is_track], payload_end[is_track]):
+        pitch, start, duration, attribute, rest = _decode_track_notes(buf, b, e)
+        sequence.track.append(msf.Track.FromString(rest.tobytes()))
+        notes = np.empty(len(pitch), dtype=msf_note_type)
+        notes['pitch'] = pitch
+        notes['start'] = start
+        notes['duration'] = duration
+        notes['attribute'] = attribute
+        note_arrays.append(notes)
+    return sequence, note_arrays
+
+
+def write_msf_arrays(sequence: msf.Sequence, note_arrays: List[np.ndarray]) -> bytes:
+    """
+    read_msf_arrays 的逆操作，将不包含 Note 的 msf.Sequence 与 Note 数组编码为 msf 的字节
+
+    * 除 Note 以外的字段仍由 protobuf 序列化，Note 由 numba 批量编码，
+      字段的排列顺序与 protobuf 一致，因此在 attribute 按类型顺序排列时，结果与 SerializeToString 逐字节相同
+
+    :param sequence: 不包含 Note 的 msf.Sequence
+    :param note_arrays: 每个 Track 的 Note 数组，dtype 为 msf_note_type
+    """
+    assert len(sequence.track) == len(note_arrays), "the number of tracks and note arrays should be the same!"
+    # 按字段编号的顺序拼接：track 之前的字段、track、track 之后的字段
+    front = msf.Sequence(meta=sequence.meta, quantization=sequence.quantization).SerializePartialToString()
+    back = msf.Sequence(timeSignature=sequence.timeSignature, qpm=sequence.qpm).SerializePartialToString()
+    tag = _encode_varint((_SEQUENCE_TRACK << 3) | _WIRE_LEN)
+
+    chunks = [front]
+    for track, notes in zip(sequence.track, note_arrays):
+        track_front = msf.Track(instrumentID=track.instrumentID, meta=track.meta).SerializePartialToString()
+        track_back = msf.Track(pitchBend=track.pitchBend, volume=track.volume).SerializePartialToString()
+        note_bytes = _encode_track_notes(
+            notes['pitch'], notes['start'], notes['duration'], notes['attribute']).tobytes()
+        length = len(track_front) + len(note_bytes) + len(track_back)
+        chunks.extend([tag, _encode_varint(length), track_front, note_bytes, track_back])
+    chunks.append(back)
+    return b"".join(chunks)
+
+
+# 多 Sequence 容器文件：
+#   MAGIC | record 0 | record 1 | ... | index | footer
+#   record: varint(length) + msf.Sequence 的字节，可以不依赖 index 顺序读取
+#   index: 每个 record 的 (offset, length)，均为 little-endian uint64，之后为每个 record 的名字 varint(length) + utf-8
+#   footer: index 的 offset 与 record 的数量（little-endian uint64）+ FOOTER_MAGIC
+CONTAINER_MAGIC = b"MSFC\x00\x01"
+FOOTER_MAGIC = b"MSFINDEX"
+_FOOTER = struct.Struct("<QQ8s")
+
+
+class MsfContainerWriter:
+    """
+    author: lyk
+    status: available
+
+    将多个 Sequence 依次追加写入同一个容器文件，close 时写入 index。
+
+    >>> with MsfContainerWriter("corpus.msfc") as writer:
+    >>>     writer.append(sequence, name="song_0")
+    """
+
+    def __init__(self, filename: str, quantization: int = 960):
+        self.quantization = quantization
+        self._file = open(filename, "wb")
+        self._file.write(CONTAINER_MAGIC)
+        self._offsets = []
+        self._lengths = []
+        self._names = []
+
+    def append(self, sequence, name: str = ""):
+        """
+        :param sequence: Sequence、msf.Sequence，或者已经序列化的字节
+        :param name: record 的名字，可以用于之后的查询
+        """
+        if isinstance(sequence, (bytes, bytearray, memoryview)):
+            data = bytes(sequence)
+        elif isinstance(sequence, msf.Sequence):
+            data = sequence.SerializeToString()
+        else:
+            data = sequence.to_msf_bytes(self.quantization)
+        self._file.write(_encode_varint(len(data)))
+        self._offsets.append(self._file.tell())
+        self._lengths.append(len(data))
+        self._names.append(name)
+        self._file.write(data)
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(np.array([self._offsets, self._lengths], dtype="<u8").T.tobytes())
+        for name in self._names:
+            encoded = name.encode("utf-8")
+            self._file.write(_encode_varint(len(encoded)) + encoded)
+        self._file.write(_FOOTER.pack(index_offset, len(self._offsets), FOOTER_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class MsfContainerReader:
+    """
+    author: lyk
+    status: available
+
+    读取 MsfContainerWriter 写入的容器文件，文件通过 mmap 打开，record 的字节不会被拷贝。
+
+    * 支持 len()、按下标或名字随机访问，以及按顺序迭代
+    * 若文件没有正常 close（没有 index），则顺序扫描 record 的长度前缀重建 index
+    """
+
+    def __init__(self, filename: str):
+        self._file = open(filename, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        assert self._view[:len(CONTAINER_MAGIC)] == CONTAINER_MAGIC, f"{filename} is not a msf container!"
+        self.offsets, self.lengths, self.names = self._read_index()
+        self._name_to_index = {name: i for i, name in enumerate(self.names)}
+
+    def _read_index(self):
+        size = len(self._view)
+        if size >= len(CONTAINER_MAGIC) + _FOOTER.size:
+            index_offset, n_record, magic = _FOOTER.unpack(self._view[size - _FOOTER.size:])
+            if magic == FOOTER_MAGIC:
+                index = np.frombuffer(self._view, dtype="<u8", count=2 * n_record, offset=index_offset)
+                index = index.reshape(-1, 2).astype(np.int64)
+                names = []
+                pos = index_offset + 16 * n_record
+                for _ in range(n_record):
+                    length, pos = _decode_varint(self._view, pos)
+                    names.append(bytes(self._view[pos: pos + length]).decode("utf-8"))
+                    pos += length
+                return index[:, 0], index[:, 1], names
+        # 没有 index，顺序扫描
+        offsets, lengths = [], []
+        pos = len(CONTAINER_MAGIC)
+        while pos < size:
+            length, pos = _decode_varint(self._view, pos)
+            offsets.append(pos)
+            lengths.append(length)
+            pos += length
+        return np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64), [""] * len(offsets)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_bytes(self, i: int) -> memoryview:
+        """
+        :return: 第 i 个 record 的字节，为 mmap 的切片，不拷贝
+        """
+        offset = int(self.offsets[i])
+        return self._view[offset: offset + int(self.lengths[i])]
+
+    def index(self, name: str) -> int:
+        return self._name_to_index[name]
+
+    def get(self, name: str):
+        return self[self.index(name)]
+
+    def __getitem__(self, i: int):
+        from .sequence import Sequence
+        return Sequence.from_msf(self.get_bytes(i))
+
+    def __iter__(self) -> Iterator:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
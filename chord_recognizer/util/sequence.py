@@ -1,7 +1,9 @@
 from dataclasses import dataclass, field
 from typing import Dict, List, Union, BinaryIO
 from collections import defaultdict, OrderedDict
-from .noteSet import Note, NoteSet, NOTE_ATTR_TYPE
+import numpy as np
+from .noteSet import Note, NoteSet, NOTE_ATTR_TYPE, NOTE_ATTR_NAME2NUM
+from .msfIO import read_msf_arrays, write_msf_arrays, msf_note_type, N_NOTE_ATTR, is_msf_header
 from ..trdparty import MSF_pb2 as msf
 from . import midiToolkit
 
@@ -75,6 +77,30 @@ class TimeSignature:
         assert self.beatType & (self.beatType - 1) == 0, f"beatType should be 2^n, but not {self.beatType}!"
 
 
+def as_byte_view(data: Union[bytes, bytearray, memoryview]) -> memoryview:
+    """
+    将任意 C 连续的 buffer 转换为一维的字节 memoryview，不拷贝数据
+    """
+    view = memoryview(data)
+    if view.ndim != 1 or view.format != "B":
+        view = view.cast("B")
+    return view
+
+
+def detect_format(data: Union[bytes, bytearray, memoryview]) -> str:
+    """
+    根据开头的字节判断文件格式
+
+    :param data: 文件的字节
+    :return: "midi"（以 MThd 开头）或者 "msf"（序列化的 msf.Sequence）
+    """
+    if bytes(data[:4]) == b"MThd":
+        return "midi"
+    if is_msf_header(data):
+        return "msf"
+    raise AssertionError(f"can not detect the file format from the header: {bytes(data[:8])}")
+
+
 @dataclass
 class Sequence:
     """
@@ -98,24 +124,78 @@ class Sequence:
             self.attribute.update(temp)
 
     @classmethod
-    def from_msf(cls, file: Union[str, BinaryIO, msf.Sequence]):
+    def from_msf(cls, file: Union[str, bytes, BinaryIO, msf.Sequence]):
         """
         类方法，读取 msf 文件，返回 Sequence 对象
 
-        :param file: 文件路径，或者 BinaryIO
+        * 对于文件与字节，使用 msfIO.read_msf_arrays 直接将 Note 解码为数组，不为每个 Note 创建 protobuf 对象
+
+        :param file: 文件路径，字节（bytes, memoryview 等），具有 read 方法的文件对象，或者 msf.Sequence
         :return: Sequence
         """
+        if isinstance(file, msf.Sequence):
+            return cls._from_msf_message(file)
         if isinstance(file, str):
             with open(file, "rb") as f:
-                sequence = msf.Sequence.FromString(f.read())
-        elif isinstance(file, BinaryIO):
-            sequence = msf.Sequence.FromString(file.read())
-        elif isinstance(file, msf.Sequence):
-            sequence = file
+                data = f.read()
+        elif isinstance(file, (bytes, bytearray, memoryview)):
+            data = as_byte_view(file)
+        elif hasattr(file, "read"):
+            data = file.read()
         else:
             raise AssertionError(f"type: {type(file)} is not supported when reading from MSF to Sequence")
+        return cls._from_msf_message(*read_msf_arrays(data))
+
+    @classmethod
+    def from_bytes(cls, file: Union[bytes, bytearray, memoryview, BinaryIO], load=None):
+        """
+        类方法，根据开头的字节判断是 midi 还是 msf，并直接从 buffer 中解析，返回 Sequence 对象
+
+        * bytes、memoryview 等 buffer 不会被拷贝，文件对象只读取一次
+
+        :param file: 字节（bytes, memoryview 等），或者具有 read 方法的文件对象
+        :param load: 读取 midi 时需要解析的事件种类，见 midiToolkit.MidiFile
+        :return: Sequence
+        """
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            data = as_byte_view(file)
+        elif hasattr(file, "read"):
+            data = file.read()
+        else:
+            raise AssertionError(f"type: {type(file)} is not supported when reading bytes to Sequence")
+        if detect_format(data) == "midi":
+            return cls.from_midi(data, load=load)
+        return cls.from_msf(data)
 
+    @classmethod
+    def _from_msf_message(cls, sequence: msf.Sequence, note_arrays: List[np.ndarray] = None):
         q = sequence.quantization
+        if note_arrays is None:
+            notes = [
+                [
+                    Note(
+                        pitch=n.pitch,
+                        start=n.start / q,
+                        duration=n.duration / q,
+                        attribute={NOTE_ATTR_TYPE[attr.type]: attr.value for attr in n.attribute}
+                    )
+                    for n in t.note
+                ]
+                for t in sequence.track
+            ]
+        else:
+            notes = [
+                [
+                    Note(
+                        pitch=pitch, start=start, duration=duration,
+                        attribute={NOTE_ATTR_TYPE[k]: v for k, v in enumerate(attribute) if v >= 0}
+                    )
+                    for pitch, start, duration, attribute in zip(
+                        arr['pitch'].tolist(), (arr['start'] / q).tolist(),
+                        (arr['duration'] / q).tolist(), arr['attribute'].tolist())
+                ]
+                for arr in note_arrays
+            ]
         return Sequence(
             meta={m.name: m.value for m in sequence.meta},
             qpm=[GlobalChange(time=change.time / q, value=change.value) for change in sequence.qpm],
@@ -125,19 +205,11 @@ class Sequence:
                 Track(
                     instrumentID=int(t.instrumentID),
                     meta={m.name: m.value for m in t.meta},
-                    note=[
-                        Note(
-                            pitch=n.pitch,
-                            start=n.start / q,
-                            duration=n.duration / q,
-                            attribute={NOTE_ATTR_TYPE[attr.type]: attr.value for attr in n.attribute}
-                        )
-                        for n in t.note
-                    ],
+                    note=track_notes,
                     pitchBend=[TrackChange(change.time / q, change.value) for change in t.pitchBend],
                     volume=[TrackChange(change.time / q, change.value) for change in t.volume]
                 )
-                for t in sequence.track
+                for t, track_notes in zip(sequence.track, notes)
             ]
         )
 
@@ -186,18 +258,50 @@ class Sequence:
             ]
         )
 
+    def to_msf_bytes(self, quantization: int = 960) -> bytes:
+        """
+        与 to_msf().SerializeToString() 等价，但 Note 由 numba 批量编码，不为每个 Note 创建 protobuf 对象
+
+        :param quantization: 见 to_msf
+        :return: msf.Sequence 序列化后的字节
+        """
+        assert isinstance(quantization, int) and quantization > 0, f"quantization: {quantization} is invalid!"
+        q = quantization
+        header = Sequence(meta=self.meta, timeSignature=self.timeSignature, qpm=self.qpm, track=[
+            Track(instrumentID=t.instrumentID, meta=t.meta, pitchBend=t.pitchBend, volume=t.volume)
+            for t in self.track
+        ]).to_msf(q)
+
+        note_arrays = []
+        for track in self.track:
+            notes = np.empty(len(track.note), dtype=msf_note_type)
+            notes['pitch'] = np.fromiter((n.pitch for n in track.note), dtype=np.int64, count=len(track.note))
+            notes['start'] = np.fromiter((int(n.start * q) for n in track.note), dtype=np.int64, count=len(track.note))
+            notes['duration'] = np.fromiter(
+                (int(n.duration * q) for n in track.note), dtype=np.int64, count=len(track.note))
+            attribute = np.full((len(track.note), N_NOTE_ATTR), -1, dtype=np.int64)
+            for i, n in enumerate(track.note):
+                for name, value in n.attribute.items():
+                    attribute[i, NOTE_ATTR_NAME2NUM[name]] = value
+            notes['attribute'] = attribute
+            note_arrays.append(notes)
+        return write_msf_arrays(header, note_arrays)
+
     @classmethod
-    def from_midi(cls, file: Union[str, BinaryIO, midiToolkit.MidiFile]):
+    def from_midi(cls, file: Union[str, bytes, bytearray, memoryview, BinaryIO, midiToolkit.MidiFile], load=None):
         """
         类方法，读取 midi 文件，返回 Sequence 对象
 
-        :param file: 文件路径，或者 BinaryIO，或者 midiToolkit.MidiFile
+        :param file: 文件路径，字节（bytes, memoryview 等），具有 read 方法的文件对象，或者 midiToolkit.MidiFile
+        :param load: 读取文件时需要解析的事件种类，见 midiToolkit.MidiFile，为 None 时全部解析
         :return: Sequence
         """
         if isinstance(file, str):
-            midi = midiToolkit.MidiFile(filename=file)
-        elif isinstance(file, BinaryIO):
-            midi = midiToolkit.MidiFile(file=file)
+            midi = midiToolkit.MidiFile(filename=file, load=load)
+        elif isinstance(file, (bytes, bytearray, memoryview)):
+            midi = midiToolkit.MidiFile(file=as_byte_view(file), load=load)
+        elif hasattr(file, "read"):
+            midi = midiToolkit.MidiFile(file=file, load=load)
         elif isinstance(file, midiToolkit.MidiFile):
             midi = file
         else:
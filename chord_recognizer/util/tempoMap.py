@@ -0,0 +1,94 @@
+from typing import List, Optional
+import numpy as np
+
+DEFAULT_QPM = 120
+
+
+class TempoMap:
+    """
+    author: lyk
+    status: available
+
+    分段线性的速度映射，用于将以拍或 tick 为单位的时间批量转换为秒。
+
+    * 只保存每一次速度变化的位置，内存开销与速度变化的次数成正比，而不是与 max_tick 成正比
+    * 查询时使用 np.searchsorted 找到所在的分段，可以一次性转换整个数组
+    * 若第一个速度变化不在 0 拍，则在其之前使用默认速度 DEFAULT_QPM
+    """
+
+    def __init__(self, times, qpm, ticks_per_beat: Optional[int] = None):
+        """
+        :param times: 每一次速度变化的时间，单位为1拍
+        :param qpm: 每一次速度变化后的速度，单位为 quarter per minute
+        :param ticks_per_beat: 可选，设置后可以使用 ticks_to_seconds 转换以 tick 为单位的时间
+        """
+        times = np.asarray(times, dtype=np.float64).reshape(-1)
+        qpm = np.asarray(qpm, dtype=np.float64).reshape(-1)
+        assert len(times) == len(qpm), "times and qpm should have the same length!"
+        assert np.all(qpm > 0), "qpm should be positive!"
+
+        order = np.argsort(times, kind="stable")
+        times, qpm = times[order], qpm[order]
+        if len(times) == 0 or times[0] > 0:
+            times = np.concatenate([[0.], times])
+            qpm = np.concatenate([[DEFAULT_QPM], qpm])
+
+        self.times = times
+        self.seconds_per_beat = 60 / qpm
+        # 每一个分段起点对应的秒数
+        self.seconds = np.concatenate([[0.], np.cumsum(np.diff(times) * self.seconds_per_beat[:-1])])
+        self.ticks_per_beat = ticks_per_beat
+
+    @classmethod
+    def from_qpm(cls, qpm: List, ticks_per_beat: Optional[int] = None):
+        """
+        由 Sequence.qpm 构建 TempoMap
+
+        :param qpm: GlobalChange 的列表，时间单位为1拍
+        """
+        return cls([c.time for c in qpm], [c.value for c in qpm], ticks_per_beat)
+
+    @classmethod
+    def from_tempo_changes(cls, tempo_changes: List, ticks_per_beat: int):
+        """
+        由 midiToolkit.MidiFile.tempo_changes 构建 TempoMap
+
+        :param tempo_changes: midiToolkit.TempoChange 的列表，时间单位为 tick
+        :param ticks_per_beat: midi 文件的 ticks_per_beat
+        """
+        return cls(
+            [c.time / ticks_per_beat for c in tempo_changes],
+            [c.tempo for c in tempo_changes],
+            ticks_per_beat
+        )
+
+    def beats_to_seconds(self, beats) -> np.ndarray:
+        """
+        :param beats: 任意 shape 的数组，单位为1拍
+        :return: 与 beats 相同 shape 的数组，单位为秒
+        """
+        beats = np.asarray(beats, dtype=np.float64)
+        index = np.maximum(np.searchsorted(self.times, beats, side="right") - 1, 0)
+        return self.seconds[index] + (beats - self.times[index]) * self.seconds_per_beat[index]
+
+    def ticks_to_seconds(self, ticks) -> np.ndarray:
+        """
+        :param ticks: 任意 shape 的数组，单位为 tick
+        :return: 与 ticks 相同 shape 的数组，单位为秒
+        """
+        assert self.ticks_per_beat, "ticks_per_beat is required when converting ticks to seconds!"
+        return self.beats_to_seconds(np.asarray(ticks, dtype=np.float64) / self.ticks_per_beat)
+
+    def seconds_to_beats(self, seconds) -> np.ndarray:
+        """
+        beats_to_seconds 的逆映射
+
+        :param seconds: 任意 shape 的数组，单位为秒
+        :return: 与 seconds 相同 shape 的数组，单位为1拍
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        index = np.maximum(np.searchsorted(self.seconds, seconds, side="right") - 1, 0)
+        return self.times[index] + (seconds - self.seconds[index]) / self.seconds_per_beat[index]
+
+    def __repr__(self):
+        return f"TempoMap(changes={len(self.times)}, ticks_per_beat={self.ticks_per_beat})"
@@ -0,0 +1 @@
+# pytest 会将 conftest.py 所在的目录加入 sys.path，tests 中可以直接导入 chord_recognizer
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+from chord_recognizer.config import CHORD_CONFIG
+from chord_recognizer.dataset import SegmentReader, SegmentWriter, chord_bass, chord_pitches, write_corpus
+from chord_recognizer.main import recognize_chords
+from chord_recognizer.timeline import ChordTimeline
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+
+
+def test_chord_tables_align_with_names():
+    assert len(chord_bass) == len(chord_pitches) == len(CHORD_CONFIG['name'])
+    assert chord_bass[-1] == -1 and chord_pitches[-1] == 0
+    hdim7 = list(CHORD_CONFIG['name']).index("B:hdim7")
+    assert hdim7 == len(CHORD_CONFIG['name']) - 2
+    # B D F A
+    assert chord_bass[hdim7] == 11
+    assert chord_pitches[hdim7] == (1 << 11) | (1 << 2) | (1 << 5) | (1 << 9)
+    major = list(CHORD_CONFIG['name']).index("C:maj")
+    assert chord_bass[major] == 0 and chord_pitches[major] == (1 << 0) | (1 << 4) | (1 << 7)
+
+
+def test_write_read_roundtrip(tmp_path):
+    timelines = [
+        ChordTimeline.from_arrays([0, 4, 8], [3, 7, 9], [0, len(CHORD_CONFIG['name']) - 2, -1]),
+        ChordTimeline.from_arrays([2], [5], [7]),
+    ]
+    with SegmentWriter(str(tmp_path), shard_rows=2, shard_format="npy") as writer:
+        for k, timeline in enumerate(timelines):
+            writer.write(timeline, f"file{k}")
+    reader = SegmentReader(str(tmp_path))
+    assert reader.n_rows == 4 and reader.files == ["file0", "file1"]
+    for k, timeline in enumerate(timelines):
+        result = reader.timeline(k)
+        assert np.array_equal(result.starts, timeline.starts)
+        assert np.array_equal(result.ends, timeline.ends)
+        assert np.array_equal(result.chords, timeline.chords)
+    data = reader.read(['chord', 'bass', 'pitches'])
+    assert np.array_equal(data['bass'], chord_bass[data['chord']])
+    assert np.array_equal(data['pitches'], chord_pitches[data['chord']])
+
+
+def test_interrupted_write_is_recovered(tmp_path):
+    path = str(tmp_path)
+    first = ChordTimeline.from_arrays([0, 4], [3, 7], [0, 1])
+    partial = ChordTimeline.from_arrays(np.arange(0, 20, 2), np.arange(1, 20, 2), np.arange(10))
+    writer = SegmentWriter(path, shard_rows=4, shard_format="npy")
+    writer.write(first, "first")
+    # 写入第二首曲目的过程中缓冲区写满两次，但该曲目还没有写完，模拟此时中断
+    writer.write(partial, "partial")
+    del writer
+    reader = SegmentReader(path)
+    assert reader.files == ["first"]
+    assert reader.n_rows == 2
+    assert np.array_equal(reader.read(['file_id'])['file_id'], [0, 0])
+
+    second = ChordTimeline.from_arrays([8], [11], [5])
+    with SegmentWriter(path, shard_rows=4) as writer:
+        assert writer.write(second, "second") == 1
+    reader = SegmentReader(path)
+    assert reader.files == ["first", "second"]
+    assert reader.n_rows == 3
+    assert np.array_equal(reader.timeline(0).starts, first.starts)
+    assert np.array_equal(reader.timeline(1).chords, second.chords)
+    assert len(os.listdir(path)) == len(reader._manifest['shards']) + 1
+
+
+def test_write_corpus_ignores_as_timeline(tmp_path):
+    file = os.path.join(DATA, "107.mid")
+    reader = write_corpus([file], str(tmp_path), n_threads=1, shard_format="npy", as_timeline=False, max_prev=8)
+    expected = recognize_chords(file, as_timeline=True, max_prev=8)
+    assert reader.files == [file]
+    assert np.array_equal(reader.timeline(0).starts, expected.starts)
+    assert np.array_equal(reader.timeline(0).chords, expected.chords)
@@ -0,0 +1,167 @@
+import os
+
+import numpy as np
+import pytest
+
+from chord_recognizer.benchmark import frame_labels
+from chord_recognizer.config import CHORD_CONFIG
+from chord_recognizer.decode import (
+    CONFIDENCE_TEMPERATURE, MAX_PREV, SCORE_FLOOR, SPAN_BONUS, ChunkedDecoder, DecodeParams, coarse_grid,
+    decode_chords, decode_chords_batch, downbeat_and_score_weight, param_grid, prefix_sum, score_dp, segments_to_frame,
+    sweep_decode)
+from chord_recognizer.feature import extract_chord_features
+from chord_recognizer.main import load_sequence
+from chord_recognizer.score import chord_score
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+FILES = [os.path.join(DATA, "107.mid"), os.path.join(DATA, "The Day We Find Love.mid")]
+
+
+@pytest.fixture(scope="module", params=FILES, ids=os.path.basename)
+def piece(request):
+    s = load_sequence(request.param)
+    chroma, bass = extract_chord_features(s.track)
+    return chroma, bass, s.timeSignature
+
+
+@pytest.mark.parametrize("precision", ["float32", "int16"])
+def test_reduced_precision_within_tolerance(piece, precision):
+    chroma, bass, time_signatures = piece
+    n_frame = len(chroma)
+    reference = frame_labels(decode_chords(chroma, bass, time_signatures), n_frame)
+    labels = frame_labels(decode_chords(chroma, bass, time_signatures, precision=precision), n_frame)
+    assert np.mean(labels != reference) <= 0.01
+
+
+def test_batch_matches_single(piece):
+    chroma, bass, time_signatures = piece
+    # 第二首为截断的片段，检查不同长度的曲目拼接在一起解码时互不影响
+    features = [(chroma, bass), (chroma[:100], bass[:100])]
+    results = decode_chords_batch(features, [time_signatures, time_signatures])
+    for (c, b), segments in zip(features, results):
+        assert segments_to_frame(segments).equals(decode_chords(c, b, time_signatures))
+
+
+def _reference_span_score(chroma, bass, weight, i, j):
+    span_chroma = chroma[i - j: i + 1].sum(axis=0).astype(np.float32).astype(np.float64)
+    span_bass = bass[i - j: i + 1].sum(axis=0).astype(np.float32).astype(np.float64)
+    score = max(chord_score(span_chroma, span_bass).max(), SCORE_FLOOR)
+    return score + j * SPAN_BONUS + weight[i - j]
+
+
+@pytest.mark.parametrize("max_prev, max_downbeats", [(4, 1), (16, 3)])
+def test_prefix_sum_dp_is_optimal(piece, max_prev, max_downbeats):
+    chroma, bass, time_signatures = piece
+    chroma, bass = chroma[:96], bass[:96]
+    n_frame = len(chroma)
+    downbeat, weight = downbeat_and_score_weight(n_frame, time_signatures)
+    # 直接对窗口求和的逐拍动态规划，作为前缀和实现的参考
+    best = np.full(n_frame + 1, -np.inf)
+    best[0] = 0
+    for i in range(n_frame):
+        n_downbeat = 0
+        for j in range(min(max_prev, i + 1)):
+            best[i + 1] = max(best[i + 1], best[i - j] + _reference_span_score(chroma, bass, weight, i, j))
+            if j > 0 and downbeat[i - j + 1]:
+                n_downbeat += 1
+                if n_downbeat >= max_downbeats:
+                    break
+    _, start_pos = score_dp(prefix_sum(chroma), prefix_sum(bass), downbeat, weight, max_prev, max_downbeats)
+    total, end = 0., n_frame - 1
+    while end >= 0:
+        total += _reference_span_score(chroma, bass, weight, end, end - start_pos[end] - 1)
+        end = start_pos[end]
+    assert total == pytest.approx(best[-1], abs=1e-6)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 64])
+def test_chunked_matches_full(piece, chunk):
+    chroma, bass, time_signatures = piece
+    for offset, max_downbeats in ((0, 1), (5, 2)):
+        expected = decode_chords(chroma, bass, time_signatures, offset=offset, max_downbeats=max_downbeats)
+        decoder = ChunkedDecoder(time_signatures, offset, max_downbeats=max_downbeats)
+        segments = [decoder.feed(chroma[k: k + chunk], bass[k: k + chunk]) for k in range(0, len(chroma), chunk)]
+        segments.append(decoder.flush())
+        assert segments_to_frame(np.concatenate(segments), offset=offset).equals(expected)
+
+
+def test_parallel_matches_serial(piece):
+    chroma, bass, time_signatures = piece
+    for max_prev, max_downbeats in ((MAX_PREV, 1), (16, 3)):
+        kwargs = dict(max_prev=max_prev, max_downbeats=max_downbeats)
+        expected = decode_chords(chroma, bass, time_signatures, **kwargs)
+        assert decode_chords(chroma, bass, time_signatures, parallel=True, **kwargs).equals(expected)
+
+
+def test_sweep_matches_decode(piece):
+    chroma, bass, time_signatures = piece
+    param_sets = param_grid(score_floor=[0.1, SCORE_FLOOR], span_bonus=[0.5, SPAN_BONUS], note_bias=[0.05, 0.15]) + [
+        DecodeParams(beat_weights=(0.2, 0.1, 0.)), DecodeParams(inversion_bias=0.3)]
+    results = sweep_decode(chroma, bass, time_signatures, param_sets, offset=3, max_downbeats=2)
+    assert len(results) == len(param_sets)
+    for params, result in zip(param_sets, results):
+        assert result.equals(decode_chords(chroma, bass, time_signatures, offset=3, max_downbeats=2, params=params))
+
+
+def test_confidence_matches_enumeration(piece):
+    chroma, bass, time_signatures = piece
+    n_frame, max_prev, temperature = 10, 4, CONFIDENCE_TEMPERATURE
+    chroma, bass = chroma[16: 16 + n_frame], bass[16: 16 + n_frame]
+    downbeat, weight = downbeat_and_score_weight(n_frame, time_signatures, 16)
+    frame = decode_chords(chroma, bass, time_signatures, offset=16, max_prev=max_prev, with_confidence=True)
+    assert frame[['start', 'end', 'name']].equals(
+        decode_chords(chroma, bass, time_signatures, offset=16, max_prev=max_prev)[['start', 'end', 'name']])
+
+    def span_logits(i, j):
+        span_chroma = chroma[i - j: i + 1].sum(axis=0).astype(np.float32).astype(np.float64)
+        span_bass = bass[i - j: i + 1].sum(axis=0).astype(np.float32).astype(np.float64)
+        # 最后一个为 N，得分为 score_floor
+        return np.append(chord_score(span_chroma, span_bass), SCORE_FLOOR) + j * SPAN_BONUS + weight[i - j]
+
+    def allowed(i, j):
+        # 与 score_dp 相同，区间内（起点之后的第二拍开始）不能包含 downbeat
+        return j < max_prev and j <= i and not np.any(downbeat[i - j + 2: i + 1])
+
+    def segmentations(end):
+        # 以第 end 拍结尾的所有切分，每个区间为 (i, j)
+        if end < 0:
+            yield []
+            return
+        for j in range(max_prev):
+            if allowed(end, j):
+                for rest in segmentations(end - j - 1):
+                    yield rest + [(end, j)]
+
+    paths = list(segmentations(n_frame - 1))
+    log_z = np.logaddexp.reduce([sum(np.logaddexp.reduce(span_logits(i, j) / temperature) for i, j in path)
+                                 for path in paths])
+    _, start_pos = score_dp(prefix_sum(chroma), prefix_sum(bass), downbeat, weight, max_prev)
+    decoded, end = [], n_frame - 1
+    while end >= 0:
+        decoded.append((end, end - start_pos[end] - 1))
+        end = start_pos[end]
+    for start, end, name, margin, posterior in frame[['start', 'end', 'name', 'margin', 'posterior']].itertuples(
+            index=False):
+        # 该和弦由解码路径中落在 [start, end] 内的区间组成，后验概率为包含所有这些区间且和弦相同的路径的概率
+        chord = CHORD_CONFIG['name'].tolist().index(name)
+        spans = {(i, j) for i, j in decoded if start - 16 <= i - j and i <= end - 16}
+        log_p = [sum(span_logits(i, j)[chord] / temperature if (i, j) in spans
+                     else np.logaddexp.reduce(span_logits(i, j) / temperature) for i, j in path)
+                 for path in paths if spans <= set(path)]
+        assert posterior == pytest.approx(np.exp(np.logaddexp.reduce(log_p) - log_z), rel=1e-6)
+        assert margin >= 0
+
+
+@pytest.mark.parametrize("coarse", ["bar", "half_bar"])
+def test_coarse_to_fine_with_full_radius_is_exact(piece, coarse):
+    chroma, bass, time_signatures = piece
+    expected = decode_chords(chroma, bass, time_signatures)
+    assert decode_chords(chroma, bass, time_signatures, coarse=coarse, refine_radius=len(chroma)).equals(expected)
+
+
+def test_coarse_grid():
+    downbeat = np.zeros(14, dtype=bool)
+    downbeat[[0, 4, 8, 11]] = True
+    assert np.flatnonzero(coarse_grid(downbeat)).tolist() == [3, 7, 10, 13]
+    # 半小节只对偶数拍且多于 2 拍的小节生效
+    assert np.flatnonzero(coarse_grid(downbeat, "half_bar")).tolist() == [1, 3, 5, 7, 10, 13]
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from chord_recognizer import recognize_chords
+from chord_recognizer.evaluate import MAJ, MIN, METRICS, NO_CHORD, evaluate, evaluate_corpus, parse_chord, summarize
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+FILES = [os.path.join(DATA, "107.mid"), os.path.join(DATA, "The Day We Find Love.mid")]
+
+
+def _chords(rows):
+    return pd.DataFrame(rows, columns=['start', 'end', 'name'])
+
+
+def test_parse_chord():
+    assert parse_chord("C:maj") == (0, 0, MAJ, 0b10010001)
+    assert parse_chord("Eb:min7/b7") == (3, 1, MIN, parse_chord("D#:min7")[3])
+    assert parse_chord("N") == (-1, -1, NO_CHORD, 0)
+
+
+def test_evaluate_by_hand():
+    reference = _chords([[0, 3, "C:maj"], [4, 7, "A:min"]])
+    estimated = _chords([[0, 5, "C:maj"], [6, 7, "A:min"]])
+    result = evaluate(estimated, reference)
+    assert result['n_frame'] == result['n_majmin'] == 8
+    # 第 4、5 拍识别错误，C:maj 与 A:min 共有 C, E 两个音级
+    for metric in ('root', 'majmin', 'inversion', 'over_seg', 'under_seg', 'segmentation'):
+        assert result[metric] == 0.75
+    assert result['overlap'] == (6 + 2 * 0.5) / 8
+
+
+def test_corpus_matches_serial_and_self():
+    references = [recognize_chords(file) for file in FILES]
+    results = evaluate_corpus(FILES, references)
+    assert np.all(results[METRICS] == 1)
+    assert evaluate_corpus(FILES, references, n_jobs=2).equals(results)
+    assert np.all(summarize(results, results) == 0)
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+from chord_recognizer.feature import (
+    _is_grid_precision, count_beats, extract_chord_features, extract_chord_features_event, extract_chord_features_grid,
+    get_abs_pianoroll, get_bass, get_track_weight, to_note_arr, track_weights)
+from chord_recognizer.main import load_sequence
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+
+
+def test_precision_dispatch():
+    assert _is_grid_precision(0.25)
+    assert not _is_grid_precision(1 / 3) and not _is_grid_precision(1 / 6) and not _is_grid_precision(0.5)
+    assert not _is_grid_precision(0.3)
+    assert not _is_grid_precision((0.25, 1 / 6))
+    assert not _is_grid_precision(None)
+
+
+@pytest.mark.parametrize("note_precision", [0.25, 1 / 3, 1 / 6])
+def test_event_path_matches_grid_path(note_precision):
+    tracks = load_sequence(os.path.join(DATA, "107.mid")).track
+    chroma, bass = extract_chord_features_grid(tracks, note_precision)
+    event_chroma, event_bass = extract_chord_features_event(tracks, note_precision)
+    np.testing.assert_allclose(event_chroma, chroma, atol=1e-12)
+    np.testing.assert_allclose(event_bass, bass, atol=1e-12)
+
+
+@pytest.mark.parametrize("note_precision", [0.25, 1 / 3])
+def test_notes_past_n_beat_are_clipped(note_precision):
+    tracks = load_sequence(os.path.join(DATA, "107.mid")).track
+    weight = track_weights(tracks, note_precision)
+    chroma, bass = extract_chord_features(tracks, note_precision, track_weight=weight)
+    for extract in (extract_chord_features_grid, extract_chord_features_event):
+        for n_beat in (1, 37):
+            window_chroma, window_bass = extract(tracks, note_precision, n_beat, weight)
+            np.testing.assert_allclose(window_chroma, chroma[:n_beat], atol=1e-12)
+            np.testing.assert_allclose(window_bass, bass[:n_beat], atol=1e-12)
+
+
+def test_track_weights_match_pianoroll():
+    tracks = load_sequence(os.path.join(DATA, "107.mid")).track
+    n_beat = count_beats(tracks)
+    global_end = n_beat * 4
+    index = [i for i, track in enumerate(tracks) if track.meta.get('is_drum', False) == 'False' and len(track.note)]
+    note_arrs = [to_note_arr(tracks[i].note, 0.25) for i in index]
+    expected = get_track_weight([get_abs_pianoroll(arr, global_end) for arr in note_arrs],
+                                [get_bass(arr, global_end) for arr in note_arrs])
+    weights = track_weights(tracks, 0.25, n_beat)
+    np.testing.assert_allclose(weights[index], expected, rtol=0, atol=1e-12)
+    assert np.all(np.delete(weights, index) == 0)
+
+
+def test_pruned_tracks_only_skip_chroma():
+    tracks = load_sequence(os.path.join(DATA, "107.mid")).track
+    n_beat = count_beats(tracks)
+    weights = track_weights(tracks, 0.25, n_beat)
+    threshold = np.median(weights[weights > 0])
+    chroma, bass = extract_chord_features(tracks, min_track_weight=threshold)
+    full_chroma, full_bass = extract_chord_features(tracks)
+    kept = [i for i, w in enumerate(weights) if w >= threshold]
+    kept_chroma, _ = extract_chord_features([tracks[i] for i in kept], 0.25, n_beat, weights[kept])
+    assert np.array_equal(bass, full_bass)
+    assert np.array_equal(chroma, kept_chroma)
+    assert not np.array_equal(chroma, full_chroma)
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from chord_recognizer.config import _CHORD_CONFIG_PATH, _CODE_HASH
+from chord_recognizer.jit import _iter_kernels
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_config_hash_is_deterministic():
+    hashes = set()
+    for seed in ("1", "2"):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=ROOT)
+        hashes.add(subprocess.run(
+            [sys.executable, "-c", "from chord_recognizer.config import _CODE_HASH; print(_CODE_HASH)"],
+            env=env, capture_output=True, text=True, check=True).stdout.strip())
+    assert hashes == {_CODE_HASH}
+    with np.load(_CHORD_CONFIG_PATH) as cached:
+        assert str(cached['hash']) == _CODE_HASH
+
+
+def test_import_does_not_rewrite_config():
+    mtime = os.stat(_CHORD_CONFIG_PATH).st_mtime_ns
+    subprocess.run([sys.executable, "-c", "import chord_recognizer"],
+                   env=dict(os.environ, PYTHONPATH=ROOT), check=True)
+    assert os.stat(_CHORD_CONFIG_PATH).st_mtime_ns == mtime
+
+
+def test_kernels_are_found():
+    import chord_recognizer.decode  # noqa: F401
+    names = dict(_iter_kernels())
+    assert "chord_recognizer.decode.score_dp" in names
+    assert "chord_recognizer.score.chord_score" in names
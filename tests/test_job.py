@@ -0,0 +1,70 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from chord_recognizer import recognize_chords
+from chord_recognizer.job import CorpusJob
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+SOURCES = [os.path.join(DATA, "107.mid"), os.path.join(DATA, "The Day We Find Love.mid")]
+
+
+@pytest.fixture
+def files(tmp_path):
+    result = []
+    for k in range(4):
+        path = str(tmp_path / f"f{k}.mid")
+        shutil.copy(SOURCES[k % 2], path)
+        result.append(path)
+    bad = str(tmp_path / "bad.mid")
+    with open(bad, "wb") as f:
+        f.write(b"MThd broken")
+    return result + [bad]
+
+
+def test_resume_skips_finished_work(tmp_path, files):
+    job = CorpusJob.create(str(tmp_path / "job"), files)
+    n_shards = 3
+    first = job.run(0, n_shards, n_threads=1)
+    # 中断后重新打开任务并运行所有分片，已完成的文件被跳过
+    job = CorpusJob(str(tmp_path / "job"))
+    counts = [job.run(shard, n_shards, n_threads=2) for shard in range(n_shards)]
+    assert counts[0] == {'done': 0, 'failed': 0, 'skipped': first['done'] + first['failed']}
+    # 内容相同的文件只识别一次
+    assert sum(c['done'] + c['failed'] + c['skipped'] for c in counts) == 3
+    assert all(job.run(shard, n_shards)['skipped'] == sum(counts[shard].values()) for shard in range(n_shards))
+    status = job.status(n_shards)
+    assert status['done'].tolist() == [True] * 4 + [False]
+    assert status['failed'].tolist() == [False] * 4 + [True]
+
+    reader = job.combine(str(tmp_path / "out"), shard_format="npy")
+    assert reader.files == files[:4]
+    for file_id, path in enumerate(files[:4]):
+        expected = recognize_chords(path, as_timeline=True)
+        timeline = reader.timeline(file_id)
+        assert np.array_equal(timeline.starts, expected.starts)
+        assert np.array_equal(timeline.ends, expected.ends)
+        assert np.array_equal(timeline.chords, expected.chords)
+
+
+def test_shards_are_deterministic(tmp_path, files):
+    job = CorpusJob.create(str(tmp_path / "job"), files)
+    reordered = CorpusJob.create(str(tmp_path / "other"), files[::-1])
+    for n_shards in (1, 2, 5):
+        shards = [{item['digest'] for item in job.shard_items(k, n_shards)} for k in range(n_shards)]
+        assert shards == [{item['digest'] for item in reordered.shard_items(k, n_shards)} for k in range(n_shards)]
+        assert set.union(*shards) == {item['digest'] for item in job.items}
+
+
+def test_changed_input_and_incomplete_combine(tmp_path, files):
+    job = CorpusJob.create(str(tmp_path / "job"), files[:2])
+    with pytest.raises(ValueError):
+        CorpusJob.create(str(tmp_path / "job"), files[:2], note_precision=0.5)
+    with pytest.raises(ValueError):
+        job.combine(str(tmp_path / "out"))
+    shutil.copy(SOURCES[1], files[0])
+    assert job.run(n_threads=1) == {'done': 1, 'failed': 1, 'skipped': 0}
+    reader = job.combine(str(tmp_path / "out"))
+    assert reader.files == files[1:2]
@@ -0,0 +1,100 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+from chord_recognizer import SequenceIndex, recognize_chords, recognize_chords_batch
+from chord_recognizer.benchmark import stress_threads
+from chord_recognizer.feature import extract_chord_features, slice_tracks
+from chord_recognizer.main import load_sequence
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+FILES = [os.path.join(DATA, "107.mid"), os.path.join(DATA, "The Day We Find Love.mid")]
+
+
+@pytest.fixture(scope="module", params=FILES, ids=os.path.basename)
+def index(request):
+    return SequenceIndex(request.param)
+
+
+@pytest.mark.parametrize("start, end", [(0, 50), (17, 93), (120, 341)])
+def test_window_features_match_full_piece(index, start, end):
+    tracks = index.sequence.track
+    full_chroma, full_bass = extract_chord_features(tracks)
+    chroma, bass = extract_chord_features(
+        slice_tracks(tracks, start, end, index.track_index), 0.25, end - start, index.track_weight)
+    assert np.array_equal(chroma, full_chroma[start: end])
+    assert np.array_equal(bass, full_bass[start: end])
+
+
+def test_window_with_index_matches_file(index):
+    for kwargs in (dict(start=17, end=93), dict(start=3, end=20, unit="bar"), dict(start=40)):
+        expected = recognize_chords(index.sequence, **kwargs)
+        assert recognize_chords(index, **kwargs).equals(expected)
+        assert recognize_chords(index, chunk_bars=2, **kwargs).equals(expected)
+
+
+def test_index_requires_same_precision(index):
+    with pytest.raises(AssertionError):
+        recognize_chords(index, note_precision=0.5, start=0, end=8)
+
+
+def test_batch_is_identical_across_threads():
+    files = FILES * 3
+    expected = [recognize_chords(file) for file in files]
+    for n_threads in (1, 4):
+        results = recognize_chords_batch(files, n_threads=n_threads)
+        assert all(result.equals(reference) for result, reference in zip(results, expected))
+
+
+def test_stress_threads_baseline_is_one_thread():
+    report = stress_threads(FILES, thread_counts=(2, 4), repeat=2)
+    assert list(report['n_threads']) == [2, 4]
+    assert report['consistent'].all()
+    assert np.allclose(report['efficiency'] * report['n_threads'], report['speedup'])
+
+
+@pytest.mark.parametrize("file", FILES, ids=os.path.basename)
+def test_chunked_matches_full(file):
+    expected = recognize_chords(file, with_seconds=True)
+    for chunk_bars in (1, 4):
+        assert recognize_chords(file, with_seconds=True, chunk_bars=chunk_bars).equals(expected)
+
+
+@pytest.mark.parametrize("kwargs", [dict(parallel=True), dict(precision="float32"), dict(max_prev=8, max_downbeats=2)])
+def test_chunked_forwards_decode_kwargs(kwargs):
+    file = FILES[0]
+    assert recognize_chords(file, chunk_bars=2, **kwargs).equals(recognize_chords(file, **kwargs))
+    expected = recognize_chords(file, start=5, end=60, **kwargs)
+    assert recognize_chords(file, start=5, end=60, chunk_bars=3, **kwargs).equals(expected)
+
+
+def test_chunked_with_confidence_and_temperature():
+    file = FILES[0]
+    expected = recognize_chords(file, with_confidence=True, temperature=0.2)
+    chunked = recognize_chords(file, chunk_bars=2, with_confidence=True, temperature=0.2)
+    assert {'margin', 'posterior'} <= set(chunked.columns)
+    assert chunked.equals(expected)
+    assert not chunked['posterior'].equals(recognize_chords(file, chunk_bars=2, with_confidence=True)['posterior'])
+
+
+@pytest.mark.parametrize("coarse, refine_radius", [("bar", 1), ("half_bar", 2)])
+def test_chunked_with_coarse_to_fine(coarse, refine_radius):
+    file = FILES[1]
+    kwargs = dict(coarse=coarse, refine_radius=refine_radius)
+    assert recognize_chords(file, chunk_bars=2, **kwargs).equals(recognize_chords(file, **kwargs))
+    expected = recognize_chords(file, start=17, end=93, **kwargs)
+    assert recognize_chords(file, start=17, end=93, chunk_bars=4, **kwargs).equals(expected)
+
+
+@pytest.mark.parametrize("file", FILES, ids=os.path.basename)
+def test_bytes_input_matches_path(file):
+    expected = recognize_chords(file)
+    with open(file, "rb") as f:
+        data = f.read()
+    assert recognize_chords(data).equals(expected)
+    assert recognize_chords(memoryview(bytearray(data))).equals(expected)
+    assert recognize_chords(io.BytesIO(data)).equals(expected)
+    # msf 的字节由开头的字节识别，与 midi 的结果相同
+    assert recognize_chords(load_sequence(data).to_msf_bytes()).equals(expected)
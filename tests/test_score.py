@@ -0,0 +1,36 @@
+import numpy as np
+
+from chord_recognizer.config import CHORD_CONFIG
+from chord_recognizer.score import (
+    chord_score, chord_score_batch, chord_score_circular, chord_score_circular_batch, circular_bias,
+    circular_score_bias)
+
+
+def _random_features(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    chroma = rng.random((n, 12)) * (rng.random((n, 12)) < 0.5)
+    bass = np.zeros((n, 12))
+    bass[np.arange(n), rng.integers(0, 12, n)] = rng.random(n)
+    return chroma, bass
+
+
+def test_circular_matches_template_score():
+    chroma, bass = _random_features(256)
+    expected = chord_score_batch(chroma, bass)
+    assert np.allclose(chord_score_circular_batch(chroma, bass), expected, rtol=0, atol=1e-9)
+    for k in range(8):
+        assert np.allclose(chord_score_circular(chroma[k], bass[k]), chord_score(chroma[k], bass[k]), rtol=0, atol=1e-9)
+
+
+def test_same_pitch_set_ties_exactly():
+    names = list(CHORD_CONFIG['name'])
+    a, b = names.index('C:min13'), names.index('F:13')
+    chroma, bass = _random_features(64, seed=1)
+    chroma[:] = np.array(CHORD_CONFIG['chroma'][a] > 0) * chroma.sum(axis=1, keepdims=True)
+    bass[:] = 0
+    score = chord_score_circular_batch(chroma, bass)
+    assert np.array_equal(score[:, a] - CHORD_CONFIG['score_bias'][a], score[:, b] - CHORD_CONFIG['score_bias'][b])
+
+
+def test_default_bias_is_bitwise_identical():
+    assert np.array_equal(circular_bias(), circular_score_bias)
@@ -0,0 +1,88 @@
+import copy
+import os
+import random
+
+import numpy as np
+
+from chord_recognizer import RecognitionSession, recognize_chords
+from chord_recognizer.decode import _span_features, prefix_sum
+from chord_recognizer.main import load_sequence
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+
+
+def _same(a, b):
+    return a[['start', 'end', 'name']].equals(b[['start', 'end', 'name']])
+
+
+def test_edits_match_full_recognition():
+    random.seed(0)
+    s = load_sequence(os.path.join(DATA, "107.mid"))
+    session = RecognitionSession(s)
+    assert _same(session.recognize(), recognize_chords(copy.deepcopy(s)))
+    tracks = [i for i, track in enumerate(s.track) if track.note]
+    for step in range(20):
+        t = random.choice(tracks)
+        notes = s.track[t].note
+        op = step % 3
+        if op == 0:
+            note = copy.deepcopy(random.choice(notes))
+            note.pitch = random.randint(30, 90)
+            # 偶尔插入到曲目结尾之后，改变总拍数
+            note.start = random.randint(0, int(max(n.start for n in notes)) + (8 if step == 9 else 0))
+            note.duration = random.choice([0.25, 1, 2])
+            session.insert_note(t, note)
+        elif op == 1:
+            session.delete_note(t, random.randrange(len(notes)))
+        else:
+            i = random.randrange(len(notes))
+            note = copy.deepcopy(notes[i])
+            note.pitch += random.choice([-2, 1, 3])
+            session.modify_note(t, i, note)
+        assert _same(session.recognize(), recognize_chords(copy.deepcopy(s))), f"step {step}"
+
+
+def test_delete_last_note_shrinks_piece():
+    s = load_sequence(os.path.join(DATA, "107.mid"))
+    session = RecognitionSession(s)
+    n_beat = session.n_beat
+    # 删除最后结束的 note
+    candidates = [(note.start + note.duration, t, i) for t, track in enumerate(s.track)
+                  if track.meta.get('is_drum') == 'False' for i, note in enumerate(track.note)]
+    _, t, i = max(candidates)
+    session.delete_note(t, i)
+    assert _same(session.recognize(), recognize_chords(copy.deepcopy(s)))
+    assert session.n_beat <= n_beat
+
+
+def test_edits_only_recompute_local_spans():
+    random.seed(1)
+    s = load_sequence(os.path.join(DATA, "The Day We Find Love.mid"))
+    session = RecognitionSession(s)
+    calls = []
+    span_sums = session._span_sums
+    session._span_sums = lambda rows: calls.append(rows) or span_sums(rows)
+    tracks = [i for i, track in enumerate(s.track) if track.note and track.meta.get('is_drum') == 'False']
+    n_local = 0
+    for _ in range(20):
+        t = random.choice(tracks)
+        i = random.randrange(len(s.track[t].note))
+        note = copy.deepcopy(s.track[t].note[i])
+        note.pitch += random.choice([-2, 1, 3])
+        weight = session._track_weight.copy()
+        calls.clear()
+        session.modify_note(t, i, note)
+        assert _same(session.recognize(), recognize_chords(copy.deepcopy(s)))
+        if np.array_equal(weight, session._track_weight) and calls:
+            # track 的权重不变时，只重新计算修改范围及其之后 max_prev - 1 拍内结尾的区间
+            first = int(note.start)
+            assert calls[0].min() >= first - 1 and calls[0].max() < note.start + note.duration + session.max_prev + 1
+            n_local += 1
+    assert n_local > 0
+
+    # 缓存的区间特征与 decode 中由前缀和求得的区间特征逐位相同
+    prefix_chroma, prefix_bass = prefix_sum(session._chroma), prefix_sum(session._bass)
+    for i in range(session.n_beat):
+        for j in range(session._n_span[i]):
+            chroma, bass = _span_features(prefix_chroma, prefix_bass, i, j)
+            assert np.array_equal(session._span_feature[i, j], np.concatenate([chroma, bass]))
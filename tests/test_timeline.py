@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+from chord_recognizer import ChordTimeline, recognize_chords
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+
+
+def test_timeline_matches_frame():
+    file = os.path.join(DATA, "107.mid")
+    frame = recognize_chords(file)
+    timeline = recognize_chords(file, as_timeline=True)
+    assert isinstance(timeline, ChordTimeline)
+    assert timeline.to_frame().equals(frame)
+    assert ChordTimeline.from_frame(frame).to_frame().equals(frame)
+    # 分块解码的结果由多块数据组成，查询结果与整首解码相同
+    chunked = recognize_chords(file, as_timeline=True, chunk_bars=2)
+    assert chunked.to_frame().equals(frame)
+    beats = np.arange(-2, frame['end'].iloc[-1] + 3, 0.5)
+    expected = np.full(len(beats), 'N', dtype=object)
+    for start, end, name in zip(frame['start'], frame['end'], frame['name']):
+        expected[(beats >= start) & (beats < end + 1)] = name
+    assert np.array_equal(timeline.names_at(beats), expected)
+    assert np.array_equal(chunked.names_at(beats), expected)
+
+
+def test_slice_and_between():
+    timeline = ChordTimeline.from_arrays([0, 4, 8], [3, 7, 11], [0, 1, -1]) + \
+        ChordTimeline.from_arrays([12, 16], [15, 19], [2, 3])
+    assert len(timeline) == 5 and timeline[-1][:2] == (16, 19)
+    assert np.array_equal(timeline[1: 4].starts, [4, 8, 12])
+    assert np.array_equal(timeline.between(7, 13).starts, [4, 8, 12])
+    assert np.array_equal(timeline.index_at([-1, 0, 11.5, 19.9, 20]), [-1, 0, 2, 4, -1])
@@ -0,0 +1,123 @@
+import io
+import os
+
+import numpy as np
+
+from chord_recognizer.util import (
+    MsfContainerReader, MsfContainerWriter, Sequence, TempoMap, read_msf_arrays, write_msf_arrays)
+from chord_recognizer.util.midiToolkit import (
+    LOAD_CHORD, ControlChange, Instrument, MidiFile, Note, PitchBend, TempoChange, TimeSignature, parser)
+from chord_recognizer.util.midiToolkit.reader import RawParseError
+from chord_recognizer.trdparty import MSF_pb2 as msf
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+FILES = [os.path.join(DATA, "107.mid"), os.path.join(DATA, "The Day We Find Love.mid")]
+
+
+def test_tempo_map_matches_dense_mapping():
+    for file in FILES:
+        midi = MidiFile(file)
+        expected = midi.get_tick_to_time_mapping()
+        seconds = midi.get_tempo_map().ticks_to_seconds(np.arange(len(expected)))
+        assert np.allclose(seconds, expected, rtol=0, atol=1e-9)
+
+
+def test_tempo_map_piecewise():
+    # 第一个速度变化不在 0 拍，之前使用默认速度 120
+    tempo_map = TempoMap([8, 4], [60, 240])
+    beats = np.array([[0, 2, 4], [6, 8, 10]])
+    expected = np.array([[0, 1, 2], [2.5, 3, 5]])
+    assert np.allclose(tempo_map.beats_to_seconds(beats), expected)
+    assert np.allclose(tempo_map.seconds_to_beats(expected), beats)
+
+
+def test_msf_codec_round_trip():
+    for file in FILES:
+        sequence = Sequence.from_midi(file)
+        data = sequence.to_msf_bytes()
+        assert data == sequence.to_msf().SerializeToString()
+        assert write_msf_arrays(*read_msf_arrays(data)) == data
+        # 数组解码与逐个 Note 的 protobuf 解码得到相同的 Sequence
+        expected = Sequence.from_msf(msf.Sequence.FromString(data)).to_msf_bytes()
+        assert Sequence.from_msf(data).to_msf_bytes() == expected
+
+
+def test_msf_container(tmp_path):
+    path = str(tmp_path / "corpus.msfc")
+    records = [Sequence.from_midi(file).to_msf_bytes() for file in FILES]
+    with MsfContainerWriter(path) as writer:
+        for k, data in enumerate(records):
+            writer.append(data, name=f"song_{k}")
+    with MsfContainerReader(path) as reader:
+        assert len(reader) == len(records) and reader.names == ["song_0", "song_1"]
+        assert [bytes(reader.get_bytes(k)) for k in range(len(reader))] == records
+        assert bytes(reader.get_bytes(reader.index("song_1"))) == records[1]
+        assert reader.get("song_1").to_msf_bytes() == Sequence.from_msf(records[1]).to_msf_bytes()
+    # 没有正常 close 的文件由长度前缀重建 index
+    with open(path, "rb") as f:
+        content = f.read()
+    with open(path, "wb") as f:
+        f.write(content[:int.from_bytes(content[-24: -16], "little")])
+    with MsfContainerReader(path) as reader:
+        assert [bytes(reader.get_bytes(k)) for k in range(len(reader))] == records
+        assert reader.names == ["", ""]
+
+
+def _dump(midi: MidiFile, segment=None) -> bytes:
+    f = io.BytesIO()
+    midi.dump(file=f, segment=segment, shift=False)
+    return f.getvalue()
+
+
+def test_midi_writer_matches_mido_path():
+    # 指定 segment 时使用逐个事件排序的 mido 实现，覆盖整首曲目时两者的输出应当逐字节相同
+    synthetic = MidiFile()
+    synthetic.time_signature_changes = [TimeSignature(3, 4, 0), TimeSignature(4, 4, 1440)]
+    synthetic.tempo_changes = [TempoChange(100, 0), TempoChange(90, 960)]
+    piano, drum = Instrument(0), Instrument(0, is_drum=True)
+    piano.notes = [Note(80, 60, 0, 480), Note(70, 64, 0, 480), Note(90, 60, 480, 960), Note(60, 67, 240, 2000)]
+    piano.control_changes = [ControlChange(64, 127, 0), ControlChange(64, 127, 100), ControlChange(7, 90, 480)]
+    piano.pitch_bends = [PitchBend(200, 480), PitchBend(-300, 480), PitchBend(0, 960)]
+    drum.notes = [Note(100, 36, 0, 120), Note(100, 42, 0, 120), Note(100, 36, 960, 1080)]
+    synthetic.instruments = [piano, drum]
+    synthetic.max_tick = 2000
+    for midi in [MidiFile(file) for file in FILES] + [synthetic]:
+        assert _dump(midi) == _dump(midi, (0, midi.max_tick + 1))
+
+
+def _state(value):
+    if isinstance(value, list):
+        return [_state(v) for v in value]
+    if hasattr(value, "__dict__"):
+        return {k: _state(v) for k, v in vars(value).items()}
+    return value
+
+
+def test_raw_scanner_matches_mido(monkeypatch):
+    expected = {}
+    for file in FILES:
+        state = _state(MidiFile(file))
+        chord_state = _state(MidiFile(file, load=LOAD_CHORD))
+        # 只加载和弦识别需要的事件时，note、速度与拍号与完整加载相同，其余事件为空
+        assert chord_state['tempo_changes'] == state['tempo_changes']
+        assert chord_state['time_signature_changes'] == state['time_signature_changes']
+        assert len(chord_state['instruments']) == len(state['instruments']) > 0
+        for chord_instrument, instrument in zip(chord_state['instruments'], state['instruments']):
+            assert chord_instrument['notes'] == instrument['notes']
+            assert chord_instrument['control_changes'] == chord_instrument['pitch_bends'] == []
+        expected[file] = state
+
+    def fail(*args, **kwargs):
+        raise RawParseError("disabled in the test")
+
+    monkeypatch.setattr(parser, "read_midi", fail)
+    for file in FILES:
+        assert _state(MidiFile(file)) == expected[file]
+
+
+def test_parallel_parse_matches_serial():
+    for file in FILES:
+        with open(file, "rb") as f:
+            data = f.read()
+        for load in (None, LOAD_CHORD):
+            assert _state(MidiFile(file=data, load=load, n_jobs=2)) == _state(MidiFile(file=data, load=load))